@@ -14,15 +14,19 @@ from cmyui import log, Ansi
 
 import packets
 from constants.gamemodes import GameMode
+from constants.mods import Mods
 from constants.privileges import Privileges
 from objects import glob
+from objects.beatmap import Beatmap
+from objects.beatmap import RankedStatus
 from utils.misc import get_press_times
 
 if TYPE_CHECKING:
     from objects.score import Score
 
 __all__ = ('donor_expiry', 'disconnect_ghosts',
-           'replay_detections', 'reroll_bot_status')
+           'replay_detections', 'reroll_bot_status',
+           'sweep_beatmap_cache', 'warm_caches')
 
 async def donor_expiry() -> list[Coroutine]:
     """Add new donation ranks & enqueue tasks to remove current ones."""
@@ -158,3 +162,121 @@ async def reroll_bot_status(interval: int) -> None:
     while True:
         await asyncio.sleep(interval)
         packets.botStats.cache_clear()
+
+async def sweep_beatmap_cache(interval: int) -> None:
+    """Remove expired maps from the beatmap caches, every `interval`."""
+    cache = glob.cache['beatmap']
+    unsubmitted = glob.cache['unsubmitted']
+
+    while True:
+        await asyncio.sleep(interval)
+
+        if (expired := cache.sweep()) and glob.app.debug:
+            log(f'Swept {expired} expired maps from the beatmap cache.', Ansi.LMAGENTA)
+
+        unsubmitted.sweep()
+
+        if glob.datadog:
+            glob.datadog.gauge('gulag.beatmap_cache_size', len(cache))
+            glob.datadog.gauge('gulag.beatmap_cache_hit_rate', cache.hit_rate)
+            glob.datadog.gauge('gulag.beatmap_cache_evictions', cache.evictions)
+            glob.datadog.gauge('gulag.beatmap_cache_expirations', cache.expirations)
+            glob.datadog.gauge('gulag.unsubmitted_cache_size', len(unsubmitted))
+            glob.datadog.gauge('gulag.leaderboard_cache_size', glob.leaderboards.size)
+            glob.datadog.gauge('gulag.leaderboard_cache_hit_rate', glob.leaderboards.hit_rate)
+            glob.datadog.gauge('gulag.leaderboard_response_hit_rate', glob.leaderboards.response_hit_rate)
+            glob.datadog.gauge('gulag.leaderboard_response_bytes_saved', glob.leaderboards.bytes_saved)
+
+async def check_top_scores(interval: int) -> None:
+    """Check online players' top scores against sql, every `interval`."""
+    while True:
+        await asyncio.sleep(interval)
+
+        checked = mismatched = 0
+
+        for p in list(glob.players):
+            for mode in list(p.top_scores):
+                if not await p.check_top_scores(mode):
+                    mismatched += 1
+
+                checked += 1
+
+        if mismatched:
+            log(f'Fixed {mismatched}/{checked} out of sync top scores.', Ansi.LYELLOW)
+
+        if glob.datadog:
+            glob.datadog.gauge('gulag.top_scores_checked', checked)
+
+async def warm_caches(count: int, concurrency: int,
+                      leaderboards: bool = False) -> None:
+    """Preload the `count` most played maps into the caches, after startup."""
+    # after a restart, the caches are all empty; without this, the
+    # first wave of reconnecting clients would all miss them at once.
+    started_at = time.time()
+
+    count = min(count, glob.cache['beatmap'].max_size)
+    res = await glob.db.fetchall(
+        'SELECT id, set_id, md5, '
+        'artist, title, version, creator, '
+        'last_update, total_length, max_combo, '
+        'status, frozen, plays, passes, '
+        'mode, bpm, cs, od, ar, hp, '
+        'diff '
+        'FROM maps ORDER BY plays DESC '
+        'LIMIT %s',
+        [count]
+    )
+
+    if not res:
+        return
+
+    log(f'Warming caches with the {len(res)} most played maps.', Ansi.LCYAN)
+
+    cache = glob.cache['beatmap']
+    maps = []
+
+    # add the maps least played first, since the
+    # cache evicts the least recently used maps.
+    for row in reversed(res):
+        if not (row['md5'] in cache and (m := cache.get(md5=row['md5']))):
+            cache.add(m := Beatmap(**row))
+
+        maps.append(m)
+
+    sema = asyncio.Semaphore(concurrency)
+    warmed = 0
+
+    async def warm_map(m: Beatmap) -> None:
+        nonlocal warmed
+
+        async with sema:
+            # the map's .osu file, difficulty attributes
+            # & its commonly requested nomod pp values.
+            # (oppai-ng is only needed for std & taiko).
+            mode_vn = m.mode.as_vanilla
+
+            try:
+                if (
+                    (glob.oppai_built or mode_vn == 3) and
+                    Mods.NOMOD not in m.pp_cache[mode_vn]
+                ):
+                    await m.cache_pp(Mods.NOMOD)
+
+                # the map's leaderboard (in its own mode) & rating.
+                if leaderboards and m.status >= RankedStatus.Ranked:
+                    await glob.leaderboards.get(m.md5, m.mode)
+                    await m.fetch_rating()
+            except Exception as exc:
+                # don't let one bad map stop the rest.
+                log(f'Failed to warm {m.full}: {exc!r}', Ansi.LRED)
+
+        warmed += 1
+
+        if warmed % max(1, len(res) // 10) == 0:
+            log(f'Warmed {warmed}/{len(res)} maps.', Ansi.LCYAN)
+
+    # most played first, so the hottest maps are ready soonest.
+    await asyncio.gather(*[warm_map(m) for m in reversed(maps)])
+
+    log(f'Warmed caches with {warmed} maps in '
+        f'{time.time() - started_at:.2f}s.', Ansi.LCYAN)
@@ -44,9 +44,12 @@ from objects.match import MatchTeamTypes
 from objects.match import MatchWinConditions
 from objects.match import SlotStatus
 from objects.player import Player
+from objects.rankings import Rankings
 from objects.score import SubmissionStatus
+from utils.misc import executemany
 from utils.misc import seconds_readable
 from utils.recalculator import PPCalculator
+from utils.recalculator import ScoreRecalculator
 
 if TYPE_CHECKING:
     from objects.channel import Channel
@@ -451,10 +454,10 @@ async def _map(ctx: Context) -> str:
             [bmap.set_id], _dict=False
         )]
 
-        for cached in glob.cache['beatmap'].values():
+        for cached in glob.cache['beatmap']:
             # not going to bother checking timeout
-            if cached['map'].set_id == bmap.set_id:
-                cached['map'].status = new_status
+            if cached.set_id == bmap.set_id:
+                cached.status = new_status
 
     else:
         # update only map
@@ -466,11 +469,8 @@ async def _map(ctx: Context) -> str:
 
         map_ids = [bmap.id]
 
-        for cached in glob.cache['beatmap'].values():
-            # not going to bother checking timeout
-            if cached['map'] is bmap:
-                cached['map'].status = new_status
-                break
+        if cached := glob.cache['beatmap'].get(md5=bmap.md5):
+            cached.status = new_status
 
     # deactivate rank requests for all ids
     for map_id in map_ids:
@@ -479,6 +479,11 @@ async def _map(ctx: Context) -> str:
             'WHERE map_id = %s', [map_id]
         )
 
+    # scores on the map(s) may now (not) be in
+    # players' top 100s; they'll be reloaded.
+    for p in glob.players:
+        p.top_scores.clear()
+
     return f'{bmap.embed} updated to {new_status!s}.'
 
 """ Mod commands
@@ -801,6 +806,7 @@ async def fakeusers(ctx: Context) -> str:
             fake = copy.copy(base_player)
             fake.id = i
             fake.name = name
+            fake.safe_name = fake.make_safe(name)
 
             # append userpresence packet
             data += struct.pack(
@@ -861,6 +867,42 @@ async def stealth(ctx: Context) -> str:
 
     return f'Stealth {"enabled" if ctx.player.stealth else "disabled"}.'
 
+_recalc_task: Optional[asyncio.Task] = None
+async def recalc_all(ctx: Context) -> None:
+    """Recalculate all scores, and update the server's state."""
+    global _recalc_task
+
+    try:
+        recalculator = ScoreRecalculator()
+        counts = await recalculator.run()
+
+        # player stats have been rebuilt in sql, reload
+        # the rankings, leaderboards & online players.
+        glob.rankings = await Rankings.prepare()
+        glob.leaderboards.clear()
+
+        for p in glob.players:
+            if p.bot_client:
+                continue
+
+            await p.stats_from_sql_full()
+            p.top_scores.clear()
+            glob.players.enqueue(packets.userStats(p))
+
+        recap = '{scores_vn} vn | {scores_rx} rx | {scores_ap} ap'.format(**counts)
+        msg = f'Recalculated {sum(counts.values())} ({recap}) scores.'
+
+        if num_failed := sum(recalculator.failed.values()):
+            msg += f' {num_failed} maps failed; !recalc all to retry them.'
+
+        ctx.recipient.send_bot(msg)
+    except Exception as exc:
+        # nothing awaits this task, so it must be reported here.
+        cmyui.log(f'Full recalc failed: {exc!r}', cmyui.Ansi.LRED)
+        ctx.recipient.send_bot(f'Full recalc failed: {exc!r}.')
+    finally:
+        _recalc_task = None
+
 @command(Privileges.Dangerous)
 async def recalc(ctx: Context) -> str:
     """Performs a full PP recalc on a specified map, or all maps."""
@@ -877,12 +919,15 @@ async def recalc(ctx: Context) -> str:
         if time.time() >= ctx.player.last_np['timeout']:
             return 'Please /np a map first!'
 
-        # TODO: mania support (and ctb later)
-        if (mode_vn := ctx.player.last_np['mode_vn']) not in (0, 1):
+        # TODO: ctb support
+        if (mode_vn := ctx.player.last_np['mode_vn']) not in (0, 1, 3):
             return 'PP not yet supported for that mode.'
 
         bmap = ctx.player.last_np['bmap']
 
+        if mode_vn == 3 and bmap.mode.as_vanilla != 3:
+            return 'Mania converts not yet supported.'
+
         ppcalc = await PPCalculator.from_id(
             map_id=bmap.id, mode_vn=mode_vn
         )
@@ -895,10 +940,10 @@ async def recalc(ctx: Context) -> str:
         for table in ('scores_vn', 'scores_rx', 'scores_ap'):
             # fetch all scores from the table on this map
             scores = await glob.db.fetchall(
-                'SELECT id, acc, mods, max_combo, '
-                'n300, n100, n50, nmiss, ngeki, nkatu '
+                'SELECT id, acc, mods, max_combo, nmiss, score '
                 f'FROM {table} WHERE map_md5 = %s '
-                'AND status = 2 AND mode = %s',
+                'AND status = 2 AND mode = %s '
+                'ORDER BY mods', # same mods together
                 [bmap.md5, mode_vn]
             )
 
@@ -907,27 +952,43 @@ async def recalc(ctx: Context) -> str:
             if not scores:
                 continue
 
-            for score in scores:
-                ppcalc.mods = Mods(score['mods'])
-                ppcalc.combo = score['max_combo']
-                ppcalc.nmiss = score['nmiss']
-                ppcalc.acc = score['acc']
+            results = await ppcalc.perform_many([{
+                'mods': Mods(score['mods']),
+                'combo': score['max_combo'],
+                'nmiss': score['nmiss'],
+                'acc': score['acc'],
+                'score': score['score']
+            } for score in scores])
+
+            await executemany(
+                f'UPDATE {table} '
+                'SET pp = %s '
+                'WHERE id = %s',
+                [(pp, score['id']) for (pp, _), score # sr not needed
+                 in zip(results, scores)]
+            )
 
-                pp, _ = await ppcalc.perform() # sr not needed
+        # the rx & ap leaderboards are sorted by pp, and
+        # players' top 100s may have changed; reload them.
+        glob.leaderboards.forget(bmap.md5)
 
-                await glob.db.execute(
-                    f'UPDATE {table} '
-                    'SET pp = %s '
-                    'WHERE id = %s',
-                    [pp, score['id']]
-                )
+        for p in glob.players:
+            p.top_scores.clear()
 
     else:
         # recalculate all scores on every map
         if not ctx.player.priv & Privileges.Dangerous:
             return 'This command is limited to developers.'
 
-        return 'TODO'
+        if not glob.oppai:
+            return 'A full recalc requires liboppai to be built.'
+
+        global _recalc_task
+        if _recalc_task and not _recalc_task.done():
+            return 'A full recalc is already running.'
+
+        _recalc_task = asyncio.create_task(recalc_all(ctx))
+        return 'Performing full recalc, this may take a while..'
 
     recap = '{0} vn | {1} rx | {2} ap'.format(*score_counts)
     return f'Recalculated {sum(score_counts)} ({recap}) scores.'
@@ -991,6 +1052,13 @@ async def wipemap(ctx: Context) -> str:
             [map_md5]
         )
 
+    glob.leaderboards.forget(map_md5)
+
+    # the scores may have been in players'
+    # top 100s; they'll be reloaded.
+    for p in glob.players:
+        p.top_scores.clear()
+
     return 'Scores wiped.'
 
 #@command(Privileges.Dangerous, aliases=['men'], hidden=True)
@@ -1026,6 +1094,18 @@ async def reload(ctx: Context) -> str:
     mod = importlib.reload(mod)
     return f'Reloaded {mod.__name__}'
 
+def pp_engine_info() -> str:
+    """Return info about the in-process pp engine's caches."""
+    if not glob.oppai:
+        return 'pp engine: not loaded (using oppai-ng binary)'
+
+    return (
+        f'pp engine: {len(glob.oppai.handles)} maps parsed | '
+        f'{len(glob.oppai.attrs)} difficulty attrs cached '
+        f'({glob.oppai.attrs_size // 1024}KB, '
+        f'{glob.oppai.hit_rate:.2%} hit rate)'
+    )
+
 @command(Privileges.Normal)
 async def server(ctx: Context) -> str:
     """Retrieve performance data about the server."""
@@ -1065,6 +1145,7 @@ async def server(ctx: Context) -> str:
         f'ram: {" / ".join(f"{v // 1024 ** 2}MB" for v in ram_values)}',
         f'production mode: {glob.config.production} | advanced mode: {glob.config.advanced}',
         f'mirror: {glob.config.mirror} | osu!api connection: {glob.config.osu_api_key != ""}',
+        pp_engine_info(),
         '',
         'requirements',
         '\n'.join([' | '.join([
@@ -1941,6 +2022,8 @@ async def clan_create(ctx: Context) -> str:
     if 'full_name' in ctx.player.__dict__:
         del ctx.player.full_name # wipe cached_property
 
+    glob.leaderboards.set_clan(ctx.player.id, clan)
+
     await glob.db.execute(
         'UPDATE users '
         'SET clan_id = %s, '
@@ -1989,6 +2072,9 @@ async def clan_disband(ctx: Context) -> str:
 
         m.clan = m.clan_priv = None
 
+    for p_id in clan.members:
+        glob.leaderboards.set_clan(p_id, None)
+
     await glob.db.execute(
         'UPDATE users '
         'SET clan_id = 0, '
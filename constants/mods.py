@@ -284,6 +284,9 @@ SCORE_INCREASE_MODS = (
 
 SPEED_CHANGING_MODS = Mods.DOUBLETIME | Mods.NIGHTCORE | Mods.HALFTIME
 
+# mods which change a map's difficulty attributes
+DIFFICULTY_MODS = Mods.EASY | Mods.HARDROCK | SPEED_CHANGING_MODS
+
 OSU_SPECIFIC_MODS = Mods.AUTOPILOT | Mods.SPUNOUT | Mods.TARGET
 # taiko & catch have no specific mods
 MANIA_SPECIFIC_MODS = Mods.MIRROR | Mods.RANDOM | Mods.FADEIN | KEY_MODS
@@ -7,7 +7,6 @@ from datetime import datetime as dt
 from datetime import timedelta as td
 from typing import Callable
 
-import bcrypt
 from cmyui import _isdecimal
 from cmyui import Ansi
 from cmyui import AnsiRGB
@@ -75,10 +74,9 @@ async def bancho_handler(conn: Connection) -> bytes:
     if 'osu-token' not in conn.headers:
         # login is a bit of a special case,
         # so we'll handle it separately.
-        async with glob.players._lock:
-            resp, token = await login(
-                conn.body, conn.headers['X-Real-IP']
-            )
+        resp, token = await login(
+            conn.body, conn.headers['X-Real-IP']
+        )
 
         conn.resp_headers['cho-token'] = token
         return resp
@@ -171,9 +169,16 @@ class ChangeAction(BanchoPacket, type=Packets.OSU_CHANGE_ACTION):
         p.status.mode = GameMode(self.mode)
         p.status.map_id = self.map_id
 
-        # broadcast it to all online players.
+        # broadcast it to all online players who have us within
+        # their presence filter; we always get our own stats.
+        data = packets.userStats(p)
+
         if not p.restricted:
-            glob.players.enqueue(packets.userStats(p))
+            for o in glob.players:
+                if o is p or o.wants_updates_from(p):
+                    o.enqueue(data)
+        else:
+            p.enqueue(data)
 
 @register
 class SendMessage(BanchoPacket, type=Packets.OSU_SEND_PUBLIC_MESSAGE):
@@ -321,13 +326,29 @@ RESTRICTED_MSG = (
     'greater than 3 months, you may appeal via the form on the site.'
 )
 
+def online_players_data(p: Player) -> bytes:
+    """Return the data for a logging in player about who's online."""
+    if glob.config.presence_bundle_login:
+        # send only the ids of the online players; the client
+        # will request their presences & stats as it needs them.
+        return packets.userPresenceBundle([
+            o.id for o in glob.players.unrestricted if o is not p
+        ])
+
+    return b''.join([
+        packets.userPresence(o) + packets.userStats(o)
+        for o in glob.players.unrestricted if o is not p
+    ])
+
 async def login(origin: bytes, ip: str) -> tuple[bytes, str]:
     """\
     Login has no specific packet, but happens when the osu!
     client sends a request without an 'osu-token' header.
 
     Some notes:
-      this must be called with glob.players._lock held.
+      logins are admitted through glob.logins, which runs logins
+      for different users concurrently, but only one at a time
+      for any given username (for the online check to be safe).
       we return a tuple of (response_bytes, user_token) on success.
 
     Request format:
@@ -401,304 +422,303 @@ async def login(origin: bytes, ip: str) -> tuple[bytes, str]:
     """ Parsing complete, now check the given data. """
 
     login_time = time.time()
+    safe_name = make_safe_name(username)
+
+    async with glob.logins.admit(safe_name):
+        user_info = await glob.db.fetch(
+            'SELECT id, name, priv, pw_bcrypt, '
+            'silence_end, clan_id, clan_priv, api_key '
+            'FROM users WHERE safe_name = %s',
+            [safe_name]
+        )
+
+        if not user_info:
+            # no account by this name exists.
+            return packets.userID(-1), 'no'
+
+        tourney_privs = int(Privileges.Normal | Privileges.Donator)
 
-    if not tourney_client:
-        # Check if the player is already online
         if (
-            (p := glob.players.get(name=username)) and
-            not p.tourney_client
+            tourney_client and
+            not user_info['priv'] & tourney_privs == tourney_privs
         ):
-            if (login_time - p.last_recv_time) > 10:
-                # if the current player obj online hasn't
-                # pinged the server in > 10 seconds, log
-                # them out and login the new user.
-                p.logout()
-            else:
-                # the user is currently online, send back failure.
-                data = packets.userID(-1) + \
-                       packets.notification('User already logged in.')
+            # trying to use tourney client with insufficient privileges.
+            return packets.userID(-1), 'no'
+
+        # get our bcrypt cache.
+        bcrypt_cache = glob.cache['bcrypt']
+        pw_bcrypt = user_info['pw_bcrypt'].encode()
+        user_info['pw_bcrypt'] = pw_bcrypt
+
+        # check credentials against db.
+        # algorithms like these are intentionally
+        # designed to be slow; we'll cache the
+        # results to speed up subsequent logins.
+        if pw_bcrypt in bcrypt_cache: # ~0.01 ms
+            if pw_md5 != bcrypt_cache[pw_bcrypt]:
+                return packets.userID(-1), 'no'
+        else: # ~200ms
+            if not await glob.hasher.checkpw(pw_md5, pw_bcrypt):
+                return packets.userID(-1), 'no'
+
+            bcrypt_cache[pw_bcrypt] = pw_md5
+
+        if not tourney_client:
+            # Check if the player is already online
+            if (
+                (p := glob.players.get(name=username)) and
+                not p.tourney_client
+            ):
+                if (login_time - p.last_recv_time) > 10:
+                    # if the current player obj online hasn't
+                    # pinged the server in > 10 seconds, log
+                    # them out and login the new user.
+                    p.logout()
+                else:
+                    # the user is currently online, send back failure.
+                    data = packets.userID(-1) + \
+                           packets.notification('User already logged in.')
+
+                    return data, 'no'
+
+        """ handle client hashes """
+
+        # insert new set/occurrence.
+        await glob.db.execute(
+            'INSERT INTO client_hashes '
+            'VALUES (%s, %s, %s, %s, %s, NOW(), 0) '
+            'ON DUPLICATE KEY UPDATE '
+            'occurrences = occurrences + 1, '
+            'latest_time = NOW() ',
+            [user_info['id'], *client_hashes]
+        )
 
-                return data, 'no'
+        # TODO: runningunderwine support
 
-    user_info = await glob.db.fetch(
-        'SELECT id, name, priv, pw_bcrypt, '
-        'silence_end, clan_id, clan_priv, api_key '
-        'FROM users WHERE safe_name = %s',
-        [make_safe_name(username)]
-    )
+        # find any other users from any of the same hwid values.
+        hwid_matches = await glob.db.fetchall(
+            'SELECT u.`name`, u.`priv`, h.`occurrences` '
+            'FROM `client_hashes` h '
+            'INNER JOIN `users` u ON h.`userid` = u.`id` '
+            'WHERE h.`userid` != %s AND (h.`adapters` = %s '
+            'OR h.`uninstall_id` = %s OR h.`disk_serial` = %s)',
+            [user_info['id'], *client_hashes[1:]]
+        )
 
-    if not user_info:
-        # no account by this name exists.
-        return packets.userID(-1), 'no'
+        if hwid_matches:
+            # we have other accounts with matching hashes
+
+            # NOTE: this is an area i've seen a lot of implementations rush
+            # through and poorly design; this section is CRITICAL for both
+            # keeping multiaccounting down, but perhaps more importantly in
+            # scenarios where multiple users are forced to use a single pc
+            # (lan meetups, at a friends place, shared computer, etc.).
+            # these scenarios are usually the ones where new players will
+            # get invited to your server.. first impressions are important
+            # and you don't want a ban and support ticket to be this users
+            # first experience. :P
+
+            # anyways yeah needless to say i'm gonna think about this one
+
+            if not user_info['priv'] & Privileges.Verified:
+                # this player is not verified yet, this is their first
+                # time connecting in-game and submitting their hwid set.
+                # we will not allow any banned matches; if there are any,
+                # then ask the user to contact staff and resolve manually.
+                if not all([x['priv'] & Privileges.Normal for x in hwid_matches]):
+                    return (packets.notification('Please contact staff directly '
+                                                 'to create an account.') +
+                            packets.userID(-1)), 'no'
 
-    tourney_privs = int(Privileges.Normal | Privileges.Donator)
+            else:
+                # player is verified
+                # TODO: discord webhook?
+                # TODO: staff hwid locking & bypass detections.
+                unique_players = set()
+                total_occurrences = 0
+                for match in hwid_matches:
+                    if match['name'] not in unique_players:
+                        unique_players.add(match['name'])
+                    total_occurrences += match['occurrences']
+
+                msg_content = (
+                    f'{username} logged in with HWID matches '
+                    f'from {len(unique_players)} other users. '
+                    f'({total_occurrences} total occurrences)'
+                )
 
-    if (
-        tourney_client and
-        not user_info['priv'] & tourney_privs == tourney_privs
-    ):
-        # trying to use tourney client with insufficient privileges.
-        return packets.userID(-1), 'no'
-
-    # get our bcrypt cache.
-    bcrypt_cache = glob.cache['bcrypt']
-    pw_bcrypt = user_info['pw_bcrypt'].encode()
-    user_info['pw_bcrypt'] = pw_bcrypt
-
-    # check credentials against db.
-    # algorithms like these are intentionally
-    # designed to be slow; we'll cache the
-    # results to speed up subsequent logins.
-    if pw_bcrypt in bcrypt_cache: # ~0.01 ms
-        if pw_md5 != bcrypt_cache[pw_bcrypt]:
-            return packets.userID(-1), 'no'
-    else: # ~200ms
-        if not bcrypt.checkpw(pw_md5, pw_bcrypt):
-            return packets.userID(-1), 'no'
+                if webhook_url := glob.config.webhooks['audit-log']:
+                    # TODO: make it look nicer lol.. very basic
+                    webhook = Webhook(url=webhook_url)
+                    webhook.content = msg_content
+                    await webhook.post(glob.http)
 
-        bcrypt_cache[pw_bcrypt] = pw_md5
+                log(msg_content, Ansi.LRED)
 
-    """ handle client hashes """
+        # get clan & clan rank if we're in a clan
+        if user_info['clan_id'] != 0:
+            clan = glob.clans.get(id=user_info.pop('clan_id'))
+            clan_priv = ClanPrivileges(user_info.pop('clan_priv'))
+        else:
+            del user_info['clan_id']
+            del user_info['clan_priv']
+            clan = clan_priv = None
+
+        extras = {
+            'utc_offset': utc_offset,
+            'osu_ver': osu_ver,
+            'pm_private': pm_private,
+            'login_time': login_time,
+            'clan': clan,
+            'clan_priv': clan_priv,
+            'tourney_client': tourney_client
+        }
+
+        p = Player(
+            **user_info, # {id, name, priv, pw_bcrypt,
+                         #  silence_end, api_key}
+            **extras     # {utc_offset, osu_ver, pm_private,
+                         #  login_time, clan, clan_priv}
+        )
 
-    # insert new set/occurrence.
-    await glob.db.execute(
-        'INSERT INTO client_hashes '
-        'VALUES (%s, %s, %s, %s, %s, NOW(), 0) '
-        'ON DUPLICATE KEY UPDATE '
-        'occurrences = occurrences + 1, '
-        'latest_time = NOW() ',
-        [user_info['id'], *client_hashes]
-    )
+        for mode in GameMode:
+            p.recent_scores[mode] = None # TODO: sql?
+            p.stats[mode] = None
+
+        data = bytearray(packets.protocolVersion(19))
+        data += packets.userID(p.id)
+
+        # *real* client privileges are sent with this packet,
+        # then the user's apparent privileges are sent in the
+        # userPresence packets to other players. we'll send
+        # supporter along with the user's privileges here,
+        # but not in userPresence (so that only donators
+        # show up with the yellow name in-game, but everyone
+        # gets osu!direct & other in-game perks).
+        data += packets.banchoPrivileges(
+            p.bancho_priv | ClientPrivileges.Supporter
+        )
 
-    # TODO: runningunderwine support
+        data += packets.notification('Welcome back to the gulag!\n'
+                                    f'Current build: v{glob.version}')
 
-    # find any other users from any of the same hwid values.
-    hwid_matches = await glob.db.fetchall(
-        'SELECT u.`name`, u.`priv`, h.`occurrences` '
-        'FROM `client_hashes` h '
-        'INNER JOIN `users` u ON h.`userid` = u.`id` '
-        'WHERE h.`userid` != %s AND (h.`adapters` = %s '
-        'OR h.`uninstall_id` = %s OR h.`disk_serial` = %s)',
-        [user_info['id'], *client_hashes[1:]]
-    )
+        # send all channel info.
+        for c in glob.channels:
+            if p.priv & c.read_priv != c.read_priv:
+                continue # no priv to read
 
-    if hwid_matches:
-        # we have other accounts with matching hashes
-
-        # NOTE: this is an area i've seen a lot of implementations rush
-        # through and poorly design; this section is CRITICAL for both
-        # keeping multiaccounting down, but perhaps more importantly in
-        # scenarios where multiple users are forced to use a single pc
-        # (lan meetups, at a friends place, shared computer, etc.).
-        # these scenarios are usually the ones where new players will
-        # get invited to your server.. first impressions are important
-        # and you don't want a ban and support ticket to be this users
-        # first experience. :P
-
-        # anyways yeah needless to say i'm gonna think about this one
-
-        if not user_info['priv'] & Privileges.Verified:
-            # this player is not verified yet, this is their first
-            # time connecting in-game and submitting their hwid set.
-            # we will not allow any banned matches; if there are any,
-            # then ask the user to contact staff and resolve manually.
-            if not all([x['priv'] & Privileges.Normal for x in hwid_matches]):
-                return (packets.notification('Please contact staff directly '
-                                             'to create an account.') +
-                        packets.userID(-1)), 'no'
+            # autojoinable channels
+            if c.auto_join and p.join_channel(c):
+                # NOTE: p.join_channel enqueues channelJoin, but
+                # if we don't send this back in this specific request,
+                # the client will attempt to join the channel again.
+                data += packets.channelJoin(c.name)
 
-        else:
-            # player is verified
-            # TODO: discord webhook?
-            # TODO: staff hwid locking & bypass detections.
-            unique_players = set()
-            total_occurrences = 0
-            for match in hwid_matches:
-                if match['name'] not in unique_players:
-                    unique_players.add(match['name'])
-                total_occurrences += match['occurrences']
-
-            msg_content = (
-                f'{username} logged in with HWID matches '
-                f'from {len(unique_players)} other users. '
-                f'({total_occurrences} total occurrences)'
-            )
+            data += packets.channelInfo(*c.basic_info)
 
-            if webhook_url := glob.config.webhooks['audit-log']:
-                # TODO: make it look nicer lol.. very basic
-                webhook = Webhook(url=webhook_url)
-                webhook.content = msg_content
-                await webhook.post(glob.http)
+        # tells osu! to reorder channels based on config.
+        data += packets.channelInfoEnd()
 
-            log(msg_content, Ansi.LRED)
+        # fetch some of the player's
+        # information from sql to be cached.
+        await p.state_from_sql()
 
-    # get clan & clan rank if we're in a clan
-    if user_info['clan_id'] != 0:
-        clan = glob.clans.get(id=user_info.pop('clan_id'))
-        clan_priv = ClanPrivileges(user_info.pop('clan_priv'))
-    else:
-        del user_info['clan_id']
-        del user_info['clan_priv']
-        clan = clan_priv = None
-
-    extras = {
-        'utc_offset': utc_offset,
-        'osu_ver': osu_ver,
-        'pm_private': pm_private,
-        'login_time': login_time,
-        'clan': clan,
-        'clan_priv': clan_priv,
-        'tourney_client': tourney_client
-    }
-
-    p = Player(
-        **user_info, # {id, name, priv, pw_bcrypt,
-                     #  silence_end, api_key}
-        **extras     # {utc_offset, osu_ver, pm_private,
-                     #  login_time, clan, clan_priv}
-    )
+        if glob.config.production:
+            # update their country data with
+            # the IP from the login request.
+            await p.fetch_geoloc(ip)
 
-    for mode in GameMode:
-        p.recent_scores[mode] = None # TODO: sql?
-        p.stats[mode] = None
-
-    data = bytearray(packets.protocolVersion(19))
-    data += packets.userID(p.id)
-
-    # *real* client privileges are sent with this packet,
-    # then the user's apparent privileges are sent in the
-    # userPresence packets to other players. we'll send
-    # supporter along with the user's privileges here,
-    # but not in userPresence (so that only donators
-    # show up with the yellow name in-game, but everyone
-    # gets osu!direct & other in-game perks).
-    data += packets.banchoPrivileges(
-        p.bancho_priv | ClientPrivileges.Supporter
-    )
+        data += packets.mainMenuIcon()
+        data += packets.friendsList(*p.friends)
+        data += packets.silenceEnd(p.remaining_silence)
 
-    data += packets.notification('Welcome back to the gulag!\n'
-                                f'Current build: v{glob.version}')
-
-    # send all channel info.
-    for c in glob.channels:
-        if p.priv & c.read_priv != c.read_priv:
-            continue # no priv to read
-
-        # autojoinable channels
-        if c.auto_join and p.join_channel(c):
-            # NOTE: p.join_channel enqueues channelJoin, but
-            # if we don't send this back in this specific request,
-            # the client will attempt to join the channel again.
-            data += packets.channelJoin(c.name)
-
-        data += packets.channelInfo(*c.basic_info)
-
-    # tells osu! to reorder channels based on config.
-    data += packets.channelInfoEnd()
-
-    # fetch some of the player's
-    # information from sql to be cached.
-    await p.achievements_from_sql()
-    await p.stats_from_sql_full()
-    await p.friends_from_sql()
-
-    if glob.config.production:
-        # update their country data with
-        # the IP from the login request.
-        await p.fetch_geoloc(ip)
-
-    data += packets.mainMenuIcon()
-    data += packets.friendsList(*p.friends)
-    data += packets.silenceEnd(p.remaining_silence)
-
-    # update our new player's stats, and broadcast them.
-    user_data = (
-        packets.userPresence(p) +
-        packets.userStats(p)
-    )
+        # update our new player's stats, and broadcast them.
+        user_data = (
+            packets.userPresence(p) +
+            packets.userStats(p)
+        )
+
+        data += user_data
 
-    data += user_data
+        # add `p` to the global player list, making them officially
+        # logged in; this must happen before the broadcast & snapshot
+        # of online players below (with no awaits between), so that
+        # logins running concurrently will always see each other.
+        # NOTE: anything enqueued to `p` so far is already in `data`.
+        p.clear_queue()
+        glob.players.append(p)
 
-    if not p.restricted:
-        # player is unrestricted, two way data
-        for o in glob.players:
-            # enqueue us to them
-            o.enqueue(user_data)
+        if not p.restricted:
+            # player is unrestricted, two way data
+            for o in glob.players:
+                # enqueue us to them
+                if o is not p:
+                    o.enqueue(user_data)
 
             # enqueue them to us.
-            if not o.restricted:
-                data += packets.userPresence(o)
-                data += packets.userStats(o)
-
-        # the player may have been sent mail while offline,
-        # enqueue any messages from their respective authors.
-        # (thanks osu for doing this by name rather than id very cool)
-        query = ('SELECT m.`msg`, m.`time`, m.`from_id`, '
-                '(SELECT name FROM users WHERE id = m.`from_id`) AS `from`, '
-                '(SELECT name FROM users WHERE id = m.`to_id`) AS `to` '
-                'FROM `mail` m WHERE m.`to_id` = %s AND m.`read` = 0')
-
-        for msg in await glob.db.fetchall(query, [p.id]):
-            msg_time = dt.fromtimestamp(msg['time'])
-            msg_ts = f'[{msg_time:%a %b %d @ %H:%M%p}] {msg["msg"]}'
+            data += online_players_data(p)
+
+            # the player may have been sent mail while offline,
+            # enqueue any messages from their respective authors.
+            # (thanks osu for doing this by name rather than id very cool)
+            query = ('SELECT m.`msg`, m.`time`, m.`from_id`, '
+                    '(SELECT name FROM users WHERE id = m.`from_id`) AS `from`, '
+                    '(SELECT name FROM users WHERE id = m.`to_id`) AS `to` '
+                    'FROM `mail` m WHERE m.`to_id` = %s AND m.`read` = 0')
+
+            for msg in await glob.db.fetchall(query, [p.id]):
+                msg_time = dt.fromtimestamp(msg['time'])
+                msg_ts = f'[{msg_time:%a %b %d @ %H:%M%p}] {msg["msg"]}'
+
+                data += packets.sendMessage(
+                    sender=msg['from'], msg=msg_ts,
+                    recipient=msg['to'], sender_id=msg['from_id']
+                )
 
-            data += packets.sendMessage(
-                sender=msg['from'], msg=msg_ts,
-                recipient=msg['to'], sender_id=msg['from_id']
-            )
+            if not p.priv & Privileges.Verified:
+                # this is the player's first login, verify their
+                # account & send info about the server/its usage.
+                await p.add_privs(Privileges.Verified)
+
+                if p.id == 3:
+                    # this is the first player registering on
+                    # the server, grant them full privileges.
+                    await p.add_privs(
+                        Privileges.Staff | Privileges.Nominator |
+                        Privileges.Whitelisted | Privileges.Tournament |
+                        Privileges.Donator | Privileges.Alumni
+                    )
 
-        if not p.priv & Privileges.Verified:
-            # this is the player's first login, verify their
-            # account & send info about the server/its usage.
-            await p.add_privs(Privileges.Verified)
-
-            if p.id == 3:
-                # this is the first player registering on
-                # the server, grant them full privileges.
-                await p.add_privs(
-                    Privileges.Staff | Privileges.Nominator |
-                    Privileges.Whitelisted | Privileges.Tournament |
-                    Privileges.Donator | Privileges.Alumni
+                data += packets.sendMessage(
+                    sender=glob.bot.name, msg=WELCOME_MSG,
+                    recipient=p.name, sender_id=glob.bot.id
                 )
 
+        else:
+            # player is restricted, one way data
+            data += online_players_data(p)
+
+            data += packets.accountRestricted()
             data += packets.sendMessage(
-                sender=glob.bot.name, msg=WELCOME_MSG,
-                recipient=p.name, sender_id=glob.bot.id
+                sender = glob.bot.name,
+                msg = RESTRICTED_MSG,
+                recipient = p.name,
+                sender_id = glob.bot.id
             )
 
-    else:
-        # player is restricted, one way data
-        for o in glob.players.unrestricted:
-            # enqueue them to us.
-            data += packets.userPresence(o)
-            data += packets.userStats(o)
-
-        data += packets.accountRestricted()
-        data += packets.sendMessage(
-            sender = glob.bot.name,
-            msg = RESTRICTED_MSG,
-            recipient = p.name,
-            sender_id = glob.bot.id
-        )
+        # TODO: some sort of admin panel for staff members?
 
-    # TODO: some sort of admin panel for staff members?
+        if glob.datadog:
+            if not p.restricted:
+                glob.datadog.increment('gulag.online_players')
 
-    # add `p` to the global player list,
-    # making them officially logged in.
-    glob.players.append(p)
+            time_taken = time.time() - login_time
+            glob.datadog.histogram('gulag.login_time', time_taken)
+            glob.datadog.histogram('gulag.login_size', len(data))
 
-    if glob.datadog:
-        if not p.restricted:
-            glob.datadog.increment('gulag.online_players')
-
-        time_taken = time.time() - login_time
-        glob.datadog.histogram('gulag.login_time', time_taken)
-
-    p._queue.clear() # TODO: this is pretty suboptimal
-
-    log(f'{p} logged in.', Ansi.LCYAN)
-    await p.update_latest_activity()
-    return bytes(data), p.token
+        log(f'{p} logged in.', Ansi.LCYAN)
+        await p.update_latest_activity()
+        return bytes(data), p.token
 
 @register
 class StartSpectating(BanchoPacket, type=Packets.OSU_START_SPECTATING):
@@ -1514,12 +1534,14 @@ class StatsRequest(BanchoPacket, type=Packets.OSU_USER_STATS_REQUEST):
     user_ids: osuTypes.i32_list
 
     async def handle(self, p: Player) -> None:
-        unrestrcted_ids = [p.id for p in glob.players.unrestricted]
-        is_online = lambda o: o in unrestrcted_ids and o != p.id
-
-        for online in filter(is_online, self.user_ids):
-            if t := glob.players.get(id=online):
-                p.enqueue(packets.userStats(t))
+        # the client requests these in batches as it needs
+        # them, send the whole batch back in a single write.
+        if data := b''.join([
+            packets.userStats(t) for pid in self.user_ids
+            if (t := glob.players.get(id=pid))
+            and not t.restricted and t is not p
+        ]):
+            p.enqueue(data)
 
 @register
 class MatchInvite(BanchoPacket, type=Packets.OSU_MATCH_INVITE):
@@ -1561,9 +1583,12 @@ class UserPresenceRequest(BanchoPacket, type=Packets.OSU_USER_PRESENCE_REQUEST):
     user_ids: osuTypes.i32_list
 
     async def handle(self, p: Player) -> None:
-        for pid in self.user_ids:
-            if t := glob.players.get(id=pid):
-                p.enqueue(packets.userPresence(t))
+        if data := b''.join([
+            packets.userPresence(t) for pid in self.user_ids
+            if (t := glob.players.get(id=pid))
+            and not t.restricted
+        ]):
+            p.enqueue(data)
 
 @register
 class UserPresenceRequestAll(BanchoPacket, type=Packets.OSU_USER_PRESENCE_REQUEST_ALL):
@@ -1571,12 +1596,13 @@ class UserPresenceRequestAll(BanchoPacket, type=Packets.OSU_USER_PRESENCE_REQUES
         # XXX: this only sends when the client can see > 256 players,
         # so this probably won't have much use for private servers.
 
-        # NOTE: i'm not exactly sure how bancho implements this and whether
-        # i'm supposed to filter the users presences to send back with the
-        # player's presence filter; i can add it in the future perhaps.
-        for t in glob.players.unrestricted:
-            if p is not t:
-                p.enqueue(packets.userPresence(t))
+        # NOTE: i'm not exactly sure how bancho implements this, but
+        # we'll only send the players within the presence filter.
+        if data := b''.join([
+            packets.userPresence(t) for t in glob.players.unrestricted
+            if t is not p and p.wants_updates_from(t)
+        ]):
+            p.enqueue(data)
 
 @register
 class ToggleBlockingDMs(BanchoPacket, type=Packets.OSU_TOGGLE_BLOCK_NON_FRIEND_DMS):
@@ -18,7 +18,6 @@ from typing import TYPE_CHECKING
 from urllib.parse import unquote
 from utils.recalculator import PPCalculator
 
-import bcrypt
 import orjson
 from cmyui import _isdecimal
 from cmyui import Ansi
@@ -37,12 +36,15 @@ from constants.mods import Mods
 from objects import glob
 from objects.beatmap import Beatmap
 from objects.beatmap import RankedStatus
+from objects.leaderboards import Leaderboard
+from objects.leaderboards import LeaderboardScore
 from objects.player import Privileges
 from objects.score import Score
 from objects.score import SubmissionStatus
 from utils.misc import escape_enum
 from utils.misc import point_of_interest
 from utils.misc import pymysql_encode
+from utils.oppai import GRID_MAX_FALLBACK
 
 if TYPE_CHECKING:
     from objects.player import Player
@@ -53,7 +55,6 @@ BASE_DOMAIN = glob.config.domain
 domain = Domain({f'osu.{BASE_DOMAIN}', 'osu.ppy.sh'})
 
 REPLAYS_PATH = Path.cwd() / '.data/osr'
-BEATMAPS_PATH = Path.cwd() / '.data/osu'
 SCREENSHOTS_PATH = Path.cwd() / '.data/ss'
 AVATARS_PATH = Path.cwd() / '.data/avatars'
 
@@ -481,11 +482,77 @@ async def osuSearchSetHandler(p: 'Player', conn: Connection) -> Optional[bytes]:
             '0|0|0|0|0').format(**bmapset).encode()
     # 0s are threadid, has_vid, has_story, filesize, filesize_novid
 
+class SubmissionStageTimer:
+    """Send the latency of each stage of a score submission to datadog."""
+    __slots__ = ('started_at', 'stage_started_at')
+
+    def __init__(self) -> None:
+        self.started_at = self.stage_started_at = time.time()
+
+    def done(self, stage: str) -> None:
+        """Record the time taken by `stage`, & start the next."""
+        now = time.time()
+
+        if glob.datadog:
+            glob.datadog.histogram(f'gulag.score_submit_{stage}_time',
+                                   now - self.stage_started_at)
+
+        self.stage_started_at = now
+
+    def finish(self) -> None:
+        """Record the time taken by the whole submission."""
+        if glob.datadog:
+            glob.datadog.histogram('gulag.score_submit_time',
+                                   time.time() - self.started_at)
+
+# work deferred until after score submission; these are
+# run in the background by `glob.deferred`'s workers.
+
+async def announce_n1(s: Score, prev_n1: Optional[LeaderboardScore]) -> None:
+    """Post a new #1 score to #announce, & notify its player."""
+    announce_chan = glob.channels['#announce']
+
+    if s.bmap.awards_pp:
+        performance = f'{s.pp:,.2f}pp'
+    else:
+        performance = f'{s.score:,} score'
+
+    # Announce the user's #1 score.
+    # TODO: truncate artist/title/version to fit on screen
+    ann = [f'\x01ACTION achieved #1 on {s.bmap.embed}',
+           f'with {s.acc:.2f}% for {performance}.']
+
+    if s.mods:
+        ann.insert(1, f'+{s.mods!r}')
+
+    # If there was previously a score on the map, add old #1.
+    if prev_n1 and s.player.id != prev_n1.userid:
+        pid, pname = prev_n1.userid, prev_n1.name
+        ann.append(f'(Previous #1: [https://{BASE_DOMAIN}/u/{pid} {pname}])')
+
+    s.player.enqueue(packets.notification(f'You achieved #1! ({performance})'))
+    announce_chan.send(' '.join(ann), sender=s.player, to_self=True)
+
+async def save_map_plays(bmap: Beatmap) -> None:
+    """Save a beatmap's play & pass counts to sql."""
+    await glob.db.execute(
+        'UPDATE maps SET plays = %s, '
+        'passes = %s WHERE md5 = %s',
+        [bmap.plays, bmap.passes, bmap.md5]
+    )
+
+async def post_webhook(url: str, content: str) -> None:
+    """Post `content` to a discord webhook."""
+    webhook = Webhook(url=url)
+    webhook.content = content
+    await webhook.post(glob.http)
+
 @domain.route('/web/osu-submit-modular-selector.php', methods=['POST'])
 @required_mpargs({'x', 'ft', 'score', 'fs', 'bmk', 'iv',
                   'c1', 'st', 'pass', 'osuver', 's'})
 async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
     mp_args = conn.multipart_args
+    stage_timer = SubmissionStageTimer()
 
     # Parse our score data into a score obj.
     s = await Score.from_submission(
@@ -493,6 +560,8 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
         osu_ver=mp_args['osuver'], pw_md5=mp_args['pass']
     )
 
+    stage_timer.done('parse') # decryption, map lookup & pp calc
+
     if not s:
         log('Failed to parse a score - invalid format.', Ansi.LRED)
         return b'error: no'
@@ -559,14 +628,12 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
         if s.pp > pp_cap:
             msg_content = (
                 f'{s.player} banned for submitting '
-                f'{s.pp:.2f}pp score on gm {s.mode!r}.',
+                f'{s.pp:.2f}pp score on gm {s.mode!r}.'
             )
 
             if webhook_url := glob.config.webhooks['audit-log']:
                 # TODO: make it look nicer lol.. very basic
-                webhook = Webhook(url=webhook_url)
-                webhook.content = msg_content
-                await webhook.post(glob.http)
+                await glob.deferred.defer(post_webhook, webhook_url, msg_content)
 
             log(msg_content, Ansi.LRED)
 
@@ -575,6 +642,8 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
                 reason = f'[{s.mode!r}] autoban @ {s.pp:.2f}'
             )
 
+    stage_timer.done('checks')
+
     """ Score submission checks completed; submit the score. """
 
     if glob.datadog:
@@ -585,40 +654,10 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
             glob.datadog.increment('gulag.submitted_scores_best')
 
         if s.rank == 1 and not s.player.restricted:
-            # this is the new #1, post the play to #announce.
-            announce_chan = glob.channels['#announce']
-
-            if s.bmap.awards_pp:
-                performance = f'{s.pp:,.2f}pp'
-            else:
-                performance = f'{s.score:,} score'
-
-            # Announce the user's #1 score.
-            # TODO: truncate artist/title/version to fit on screen
-            ann = [f'\x01ACTION achieved #1 on {s.bmap.embed}',
-                   f'with {s.acc:.2f}% for {performance}.']
-
-            if s.mods:
-                ann.insert(1, f'+{s.mods!r}')
-
-            scoring = 'pp' if s.mode >= GameMode.rx_std else 'score'
-
-            # If there was previously a score on the map, add old #1.
-            prev_n1 = await glob.db.fetch(
-                'SELECT u.id, name FROM users u '
-                f'INNER JOIN {table} s ON u.id = s.userid '
-                'WHERE s.map_md5 = %s AND s.mode = %s '
-                'AND s.status = 2 AND u.priv & 1 '
-                f'ORDER BY s.{scoring} DESC LIMIT 1',
-                [s.bmap.md5, s.mode.as_vanilla], _dict=False
-            )
-
-            if prev_n1 and s.player.id != prev_n1[0]:
-                pid, pname = prev_n1
-                ann.append(f'(Previous #1: [https://{BASE_DOMAIN}/u/{pid} {pname}])')
-
-            s.player.enqueue(packets.notification(f'You achieved #1! ({performance})'))
-            announce_chan.send(' '.join(ann), sender=s.player, to_self=True)
+            # this is the new #1; get the previous #1 before the
+            # leaderboard is updated, & announce it once we're done.
+            leaderboard = await glob.leaderboards.get(s.bmap.md5, s.mode)
+            await glob.deferred.defer(announce_n1, s, leaderboard.first)
 
         # Our score is our best score.
         # Update any preexisting personal best
@@ -643,6 +682,10 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
         ]
     )
 
+    if s.status == SubmissionStatus.BEST:
+        # update the map's leaderboard, if it's in memory.
+        glob.leaderboards.submit(s)
+
     if s.status != SubmissionStatus.FAILED:
         # All submitted plays should have a replay.
         # If not, they may be using a score submitter.
@@ -668,6 +711,10 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
             # TODO: if a play is sketchy.. 🤠
             #await glob.sketchy_queue.put(s)
 
+    # the score & replay are stored; everything
+    # from here on could be rebuilt from them.
+    stage_timer.done('store')
+
     """ Update the user's & beatmap's stats """
 
     # get the current stats, and take a
@@ -717,18 +764,20 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
 
     if not s.player.restricted:
         # update beatmap with new stats
-        await glob.db.execute(
-            'UPDATE maps SET plays = %s, '
-            'passes = %s WHERE md5 = %s',
-            [s.bmap.plays, s.bmap.passes, s.bmap.md5]
-        )
+        await glob.deferred.defer(save_map_plays, s.bmap)
 
     # Update the user.
     s.player.recent_scores[s.mode] = s
     if 'recent_score' in s.player.__dict__:
         del s.player.recent_score # wipe cached_property
 
-    await s.player.update_stats(s.mode)
+    if s.status == SubmissionStatus.BEST and s.bmap.awards_pp:
+        # our new best score may be in our top 100.
+        await s.player.update_stats(s.mode, best=s)
+    else:
+        await s.player.update_stats(s.mode)
+
+    stage_timer.done('stats')
 
     """ score submission charts """
 
@@ -836,6 +885,9 @@ async def osuSubmitModularSelector(conn: Connection) -> Optional[bytes]:
 
         ret = '\n'.join(charts).encode()
 
+    stage_timer.done('charts') # & achievements
+    stage_timer.finish()
+
     log(f'[{s.mode!r}] {s.player} submitted a score! '
         f'({s.status!r}, {s.pp:,.2f}pp / {stats.pp:,}pp)', Ansi.LGREEN)
     return ret
@@ -864,14 +916,14 @@ async def getReplay(p: 'Player', conn: Connection) -> Optional[bytes]:
 async def osuRate(p: 'Player', conn: Connection) -> Optional[bytes]:
     map_md5 = conn.args['c']
 
+    # check if we have the map in our cache;
+    # if not, the map probably doesn't exist.
+    cached = glob.cache['beatmap'].get(md5=map_md5)
+
     if 'v' not in conn.args:
-        # check if we have the map in our cache;
-        # if not, the map probably doesn't exist.
-        if map_md5 not in glob.cache['beatmap']:
+        if not cached:
             return b'no exist'
 
-        cached = glob.cache['beatmap'][map_md5]['map']
-
         # only allow rating on maps with a leaderboard.
         if cached.status < RankedStatus.Ranked:
             return b'not ranked'
@@ -892,20 +944,32 @@ async def osuRate(p: 'Player', conn: Connection) -> Optional[bytes]:
         if not (rating := conn.args['v']).isdecimal():
             return
 
+        if cached:
+            # make sure the map's ratings are in memory
+            # before adding ours, so it's counted once.
+            await cached.fetch_rating()
+
         await glob.db.execute(
             'INSERT INTO ratings '
             'VALUES (%s, %s, %s)',
             [p.id, map_md5, int(rating)]
         )
 
-    ratings = [x[0] for x in await glob.db.fetchall(
-        'SELECT rating FROM ratings '
-        'WHERE map_md5 = %s',
-        [map_md5], _dict=False
-    )]
+        if cached:
+            cached.add_rating(int(rating))
 
     # send back the average rating
-    avg = sum(ratings) / len(ratings)
+    if cached:
+        avg = await cached.fetch_rating()
+    else:
+        ratings = [x[0] for x in await glob.db.fetchall(
+            'SELECT rating FROM ratings '
+            'WHERE map_md5 = %s',
+            [map_md5], _dict=False
+        )]
+
+        avg = sum(ratings) / len(ratings)
+
     return f'alreadyvoted\n{avg}'.encode()
 
 @unique
@@ -917,6 +981,22 @@ class RankingType(IntEnum):
     Friends = 3
     Country = 4
 
+SCORE_FMT = ('{s.id}|{name}|{score}|{s.max_combo}|'
+             '{s.n50}|{s.n100}|{s.n300}|{s.nmiss}|{s.nkatu}|{s.ngeki}|'
+             '{s.perfect}|{s.mods}|{s.userid}|{rank}|{s.time}|{has_replay}')
+
+def _score_listing(leaderboard: Leaderboard, p: 'Player',
+                   filters: dict[str, Any]) -> tuple[int, bytes]:
+    """Return the number of scores & encoded top 50 visible to `p`."""
+    scores = leaderboard.top(50, p, **filters)
+
+    return len(scores), '\n'.join([
+        SCORE_FMT.format(
+            s = s, name = s.full_name, score = int(s.value),
+            has_replay = '1', rank = idx + 1
+        ) for idx, s in enumerate(scores)
+    ]).encode()
+
 @domain.route('/web/osu-osz2-getscores.php')
 @required_args({'s', 'vv', 'v', 'c', 'f', 'm',
                 'i', 'mods', 'h', 'a', 'us', 'ha'})
@@ -949,9 +1029,6 @@ async def getScores(p: 'Player', conn: Connection) -> Optional[bytes]:
         if not p.restricted:
             glob.players.enqueue(packets.userStats(p))
 
-    table = mode.sql_table
-    scoring = 'pp' if mode >= GameMode.rx_std else 'score'
-
     if not (bmap := Beatmap.from_md5_cache(map_md5)):
         # if not found in memory, get from sql.
         if not (bmap := await Beatmap.from_md5_sql(map_md5)):
@@ -1005,11 +1082,7 @@ async def getScores(p: 'Player', conn: Connection) -> Optional[bytes]:
                     return b'-1|false'
         else:
             # found in sql - add to cache
-            glob.cache['beatmap'][bmap.md5] = {
-                'timeout': (glob.config.map_cache_timeout +
-                            time.time()),
-                'map': bmap
-            }
+            glob.cache['beatmap'].add(bmap)
 
     # we have found a beatmap for the request.
     if glob.datadog:
@@ -1020,51 +1093,47 @@ async def getScores(p: 'Player', conn: Connection) -> Optional[bytes]:
         # approved, qualified, or loved maps.
         return f'{int(bmap.status)}|false'.encode()
 
-    # statuses: 0: failed, 1: passed but not top, 2: passed top
-    query = [
-        f"SELECT s.id, s.{scoring} AS _score, "
-        "s.max_combo, s.n50, s.n100, s.n300, "
-        "s.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, "
-        "UNIX_TIMESTAMP(s.play_time) time, u.id userid, "
-        "COALESCE(CONCAT('[', c.tag, '] ', u.name), u.name) AS name "
-        f"FROM {table} s "
-        "INNER JOIN users u ON u.id = s.userid "
-        "LEFT JOIN clans c ON c.id = u.clan_id "
-        "WHERE s.map_md5 = %s AND s.status = 2 "
-        "AND (u.priv & 1 OR u.id = %s) AND mode = %s"
-    ]
-
-    params = [map_md5, p.id, mode_vn]
+    # get the map's leaderboard, from memory if possible.
+    leaderboard = await glob.leaderboards.get(map_md5, mode)
 
+    filters = {}
     if rank_type == RankingType.Mods:
-        query.append('AND s.mods = %s')
-        params.append(mods)
+        filters['mods'] = mods
     elif rank_type == RankingType.Friends:
-        query.append('AND s.userid IN %s')
-        params.append(p.friends | {p.id})
+        filters['friends'] = True
     elif rank_type == RankingType.Country:
-        query.append('AND u.country = %s')
-        params.append(p.country[1]) # letters, not id
+        filters['country'] = p.country[1] # letters, not id
+
+    # the score listing is the same for everyone requesting the same
+    # filters, other than for friends, or for a restricted player with
+    # their own score on the map; all others can share a cached copy.
+    if 'friends' in filters or p.id in leaderboard.hidden:
+        num_scores, listing = _score_listing(leaderboard, p, filters)
+    elif cached := leaderboard.responses.get(filters_key := tuple(filters.items())):
+        num_scores, listing = cached
+        glob.leaderboards.response_hits += 1
+        glob.leaderboards.bytes_saved += len(listing)
 
-    query.append('ORDER BY _score DESC LIMIT 50')
+        if glob.datadog:
+            glob.datadog.increment('gulag.leaderboard_response_hits')
+            glob.datadog.increment('gulag.leaderboard_response_bytes_saved', len(listing))
+    else:
+        num_scores, listing = _score_listing(leaderboard, p, filters)
+        glob.leaderboards.cache_response(map_md5, mode, filters_key,
+                                         num_scores, listing)
+        glob.leaderboards.response_misses += 1
 
-    scores = await glob.db.fetchall(' '.join(query), params)
+        if glob.datadog:
+            glob.datadog.increment('gulag.leaderboard_response_misses')
 
     l: list[str] = []
 
     # ranked status, serv has osz2, bid, bsid, len(scores)
     l.append(f'{int(bmap.status)}|false|{bmap.id}|'
-             f'{bmap.set_id}|{len(scores) if scores else 0}')
+             f'{bmap.set_id}|{num_scores}')
 
-    # fetch beatmap rating from sql
-    rating = (await glob.db.fetch(
-        'SELECT AVG(rating) rating '
-        'FROM ratings '
-        'WHERE map_md5 = %s',
-        [bmap.md5]
-    ))['rating']
-
-    if rating is not None:
+    # fetch beatmap rating, from memory if possible
+    if (rating := await bmap.fetch_rating()) is not None:
         rating = f'{rating:.1f}'
     else:
         rating = '10.0'
@@ -1073,59 +1142,22 @@ async def getScores(p: 'Player', conn: Connection) -> Optional[bytes]:
     # maps that mods could set for incorrectly timed maps.
     l.append(f'0\n{bmap.full}\n{rating}') # offset, name, rating
 
-    if not scores:
+    if not num_scores:
         # simply return an empty set.
         return '\n'.join(l + ['', '']).encode()
 
-    p_best = await glob.db.fetch(
-        f'SELECT id, {scoring} AS _score, '
-        'max_combo, n50, n100, n300, '
-        'nmiss, nkatu, ngeki, perfect, mods, '
-        'UNIX_TIMESTAMP(play_time) time '
-        f'FROM {table} '
-        'WHERE map_md5 = %s AND mode = %s '
-        'AND userid = %s AND status = 2 '
-        'ORDER BY _score DESC LIMIT 1', [
-            map_md5, mode_vn, p.id
-        ]
-    )
-
-    score_fmt = ('{id}|{name}|{score}|{max_combo}|'
-                 '{n50}|{n100}|{n300}|{nmiss}|{nkatu}|{ngeki}|'
-                 '{perfect}|{mods}|{userid}|{rank}|{time}|{has_replay}')
-
-    if p_best:
-        # calculate the rank of the score.
-        p_best_rank = 1 + (await glob.db.fetch(
-            f'SELECT COUNT(*) AS count FROM {table} s '
-            'INNER JOIN users u ON u.id = s.userid '
-            'WHERE s.map_md5 = %s AND s.mode = %s '
-            'AND s.status = 2 AND u.priv & 1 '
-            f'AND s.{scoring} > %s', [
-                map_md5, mode_vn,
-                p_best['_score']
-            ]
-        ))['count']
-
+    if p_best := leaderboard.best_of(p.id):
         l.append(
-            score_fmt.format(
-                **p_best,
-                name = p.full_name, userid = p.id,
-                score = int(p_best['_score']),
-                has_replay = '1', rank = p_best_rank
+            SCORE_FMT.format(
+                s = p_best, name = p.full_name,
+                score = int(p_best.value), has_replay = '1',
+                rank = leaderboard.get_rank(p_best.value)
             )
         )
     else:
         l.append('')
 
-    l.extend([
-        score_fmt.format(
-            **s, score = int(s['_score']),
-            has_replay = '1', rank = idx + 1
-        ) for idx, s in enumerate(scores)
-    ])
-
-    return '\n'.join(l).encode()
+    return '\n'.join(l).encode() + b'\n' + listing
 
 @domain.route('/web/osu-comment.php', methods=['POST'])
 @required_mpargs({'u', 'p', 'b', 's',
@@ -1299,6 +1331,7 @@ async def checkUpdates(conn: Connection) -> Optional[bytes]:
 # GET /api/get_map_info: return information about a given beatmap.
 # GET /api/get_map_scores: return the best scores for a given beatmap & mode.
 # GET /api/get_score_info: return information about a given score.
+# GET /api/get_leaderboard: return the global pp rankings for a given mode.
 # GET /api/get_replay: return the file for a given replay (with or without headers).
 # GET /api/get_match: return information for a given multiplayer match.
 
@@ -1307,6 +1340,7 @@ async def checkUpdates(conn: Connection) -> Optional[bytes]:
 
 # [Normal]
 # GET /api/calculate_pp: calculate & return pp for a given beatmap.
+# GET /api/calculate_pp_grid: calculate & return pp for many scores on a given beatmap.
 # POST/PUT /api/set_avatar: Update the tokenholder's avatar to a given file.
 
 # TODO handlers
@@ -1765,6 +1799,57 @@ async def api_get_map_scores(conn: Connection) -> Optional[bytes]:
     res = await glob.db.fetchall(' '.join(query), params)
     return JSON(res)
 
+@domain.route('/api/get_leaderboard')
+async def api_get_leaderboard(conn: Connection) -> Optional[bytes]:
+    """Return the top n players in the global rankings of a given mode."""
+    if (mode_arg := conn.args.get('mode', None)) is not None:
+        if not (
+            mode_arg.isdecimal() and
+            0 <= (mode := int(mode_arg)) <= 7
+        ):
+            return (400, b'Invalid mode.')
+
+        mode = GameMode(mode)
+    else:
+        mode = GameMode.vn_std
+
+    if (limit_arg := conn.args.get('limit', None)) is not None:
+        if not (
+            limit_arg.isdecimal() and
+            0 < (limit := int(limit_arg)) <= 100
+        ):
+            return (400, b'Invalid limit.')
+    else:
+        limit = 50
+
+    if (offset_arg := conn.args.get('offset', None)) is not None:
+        if not offset_arg.isdecimal():
+            return (400, b'Invalid offset.')
+
+        offset = int(offset_arg)
+    else:
+        offset = 0
+
+    top = glob.rankings[mode].top(limit, offset)
+
+    if not top:
+        return JSON([])
+
+    # fetch the remaining user info from sql.
+    res = await glob.db.fetchall(
+        'SELECT id, name, country FROM users '
+        'WHERE id IN ({})'.format(', '.join(['%s'] * len(top))),
+        [user_id for user_id, _ in top]
+    )
+
+    users = {row['id']: row for row in res}
+
+    return JSON([
+        users[user_id] | {'pp': pp, 'rank': offset + i + 1}
+        for i, (user_id, pp) in enumerate(top)
+        if user_id in users
+    ])
+
 @domain.route('/api/get_score_info')
 async def api_get_score_info(conn: Connection) -> Optional[bytes]:
     """Return information about a given score."""
@@ -2030,6 +2115,107 @@ async def api_calculate_pp(conn: Connection, p: 'Player') -> Optional[bytes]:
         'sr': sr
     })
 
+# the limits of a single grid request; scores which can't be served
+# by the pp formula are limited further, see `GRID_MAX_FALLBACK`.
+PP_GRID_MAX_MODS = 16
+PP_GRID_MAX_SCORES = 10000
+
+@domain.route('/api/calculate_pp_grid')
+@requires_api_key
+async def api_calculate_pp_grid(conn: Connection, p: 'Player') -> Optional[bytes]:
+    """Calculate and return pp for a grid of scores on a given map."""
+    if not glob.oppai:
+        return (503, JSON({'status': 'Failed: liboppai not built'}))
+
+    if 'md5' in conn.args:
+        # get id from md5
+        res = await glob.db.fetch(
+            'SELECT id FROM maps '
+            'WHERE md5 = %s',
+            [conn.args['md5']]
+        )
+        if not res:
+            return JSON({'status': 'Failed: no map found'})
+
+        map_id = res['id']
+    elif 'id' in conn.args:
+        if not conn.args['id'].isdecimal():
+            return (400, JSON({'status': 'Failed: invalid map id'}))
+
+        map_id = int(conn.args['id'])
+    else:
+        return (400, JSON({'status': 'Failed: Must provide map md5 or id'}))
+
+    mode_vn = conn.args.get('mode_vn', '0')
+    if mode_vn not in ('0', '1'):
+        return (503, JSON({'status': 'Failed: unsupported mode'}))
+
+    # each axis of the grid is a comma-separated list.
+    grid_args = {}
+    valid_args = (
+        ('mods', int, '0'),
+        ('acc', float, '100'),
+        ('nmiss', int, '0'),
+        ('combo', int, '-1') # -1 for fc
+    )
+
+    for n, t, default in valid_args:
+        vals = conn.args.get(n, default).split(',')
+
+        if not all([_isdecimal(v, _float=t is float,
+                               _negative=n == 'combo') for v in vals]):
+            return (400, JSON({'status': f'Failed: invalid {n}'}))
+
+        grid_args[n] = [t(v) for v in vals]
+
+    if len(grid_args['mods']) > PP_GRID_MAX_MODS:
+        return (400, JSON({'status': 'Failed: too many mods'}))
+
+    grid_size = (len(grid_args['acc']) * len(grid_args['nmiss']) *
+                 len(grid_args['combo']))
+
+    if grid_size > PP_GRID_MAX_SCORES:
+        return (400, JSON({'status': 'Failed: grid too large'}))
+
+    # mods which the formula can't serve go through
+    # oppai for each score, which is far more costly.
+    num_fallback = grid_size * len([
+        mods for mods in grid_args['mods']
+        if not glob.oppai.formula_covers(int(mode_vn), mods)
+    ])
+
+    if num_fallback > GRID_MAX_FALLBACK:
+        return (400, JSON({'status': 'Failed: grid too large for mode/mods'}))
+
+    ppcalc = await PPCalculator.from_id(map_id, mode_vn=int(mode_vn))
+
+    if not ppcalc:
+        return JSON({'status': 'Failed: could not retrieve map'})
+
+    # the difficulty is only calculated once per mods,
+    # the rest of the grid is just the performance formula.
+    try:
+        results = await glob.oppai.calculate_grid(
+            ppcalc.file, ppcalc.mode_vn, grid_args['mods'],
+            grid_args['acc'], grid_args['nmiss'], grid_args['combo']
+        )
+    except ValueError:
+        # the formula was disabled (or the map
+        # is broken); too costly to serve.
+        return (400, JSON({'status': 'Failed: grid too large for mode/mods'}))
+
+    return JSON({
+        'status': 'Success',
+        'acc': grid_args['acc'],
+        'nmiss': grid_args['nmiss'],
+        'combo': grid_args['combo'],
+        'results': [{
+            'mods': mods,
+            'sr': sr,
+            'pp': pp_grid # [acc][nmiss][combo]
+        } for mods, (pp_grid, sr) in zip(grid_args['mods'], results)]
+    }, option=orjson.OPT_SERIALIZE_NUMPY)
+
 @domain.route('/api/set_avatar', methods=['POST', 'PUT'])
 @requires_api_key
 async def api_set_avatar(conn: Connection, p: 'Player') -> Optional[bytes]:
@@ -2100,24 +2286,8 @@ async def get_updated_beatmap(conn: Connection) -> Optional[bytes]:
     )):
         return (404, b'Map not found.')
 
-    path = BEATMAPS_PATH / f'{res["id"]}.osu'
-
-    if path.exists():
-        # map found on disk.
-        content = path.read_bytes()
-    else:
-        # we don't have map, get from osu!
-        url = f"https://old.ppy.sh/osu/{res['id']}"
-
-        async with glob.http.get(url) as resp:
-            if not resp or resp.status != 200:
-                log(f'Could not find map {path}!', Ansi.LRED)
-                return (404, b'Could not find map on osu! server.')
-
-            content = await resp.read()
-
-        # save it to disk for future
-        path.write_bytes(content)
+    if not (content := await glob.beatmap_files.get(res['id'], res['md5'])):
+        return (404, b'Could not find map on osu! server.')
 
     return content
 
@@ -2194,11 +2364,11 @@ async def register_account(conn: Connection) -> Optional[bytes]:
         # the client isn't just checking values,
         # they want to register the account now.
         # make the md5 & bcrypt the md5 for sql.
-        async with glob.players._lock:
-            pw_md5 = hashlib.md5(pw_txt.encode()).hexdigest().encode()
-            pw_bcrypt = bcrypt.hashpw(pw_md5, bcrypt.gensalt())
-            glob.cache['bcrypt'][pw_bcrypt] = pw_md5 # cache result for login
+        pw_md5 = hashlib.md5(pw_txt.encode()).hexdigest().encode()
+        pw_bcrypt = await glob.hasher.hashpw(pw_md5)
+        glob.cache['bcrypt'][pw_bcrypt] = pw_md5 # cache result for login
 
+        async with glob.players._lock:
             safe_name = name.lower().replace(' ', '_')
 
             # add to `users` table.
@@ -118,21 +118,98 @@ surveillance = {
     },
 }
 
+# the max amount of logins to process at once. logins for
+# a single username will always be processed one at a time;
+# after restarts, excess logins will wait their turn.
+max_concurrent_logins = 32
+
+# the max amount of bcrypt hashes to run at once; each
+# takes ~200ms of cpu time, so this shouldn't exceed the
+# amount of cores available. additional hashes will wait.
+bcrypt_workers = 2
+
+# the amount of workers for, and max size of the queue
+# of work deferred until after a score submission has been
+# responded to (#1 announcements, map plays & webhooks).
+# if the queue is full, submissions will do it themselves.
+deferred_workers = 4
+deferred_queue_size = 1024
+
+# the max amount of data (in bytes) which may be queued up to be
+# sent to a single player; if a client stops reading its data, or
+# can't keep up, its queue will be dropped & it will be reconnected.
+max_queue_size = 64 * 1024 * 1024 # 64mb
+
+# whether to send only the ids of online players on login, rather
+# than each of their presences & stats; the client will request
+# the ones it actually needs to display as it goes.
+presence_bundle_login = True
+
 # the max duration to
 # cache a beatmap for.
 # recommended: ~1 hour.
 map_cache_timeout = 3600
 
+# the max amount of beatmaps to cache; once full,
+# the least recently used maps will be evicted.
+map_cache_size = 16384
+
+# the max duration & amount of maps to remember as not
+# being on the osu!api (unsubmitted, or out of date),
+# before trying the osu!api for them again.
+unsubmitted_cache_timeout = 3600
+unsubmitted_cache_size = 16384
+
+# the max amount of scores to keep in memory across all
+# map leaderboards (roughly 100mb at the default); once
+# full, the least recently used leaderboards are evicted.
+# cached score listings count towards this by their size.
+leaderboard_cache_size = 250000
+
+# online players' top 100 scores are kept in memory for
+# calculating their pp; every `interval` seconds, these
+# will be checked (& fixed) against sql. 0 to disable.
+top_scores_check_interval = 1800
+
 # the max duration to cache
 # osu-checkupdates requests for.
 # recommended: ~1 hour.
 updates_cache_timeout = 3600
 
+# the amount of the most played maps to preload into the
+# caches (including their pp values) on startup, and how
+# many maps to load at once; this happens in the background.
+# set warmup_maps to 0 to disable.
+warmup_maps = 1000
+warmup_concurrency = 4
+
+# whether to also preload the leaderboards of those maps (in
+# their own mode); these count towards leaderboard_cache_size.
+warmup_leaderboards = False
+
+# the max amount of .osu files to download from osu! at
+# once, and the max total size of .osu files to keep in
+# memory (the most recently used ones) for quick access.
+max_concurrent_map_downloads = 8
+map_file_cache_size = 64 * 1024 * 1024 # 64mb
+
 # the pp values which should be cached & displayed when
 # a user requests the general pp values for a beatmap.
 pp_cached_accs = (90, 95, 98, 99, 100) # std & taiko
 pp_cached_scores = (8e5, 8.5e5, 9e5, 9.5e5, 10e5) # mania
 
+# the max amount of maps to keep parsed in memory
+# for pp calculation (only when liboppai is built).
+oppai_cached_maps = 256
+
+# the max amount of difficulty attributes (per map, mode
+# & difficulty changing mods) to keep in memory for std.
+oppai_cached_attrs = 16384
+
+# the amount of processes to use for mania pp calculation;
+# each keeps up to `oppai_cached_maps` maps parsed in memory.
+mania_workers = 2
+
 # https://datadoghq.com
 # support (stats tracking)
 datadog = {
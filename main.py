@@ -20,7 +20,9 @@ def _excepthook(type, value, traceback):
     sys._excepthook(type, value, traceback)
 sys.excepthook = _excepthook
 
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import aiohttp
@@ -34,13 +36,24 @@ import bg_loops
 from constants.privileges import Privileges
 from objects import glob
 from objects.achievement import Achievement
+from objects.collections import BeatmapCache
+from objects.collections import ExpiringSet
 from objects.collections import PlayerList
 from objects.collections import MatchList
 from objects.collections import ChannelList
 from objects.collections import ClanList
 from objects.collections import MapPoolList
+from objects.leaderboards import Leaderboards
 from objects.player import Player
+from objects.rankings import Rankings
+from utils import pp_worker
+from utils.admission import AdmissionQueue
+from utils.beatmap_files import BeatmapFileStore
+from utils.deferred import DeferredQueue
+from utils.hashing import HashingService
 from utils.misc import download_achievement_pngs
+from utils.oppai import LIBOPPAI_PATH
+from utils.oppai import OppaiEngine
 from utils.updater import Updater
 
 __all__ = ()
@@ -55,9 +68,23 @@ async def setup_collections() -> None:
     glob.players = PlayerList() # online players
     glob.matches = MatchList() # active multiplayer matches
 
+    glob.cache['beatmap'] = BeatmapCache( # recently used beatmaps
+        max_size = glob.config.map_cache_size,
+        timeout = glob.config.map_cache_timeout
+    )
+    glob.cache['unsubmitted'] = ExpiringSet( # maps not on the osu!api
+        max_size = glob.config.unsubmitted_cache_size,
+        timeout = glob.config.unsubmitted_cache_timeout
+    )
+
     glob.channels = await ChannelList.prepare() # active channels
     glob.clans = await ClanList.prepare() # active clans
     glob.pools = await MapPoolList.prepare() # active mappools
+    glob.rankings = await Rankings.prepare() # global pp rankings
+
+    glob.leaderboards = Leaderboards( # recently played map leaderboards
+        max_scores = glob.config.leaderboard_cache_size
+    )
 
     # create our bot & append it to the global player list.
     res = await glob.db.fetch('SELECT name FROM users WHERE id = 1')
@@ -99,6 +126,42 @@ async def before_serving() -> None:
     glob.db = cmyui.AsyncSQLPool()
     await glob.db.connect(glob.config.mysql)
 
+    # retrieve a pool of threads to use for bcrypt hashing.
+    glob.hasher = HashingService(glob.config.bcrypt_workers)
+
+    # admit logins concurrently, one at a time per username.
+    glob.logins = AdmissionQueue('login', glob.config.max_concurrent_logins)
+
+    # work deferred until after score submission (uses http & db).
+    glob.deferred = DeferredQueue(
+        name = 'score_deferred',
+        max_size = glob.config.deferred_queue_size,
+        num_workers = glob.config.deferred_workers
+    )
+    glob.deferred.start()
+
+    # store of .osu files, downloaded from osu! as needed (uses http).
+    glob.beatmap_files = BeatmapFileStore(
+        max_downloads = glob.config.max_concurrent_map_downloads,
+        max_cached_bytes = glob.config.map_file_cache_size
+    )
+
+    # load oppai-ng's library for in-process pp calculation;
+    # if it hasn't been built, we'll fall back to the binary.
+    glob.oppai = OppaiEngine.load(
+        max_maps = glob.config.oppai_cached_maps,
+        max_attrs = glob.config.oppai_cached_attrs
+    )
+
+    # retrieve a pool of processes to use for mania pp calculation.
+    glob.mania_pool = ProcessPoolExecutor(
+        max_workers = glob.config.mania_workers,
+        mp_context = multiprocessing.get_context('spawn'),
+        initializer = pp_worker.init,
+        initargs = (glob.config.oppai_cached_maps,
+                    glob.config.oppai_cached_attrs)
+    )
+
     # run the sql & submodule updater (uses http & db).
     updater = Updater(glob.version)
     await updater.run()
@@ -125,17 +188,47 @@ async def before_serving() -> None:
     # reroll the bot's random status every `interval` sec.
     new_coros.append(bg_loops.reroll_bot_status(interval=300))
 
+    # remove expired maps from the beatmap caches every `interval` sec.
+    new_coros.append(bg_loops.sweep_beatmap_cache(interval=60))
+
+    # check online players' top scores against sql every `interval` sec.
+    if glob.config.top_scores_check_interval:
+        new_coros.append(bg_loops.check_top_scores(
+            interval = glob.config.top_scores_check_interval
+        ))
+
+    # preload the most played maps into the caches, in the background.
+    if glob.config.warmup_maps:
+        new_coros.append(bg_loops.warm_caches(
+            count = glob.config.warmup_maps,
+            concurrency = glob.config.warmup_concurrency,
+            leaderboards = glob.config.warmup_leaderboards
+        ))
+
     for coro in new_coros:
         glob.app.add_pending_task(coro)
 
 async def after_serving() -> None:
     """Called after the server stops serving connections."""
+    if hasattr(glob, 'deferred'):
+        # finish any deferred work while we can.
+        await glob.deferred.shutdown(timeout=10)
+
     if hasattr(glob, 'http'):
         await glob.http.close()
 
     if hasattr(glob, 'db') and glob.db.pool is not None:
         await glob.db.close()
 
+    if hasattr(glob, 'hasher'):
+        glob.hasher.shutdown()
+
+    if getattr(glob, 'oppai', None):
+        glob.oppai.shutdown()
+
+    if hasattr(glob, 'mania_pool'):
+        glob.mania_pool.shutdown(wait=False)
+
     if hasattr(glob, 'datadog') and glob.datadog is not None:
         glob.datadog.stop() # stop thread
         glob.datadog.flush() # flush any leftover
@@ -182,7 +275,10 @@ if __name__ == '__main__':
         download_achievement_pngs(achievements_path)
 
     # make sure oppai-ng is built and ready.
-    glob.oppai_built = (Path.cwd() / 'oppai-ng/oppai').exists()
+    glob.oppai_built = any([
+        (Path.cwd() / 'oppai-ng/oppai').exists(),
+        (Path.cwd() / LIBOPPAI_PATH).exists()
+    ])
 
     if not glob.oppai_built:
         log('No oppai-ng compiled binary found. PP for all '
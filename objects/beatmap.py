@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 
-import time
 from collections import defaultdict
 from datetime import datetime
 from enum import IntEnum
 from enum import unique
+from typing import Optional
 
 from cmyui import Ansi
 from cmyui import log
@@ -14,12 +14,44 @@ from constants.mods import Mods
 from objects import glob
 from utils.misc import escape_enum
 from utils.misc import pymysql_encode
+from utils.batching import WriteBatcher
+from utils.misc import executemany
 from utils.recalculator import PPCalculator
+from utils.singleflight import SingleFlight
 
 __all__ = ('RankedStatus', 'Beatmap')
 
 BASE_DOMAIN = glob.config.domain
 
+# osu!api fetches currently in flight, keyed by ('md5', md5) or
+# ('set', set_id); many clients will often request a new map's
+# leaderboard at once, but only one fetch needs to be made.
+_osuapi_fetches = SingleFlight('osuapi_fetches')
+
+# NOTE: all values are params, so that
+# batches are sent as a multi-row statement.
+MAP_SAVE_QUERY = (
+    'REPLACE INTO maps ('
+        'server, md5, id, set_id, '
+        'artist, title, version, creator, '
+        'last_update, total_length, max_combo, '
+        'status, frozen, plays, passes, '
+        'mode, bpm, cs, od, ar, hp, diff'
+    ') VALUES ('
+        '%s, %s, %s, %s, '
+        '%s, %s, %s, %s, '
+        '%s, %s, %s, '
+        '%s, %s, %s, %s, '
+        '%s, %s, %s, %s, '
+        '%s, %s, %s'
+    ')'
+)
+
+# maps saved individually (from different requests)
+# around the same time are written together.
+_map_saves = WriteBatcher('map_saves', MAP_SAVE_QUERY,
+                          max_delay=0.05, max_size=100)
+
 # for some ungodly reason, different values are used to
 # represent different ranked statuses all throughout osu!
 # This drives me and probably everyone else pretty insane,
@@ -136,13 +168,17 @@ class Beatmap:
     pp_cache: dict[`Mods`, list[`float`]]
         Cached pp values to serve when a map is /np'ed.
         PP will be cached for whichever mod combination is requested.
+
+    num_ratings: Optional[`int`]
+        The amount of ratings the map has (with their sum in
+        `rating_sum`), or None if they've not yet been fetched.
     """
     __slots__ = ('md5', 'id', 'set_id',
                  'artist', 'title', 'version', 'creator',
                  'last_update', 'total_length', 'max_combo',
                  'status', 'frozen', 'plays', 'passes',
                  'mode', 'bpm', 'cs', 'od', 'ar', 'hp',
-                 'diff', 'pp_cache')
+                 'diff', 'pp_cache', 'num_ratings', 'rating_sum')
 
     def __init__(self, **kwargs):
         self.md5 = kwargs.get('md5', '')
@@ -174,6 +210,9 @@ class Beatmap:
         self.diff = kwargs.get('diff', 0.00)
         self.pp_cache = {0: {}, 1: {}, 2: {}, 3: {}} # {mode_vn: {mods: (acc/score: pp, ...), ...}}
 
+        self.num_ratings: Optional[int] = None
+        self.rating_sum = 0
+
     @property
     def filename(self) -> str:
         """The name of `self`'s .osu file."""
@@ -208,23 +247,14 @@ class Beatmap:
     @classmethod
     async def from_bid(cls, bid: int) -> 'Beatmap':
         """Create a `Beatmap` from sql using a beatmap id."""
-        # TODO: perhaps some better caching solution that allows
-        # for maps to be retrieved from the cache by id OR md5?
-
-        # O(n) cache hmmm
-        for cached in glob.cache['beatmap'].values():
-            if bid == cached['map'].id:
-                return cached['map']
+        # check if the map is in the cache.
+        if cached := glob.cache['beatmap'].get(id=bid):
+            return cached
 
         # try to get from sql.
         if (m := await cls.from_bid_sql(bid)):
             # add the map to our cache.
-            if m.md5 not in glob.cache['beatmap']:
-                glob.cache['beatmap'][m.md5] = {
-                    'timeout': time.time() + glob.config.map_cache_timeout,
-                    'map': m
-                }
-
+            glob.cache['beatmap'].add(m)
             return m
 
         # TODO: perhaps implement osuapi GET?
@@ -274,26 +304,13 @@ class Beatmap:
                 return
 
         # save our map to the cache.
-        glob.cache['beatmap'][md5] = {
-            'timeout': (glob.config.map_cache_timeout +
-                        time.time()),
-            'map': m
-        }
+        glob.cache['beatmap'].add(m)
         return m
 
     @staticmethod
     def from_md5_cache(md5: str):
         """Fetch & return a map object from cache by md5."""
-        if md5 in glob.cache['beatmap']:
-            # check if our cached result is within timeout.
-            cached = glob.cache['beatmap'][md5]
-
-            if (time.time() - cached['timeout']) <= 0:
-                # cache is within timeout.
-                return cached['map']
-
-            # cache is outdated and should be deleted.
-            del glob.cache['beatmap'][md5]
+        return glob.cache['beatmap'].get(md5=md5)
 
     @classmethod
     async def from_md5_sql(cls, md5: str):
@@ -313,6 +330,10 @@ class Beatmap:
     @classmethod
     async def from_md5_osuapi(cls, md5: str):
         """Fetch & return a map object from osu!api by md5."""
+        return await _osuapi_fetches.run(('md5', md5), cls._from_md5_osuapi, md5)
+
+    @classmethod
+    async def _from_md5_osuapi(cls, md5: str):
         url = 'https://old.ppy.sh/api/get_beatmaps'
         params = {'k': glob.config.osu_api_key, 'h': md5}
 
@@ -367,6 +388,10 @@ class Beatmap:
             # the map may have been updated by it's creator.
 
             if m.last_update > res['last_update']:
+                # the map's file (& any pp calculated
+                # from it) is out of date.
+                PPCalculator.invalidate(m.id)
+
                 if res['frozen'] and m.status != res['status']:
                     # Keep the ranked status of maps through updates,
                     # if we've specified to (by 'freezing' it).
@@ -390,6 +415,10 @@ class Beatmap:
     @classmethod
     async def cache_set(cls, set_id: int) -> None:
         """Cache (ram & sql) all maps from the osu!api."""
+        await _osuapi_fetches.run(('set', set_id), cls._cache_set, set_id)
+
+    @classmethod
+    async def _cache_set(cls, set_id: int) -> None:
         url = 'https://old.ppy.sh/api/get_beatmaps'
         params = {'k': glob.config.osu_api_key, 's': set_id}
 
@@ -412,6 +441,8 @@ class Beatmap:
         current_data = {r['id']: {k: r[k] for k in set(r) - {'id'}}
                         for r in res}
 
+        maps = []
+
         for bmap in apidata:
             if bmap['file_md5'] is None:
                 continue # ded
@@ -426,6 +457,10 @@ class Beatmap:
                 # is sending us a newer version of the map.
 
                 if bmap['last_update'] > current_data[map_id]['last_update']:
+                    # the map's file (& any pp calculated
+                    # from it) is out of date.
+                    PPCalculator.invalidate(map_id)
+
                     # the map we're receiving is indeed newer, check if the
                     # map's status is frozen in sql - if so, update the
                     # api's value before inserting it into the database.
@@ -483,14 +518,17 @@ class Beatmap:
 
             m.diff = float(bmap['difficultyrating'])
 
-            # save our map to the cache.
-            glob.cache['beatmap'][m.md5] = {
-                'timeout': (glob.config.map_cache_timeout +
-                            time.time()),
-                'map': m
-            }
+            maps.append(m)
 
-            await m.save_to_sql()
+        if not maps:
+            return
+
+        # save all of the maps to sql in a single statement,
+        # and only then to our cache, all at once.
+        await executemany(MAP_SAVE_QUERY, [m._sql_params() for m in maps])
+
+        for m in maps:
+            glob.cache['beatmap'].add(m)
 
             if glob.app.debug:
                 log(f'Retrieved {m.full} from the osu!api.', Ansi.LMAGENTA)
@@ -509,42 +547,55 @@ class Beatmap:
             return
 
         if mode_vn in (0, 1): # std/taiko, use acc
-            for idx, acc in enumerate(glob.config.pp_cached_accs):
-                ppcalc.pp_attrs['acc'] = acc
-
-                pp, _ = await ppcalc.perform() # don't need sr
-                self.pp_cache[mode_vn][mods][idx] = pp
+            attrs_list = [{'acc': acc} for acc in glob.config.pp_cached_accs]
         elif mode_vn == 2:
             return # unsupported gm
         elif mode_vn == 3: # mania, use score
-            for idx, score in enumerate(glob.config.pp_cached_scores):
-                ppcalc.pp_attrs['score'] = score
+            attrs_list = [{'score': score} for score in glob.config.pp_cached_scores]
+
+        results = await ppcalc.perform_many(attrs_list)
+
+        for idx, (pp, _) in enumerate(results): # don't need sr
+            self.pp_cache[mode_vn][mods][idx] = pp
 
-                pp, _ = await ppcalc.perform()
-                self.pp_cache[mode_vn][mods][idx] = pp
+    async def fetch_rating(self) -> Optional[float]:
+        """Fetch the map's average rating, from memory if possible."""
+        if self.num_ratings is None:
+            num_ratings, rating_sum = await glob.db.fetch(
+                'SELECT COUNT(*), SUM(rating) '
+                'FROM ratings WHERE map_md5 = %s',
+                [self.md5], _dict=False
+            )
+
+            # a rating may have been added while we were
+            # fetching; if so, those counts are up to date.
+            if self.num_ratings is None:
+                self.num_ratings = num_ratings
+                self.rating_sum = int(rating_sum or 0)
+
+        if self.num_ratings:
+            return self.rating_sum / self.num_ratings
+
+    def add_rating(self, rating: int) -> None:
+        """Count a new rating towards the map's average."""
+        # NOTE: ratings should be fetched before a new one
+        # is inserted to sql, or it could be counted twice.
+        if self.num_ratings is not None:
+            self.num_ratings += 1
+            self.rating_sum += rating
+
+    def _sql_params(self) -> list:
+        """The params of `self`, for `MAP_SAVE_QUERY`."""
+        return [
+            'osu!', self.md5, self.id, self.set_id,
+            self.artist, self.title, self.version, self.creator,
+            self.last_update, self.total_length, self.max_combo,
+            self.status, self.frozen, self.plays, self.passes,
+            self.mode, self.bpm, self.cs, self.od,
+            self.ar, self.hp, self.diff
+        ]
 
     async def save_to_sql(self) -> None:
         """Save the the object into sql."""
-        await glob.db.execute(
-            'REPLACE INTO maps ('
-                'server, md5, id, set_id, '
-                'artist, title, version, creator, '
-                'last_update, total_length, max_combo, '
-                'status, frozen, plays, passes, '
-                'mode, bpm, cs, od, ar, hp, diff'
-            ') VALUES ('
-                '"osu!", %s, %s, %s, '
-                '%s, %s, %s, %s, '
-                '%s, %s, %s, '
-                '%s, %s, %s, %s, '
-                '%s, %s, %s, %s, '
-                '%s, %s, %s'
-            ')', [
-                self.md5, self.id, self.set_id,
-                self.artist, self.title, self.version, self.creator,
-                self.last_update, self.total_length, self.max_combo,
-                self.status, self.frozen, self.plays, self.passes,
-                self.mode, self.bpm, self.cs, self.od,
-                self.ar, self.hp, self.diff
-            ]
-        )
+        # batched with any other maps being saved around the same time.
+        await _map_saves.write(self._sql_params())
@@ -53,6 +53,8 @@ class Clan:
         p.clan = self
         p.clan_priv = ClanPrivileges.Member
 
+        glob.leaderboards.set_clan(p.id, self)
+
     async def remove_member(self, p: 'Player') -> None:
         """Remove a given player from the clan's members."""
         self.members.remove(p.id)
@@ -94,6 +96,8 @@ class Clan:
         p.clan = None
         p.clan_priv = None
 
+        glob.leaderboards.set_clan(p.id, None)
+
     async def members_from_sql(self) -> None:
         """Fetch all members from sql."""
         # TODO: in the future, we'll want to add
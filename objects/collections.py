@@ -4,8 +4,11 @@
 # in a lot of these classes; needs refactor.
 
 import asyncio
+import time
+from collections import OrderedDict
 from typing import Any
 from typing import Optional
+from typing import Iterable
 from typing import Iterator
 from typing import Union
 
@@ -14,6 +17,7 @@ from cmyui import Ansi
 
 from constants.privileges import Privileges
 from objects import glob
+from objects.beatmap import Beatmap
 from objects.clan import Clan, ClanPrivileges
 from objects.channel import Channel
 from objects.match import Match, MapPool
@@ -25,7 +29,9 @@ __all__ = (
     'MatchList',
     'PlayerList',
     'MapPoolList',
-    'ClanList'
+    'ClanList',
+    'BeatmapCache',
+    'ExpiringSet'
 )
 
 # TODO: decorator for these collections which automatically
@@ -142,11 +148,25 @@ class MatchList(list):
 
 class PlayerList(list):
     """The currently active players on the server."""
-    __slots__ = ('_lock',)
+    __slots__ = ('_lock', '_tokens', '_ids', '_names')
 
     def __init__(self, *args, **kwargs):
         self._lock = asyncio.Lock()
-        super().__init__(*args, **kwargs)
+
+        # indexes of the players in the list by each of
+        # the attributes supported by get(); these must be
+        # kept in sync with the list through append/remove.
+        # a player's tourney clients share their id & name,
+        # so those keys hold each of their sessions, with
+        # the main session (if online) always first.
+        self._tokens: dict[str, Player] = {}
+        self._ids: dict[int, list[Player]] = {}
+        self._names: dict[str, list[Player]] = {}
+
+        super().__init__()
+
+        if args:
+            self.extend(*args)
 
     def __iter__(self) -> Iterator[Player]:
         return super().__iter__()
@@ -155,9 +175,9 @@ class PlayerList(list):
         # allow us to either pass in the player
         # obj, or the player name as a string.
         if isinstance(p, str):
-            return p in [player.name for player in self]
+            return make_safe_name(p) in self._names
         else:
-            return super().__contains__(p)
+            return any(_p is p for _p in self._ids.get(p.id, ()))
 
     def __repr__(self) -> str:
         return f'[{", ".join(map(repr, self))}]'
@@ -205,12 +225,20 @@ class PlayerList(list):
         """Get a player by token, id, or name from cache."""
         attr, val = self._parse_attr(kwargs)
 
-        for p in self:
-            if getattr(p, attr) == val:
-                return p
+        if attr == 'token':
+            return self._tokens.get(val)
+
+        index = self._ids if attr == 'id' else self._names
+
+        if sessions := index.get(val):
+            return sessions[0]
+
+    async def get_sql(self, full: bool = False,
+                      **kwargs) -> Optional[Player]:
+        """Get a player by token, id, or name from sql.
 
-    async def get_sql(self, **kwargs) -> Optional[Player]:
-        """Get a player by token, id, or name from sql."""
+           If `full` is set, also load their stats,
+           achievements & friends alongside them."""
         attr, val = self._parse_attr(kwargs)
 
         # try to get from sql.
@@ -233,7 +261,12 @@ class PlayerList(list):
         else:
             res['clan'] = res['clan_priv'] = None
 
-        return Player(**res, token='')
+        p = Player(**res, token='')
+
+        if full:
+            await p.state_from_sql()
+
+        return p
 
     async def get_ensure(self, **kwargs) -> Optional[Player]:
         """Try to get player from cache, or sql as fallback."""
@@ -264,17 +297,58 @@ class PlayerList(list):
             return
 
         super().append(p)
+        self._index(p)
 
         if glob.app.debug:
             log(f'{p} added to global player list.')
 
+    def extend(self, players: Iterable[Player] = ()) -> None:
+        """Extend the list with `players`."""
+        players = [p for p in players if p not in self]
+
+        super().extend(players)
+
+        for p in players:
+            self._index(p)
+
+        if glob.app.debug:
+            log(f'{len(players)} players added to global player list.')
+
     def remove(self, p: Player) -> None:
         """Remove `p` from the list."""
         super().remove(p)
 
+        # only drop the token if it still points to `p`,
+        # in case another player has since claimed it.
+        if self._tokens.get(p.token) is p:
+            del self._tokens[p.token]
+
+        # any other sessions of the player stay indexed.
+        for index, key in ((self._ids, p.id),
+                           (self._names, p.safe_name)):
+            if sessions := index.get(key):
+                sessions[:] = [_p for _p in sessions if _p is not p]
+
+                if not sessions:
+                    del index[key]
+
         if glob.app.debug:
             log(f'{p} removed from global player list.')
 
+    def _index(self, p: Player) -> None:
+        """Add `p` to the lookup indexes of the list."""
+        if p.token:
+            self._tokens[p.token] = p
+
+        for index, key in ((self._ids, p.id),
+                           (self._names, p.safe_name)):
+            sessions = index.setdefault(key, [])
+
+            if p.tourney_client:
+                sessions.append(p)
+            else:
+                sessions.insert(0, p)
+
 class MapPoolList(list):
     """The currently active mappools on the server."""
 
@@ -387,3 +461,171 @@ class ClanList(list):
             await clan.members_from_sql()
 
         return obj
+
+class BeatmapCache:
+    """\
+    The beatmaps recently used on the server, indexed by md5 & id.
+
+    The cache holds at most `max_size` maps, evicting the least recently
+    used map once full; maps also expire `timeout` seconds after being
+    added, and expired maps are removed by `sweep()` (periodically called
+    from a background loop), or when they're next looked up.
+    """
+    __slots__ = ('_maps', '_ids', 'max_size', 'timeout',
+                 'hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self, max_size: int, timeout: int) -> None:
+        # {md5: (expires_at, map)}, in order of least to most recently used.
+        self._maps: 'OrderedDict[str, tuple[float, Beatmap]]' = OrderedDict()
+        self._ids: dict[int, str] = {} # {id: md5}
+
+        self.max_size = max_size
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __iter__(self) -> Iterator[Beatmap]:
+        return iter([m for _, m in self._maps.values()])
+
+    def __len__(self) -> int:
+        return len(self._maps)
+
+    def __contains__(self, md5: str) -> bool:
+        return md5 in self._maps
+
+    def __repr__(self) -> str:
+        return f'<BeatmapCache ({len(self)}/{self.max_size})>'
+
+    def get(self, **kwargs) -> Optional[Beatmap]:
+        """Get a map by md5 or id from cache."""
+        if 'md5' in kwargs:
+            md5 = kwargs['md5']
+        elif 'id' in kwargs:
+            md5 = self._ids.get(kwargs['id'])
+        else:
+            raise ValueError('must provide valid kwarg (md5, id) to get()')
+
+        if not (cached := self._maps.get(md5)):
+            self.misses += 1
+            return
+
+        expires_at, m = cached
+
+        if time.time() >= expires_at:
+            # the map has expired, but hasn't been swept yet.
+            self._pop(md5)
+            self.expirations += 1
+            self.misses += 1
+            return
+
+        self._maps.move_to_end(md5)
+        self.hits += 1
+        return m
+
+    def add(self, m: Beatmap) -> None:
+        """Add `m` to the cache (or refresh it), evicting lru maps if full."""
+        if (
+            (old_md5 := self._ids.get(m.id)) and
+            old_md5 != m.md5
+        ):
+            # the map's been updated, drop the old version.
+            self._pop(old_md5)
+
+        self._maps[m.md5] = (time.time() + self.timeout, m)
+        self._maps.move_to_end(m.md5)
+        self._ids[m.id] = m.md5
+
+        while len(self._maps) > self.max_size:
+            self._pop(next(iter(self._maps)))
+            self.evictions += 1
+
+    def remove(self, m: Beatmap) -> None:
+        """Remove `m` from the cache, if it's present."""
+        if m.md5 in self._maps:
+            self._pop(m.md5)
+
+    def _pop(self, md5: str) -> None:
+        _, m = self._maps.pop(md5)
+
+        if self._ids.get(m.id) == md5:
+            del self._ids[m.id]
+
+    def sweep(self) -> int:
+        """Remove all expired maps from the cache; return the amount removed."""
+        ctime = time.time()
+
+        expired = [md5 for md5, (expires_at, _) in self._maps.items()
+                   if ctime >= expires_at]
+
+        for md5 in expired:
+            self._pop(md5)
+
+        self.expirations += len(expired)
+        return len(expired)
+
+    @property
+    def hit_rate(self) -> float:
+        """The hit rate of the cache's lookups."""
+        if not (total := self.hits + self.misses):
+            return 0.0
+
+        return self.hits / total
+
+class ExpiringSet:
+    """\
+    A bounded set of keys, each expiring `timeout` seconds after being added.
+
+    Once full, the oldest keys are evicted first; expired keys are
+    removed when they're next looked up, or by `sweep()`.
+    """
+    __slots__ = ('_keys', 'max_size', 'timeout')
+
+    def __init__(self, max_size: int, timeout: int) -> None:
+        # {key: expires_at}, in order of oldest to newest.
+        self._keys: 'OrderedDict[Any, float]' = OrderedDict()
+
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: Any) -> bool:
+        if (expires_at := self._keys.get(key)) is None:
+            return False
+
+        if time.time() >= expires_at:
+            del self._keys[key]
+            return False
+
+        return True
+
+    def __repr__(self) -> str:
+        return f'<ExpiringSet ({len(self)}/{self.max_size})>'
+
+    def add(self, key: Any) -> None:
+        """Add `key` to the set (or refresh it), evicting the oldest keys if full."""
+        self._keys[key] = time.time() + self.timeout
+        self._keys.move_to_end(key)
+
+        while len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+    def discard(self, key: Any) -> None:
+        """Remove `key` from the set, if it's present."""
+        self._keys.pop(key, None)
+
+    def sweep(self) -> int:
+        """Remove all expired keys from the set; return the amount removed."""
+        ctime = time.time()
+
+        # keys are in order of expiry, since the timeout is fixed.
+        expired = 0
+        while self._keys and ctime >= next(iter(self._keys.values())):
+            self._keys.popitem(last=False)
+            expired += 1
+
+        return expired
@@ -8,6 +8,7 @@ import config  # NOQA
 # this file contains no actualy definitions
 if __import__('typing').TYPE_CHECKING:
     from asyncio import Queue
+    from concurrent.futures import ProcessPoolExecutor
     from typing import Optional
 
     from aiohttp.client import ClientSession
@@ -22,19 +23,27 @@ if __import__('typing').TYPE_CHECKING:
     from objects.collections import MatchList
     from objects.collections import ClanList
     from objects.collections import MapPoolList
+    from objects.leaderboards import Leaderboards
     from objects.player import Player
+    from objects.rankings import Rankings
     from objects.score import Score
     from packets import BanchoPacket
     from packets import Packets
+    from utils.admission import AdmissionQueue
+    from utils.beatmap_files import BeatmapFileStore
+    from utils.deferred import DeferredQueue
+    from utils.hashing import HashingService
+    from utils.oppai import OppaiEngine
 
 __all__ = (
     # current server state
     'players', 'channels', 'matches',
     'pools', 'clans', 'achievements',
-    'version', 'bot', 'api_keys',
+    'rankings', 'leaderboards', 'version', 'bot', 'api_keys',
     'bancho_packets', 'db', 'http',
-    'datadog', 'sketchy_queue',
-    'oppai_built', 'cache'
+    'hasher', 'logins', 'deferred', 'datadog', 'sketchy_queue',
+    'oppai', 'oppai_built', 'mania_pool', 'beatmap_files',
+    'cache'
 )
 
 # server object
@@ -47,6 +56,8 @@ matches: 'MatchList'
 clans: 'ClanList'
 pools: 'MapPoolList'
 achievements: dict[int, list['Achievement']] # per vn gamemode
+rankings: 'Rankings' # global pp rankings per gamemode
+leaderboards: 'Leaderboards' # map leaderboards, loaded on demand
 
 bot: 'Player'
 version: 'Version'
@@ -62,12 +73,30 @@ db: 'AsyncSQLPool'
 http: 'ClientSession'
 datadog: 'Optional[ThreadStats]'
 
+# pool of threads for bcrypt hashing.
+hasher: 'HashingService'
+
+# queue for admitting logins; one at a time per username.
+logins: 'AdmissionQueue'
+
+# queue of work deferred until after score submission.
+deferred: 'DeferredQueue'
+
 # queue of submitted scores deemed 'sketchy'; to be analyzed.
 sketchy_queue: 'Queue[Score]'
 
-# whether or not the oppai-ng binary was located at startup.
+# whether or not oppai-ng was located at startup.
 oppai_built: bool
 
+# in-process pp calculation, if liboppai was built.
+oppai: 'Optional[OppaiEngine]'
+
+# pool of processes for mania pp calculation.
+mania_pool: 'ProcessPoolExecutor'
+
+# .osu files of beatmaps, on disk & in memory.
+beatmap_files: 'BeatmapFileStore'
+
 # gulag's main cache.
 # the idea here is simple - keep a copy of things either from sql or
 # that take a lot of time to produce in memory for quick and easy access.
@@ -87,8 +116,8 @@ cache = {
     },
     # cache all beatmap data calculated while online. this way,
     # the most requested maps will inevitably always end up cached.
-    'beatmap': {}, # {md5: {timeout, map}, ...}
+    'beatmap': None, # BeatmapCache, created on startup.
     # cache all beatmaps which we failed to get from the osuapi,
     # so that we do not have to perform this request multiple times.
-    'unsubmitted': set() # {md5, ...}
+    'unsubmitted': None # ExpiringSet of md5s, created on startup.
 }
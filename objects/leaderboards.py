@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+from collections import OrderedDict
+from typing import Hashable
+from typing import Optional
+from typing import TYPE_CHECKING
+
+from constants.gamemodes import GameMode
+from objects import glob
+from utils.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from objects.clan import Clan
+    from objects.player import Player
+    from objects.score import Score
+
+# the approximate memory used by a single score on a leaderboard; cached
+# listings are counted towards the leaderboards' size in units of these.
+SCORE_SIZE = 400
+
+# the max amount of cached listings per leaderboard (by filters).
+MAX_LISTINGS = 32
+
+__all__ = (
+    'LeaderboardScore',
+    'Leaderboard',
+    'Leaderboards'
+)
+
+class LeaderboardScore:
+    """\
+    A player's best score on a map, as shown on its leaderboard.
+
+    `value` is what the leaderboard is sorted by; the score's pp
+    on relax & autopilot leaderboards, otherwise its score.
+    """
+    __slots__ = ('id', 'value', 'score', 'pp', 'acc', 'max_combo',
+                 'n50', 'n100', 'n300', 'nmiss', 'nkatu', 'ngeki',
+                 'perfect', 'mods', 'time',
+                 'userid', 'name', 'clan', 'country')
+
+    def __init__(self, **kwargs) -> None:
+        for attr in self.__slots__:
+            setattr(self, attr, kwargs[attr])
+
+    @property
+    def full_name(self) -> str:
+        """The player's "full" name; including their clan tag."""
+        if self.clan:
+            return f'[{self.clan.tag}] {self.name}'
+        else:
+            return self.name
+
+class Leaderboard:
+    """\
+    The best scores of each player on a map, for a single gamemode.
+
+    Like the global rankings, unrestricted players' scores are stored
+    as (-value, id, score) in a sorted list, so ranks are a binary search,
+    and the top of the leaderboard is just the start of the list. Scores
+    of restricted players are kept aside, since only they can see them.
+
+    The encoded score listings served to clients are also cached here by
+    their filters (at most `MAX_LISTINGS`), and cleared whenever the
+    leaderboard changes.
+    """
+    __slots__ = ('scores', 'keys', 'hidden', 'responses', 'response_bytes')
+
+    def __init__(self) -> None:
+        self.scores: dict[int, LeaderboardScore] = {} # {userid: score}
+        self.keys: list[tuple[float, int, LeaderboardScore]] = []
+        self.hidden: dict[int, LeaderboardScore] = {} # {userid: score}
+
+        # {filters: (score count, encoded listing)}, oldest first.
+        self.responses: dict[Hashable, tuple[int, bytes]] = {}
+        self.response_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.scores) + len(self.hidden)
+
+    @property
+    def size(self) -> int:
+        """The size of the leaderboard (in scores), including cached listings."""
+        return len(self) + self.response_bytes // SCORE_SIZE
+
+    def cache_response(self, filters: Hashable,
+                       num_scores: int, listing: bytes) -> None:
+        """Cache the encoded listing for `filters`."""
+        if len(self.responses) >= MAX_LISTINGS:
+            # drop the oldest listing.
+            _, oldest = self.responses.pop(next(iter(self.responses)))
+            self.response_bytes -= len(oldest)
+
+        self.responses[filters] = (num_scores, listing)
+        self.response_bytes += len(listing)
+
+    def clear_responses(self) -> None:
+        """Drop all cached listings."""
+        self.responses.clear()
+        self.response_bytes = 0
+
+    def add(self, s: LeaderboardScore, restricted: bool) -> None:
+        """Set `s` as its player's best score on the leaderboard."""
+        self.remove(s.userid)
+
+        if restricted:
+            self.hidden[s.userid] = s
+        else:
+            self.scores[s.userid] = s
+            # NOTE: ids are unique, so scores are never compared.
+            bisect.insort(self.keys, (-s.value, s.id, s))
+            self.clear_responses()
+
+    def remove(self, user_id: int) -> Optional[LeaderboardScore]:
+        """Remove `user_id`'s score from the leaderboard, if present."""
+        if s := self.hidden.pop(user_id, None):
+            return s
+
+        if s := self.scores.pop(user_id, None):
+            del self.keys[bisect.bisect_left(self.keys, (-s.value, s.id))]
+            self.clear_responses()
+            return s
+
+    def set_restricted(self, user_id: int, restricted: bool) -> None:
+        """Show or hide `user_id`'s score, after their restriction changes."""
+        if s := self.remove(user_id):
+            self.add(s, restricted)
+
+    def best_of(self, user_id: int) -> Optional[LeaderboardScore]:
+        """Return `user_id`'s best score on the leaderboard, if any."""
+        return self.scores.get(user_id) or self.hidden.get(user_id)
+
+    def get_rank(self, value: float) -> int:
+        """Return the rank a score with `value` would hold."""
+        # ids are always positive, so (-value, 0) will be
+        # placed after any higher score, but before any
+        # other scores with the same value.
+        return bisect.bisect_left(self.keys, (-value, 0)) + 1
+
+    @property
+    def first(self) -> Optional[LeaderboardScore]:
+        """The #1 score on the leaderboard, if any."""
+        if self.keys:
+            return self.keys[0][2]
+
+    def top(self, n: int, p: 'Player', mods: Optional[int] = None,
+            friends: bool = False, country: Optional[str] = None
+            ) -> list[LeaderboardScore]:
+        """Return the top `n` scores visible to `p`, with optional filters."""
+        if friends:
+            # friend lists are small, so just sort their scores.
+            scores = [s for user_id in p.friends | {p.id}
+                      if (s := self.scores.get(user_id))]
+            scores.sort(key=lambda s: (-s.value, s.id))
+        else:
+            scores = [s for _, _, s in self.keys]
+
+        if mods is not None:
+            scores = [s for s in scores if s.mods == mods]
+        if country is not None:
+            scores = [s for s in scores if s.country == country]
+
+        # restricted players can still see their own score.
+        if (
+            (own := self.hidden.get(p.id)) and
+            (mods is None or own.mods == mods) and
+            (country is None or own.country == country)
+        ):
+            scores = sorted(scores[:n] + [own], key=lambda s: (-s.value, s.id))
+
+        return scores[:n]
+
+class Leaderboards:
+    """\
+    The leaderboards of recently played maps, kept in memory.
+
+    Leaderboards are keyed by (map md5, gamemode), loaded from sql when
+    first requested, and updated in place as scores are submitted and
+    players are (un)restricted; serving one on a hit needs no sql at all.
+
+    At most `max_scores` scores (with cached listings counted towards it
+    by their size) are kept across all leaderboards, with the least
+    recently used leaderboards being evicted first.
+    """
+    __slots__ = ('boards', 'size', 'max_scores',
+                 'loads', 'stale', 'hits', 'misses',
+                 'response_hits', 'response_misses', 'bytes_saved')
+
+    def __init__(self, max_scores: int) -> None:
+        # {(md5, mode): leaderboard}, in order of least to most recently used.
+        self.boards: 'OrderedDict[tuple[str, GameMode], Leaderboard]' = OrderedDict()
+        self.size = 0 # total size of all leaderboards
+        self.max_scores = max_scores
+
+        # leaderboards currently being loaded; if any of them change
+        # while loading, the result can't be cached, since it may not
+        # include the change.
+        self.loads = SingleFlight('leaderboard_loads')
+        self.stale: set[tuple[str, GameMode]] = set()
+
+        self.hits = 0
+        self.misses = 0
+
+        # stats of the boards' cached score listings.
+        self.response_hits = 0
+        self.response_misses = 0
+        self.bytes_saved = 0
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    async def get(self, map_md5: str, mode: GameMode) -> Leaderboard:
+        """Get the leaderboard of `map_md5` in `mode`, loading it if needed."""
+        key = (map_md5, mode)
+
+        if board := self.boards.get(key):
+            self.boards.move_to_end(key)
+            self.hits += 1
+            return board
+
+        self.misses += 1
+        return await self.loads.run(key, self._load, key)
+
+    async def _load(self, key: tuple[str, GameMode]) -> Leaderboard:
+        map_md5, mode = key
+        scoring = 'pp' if mode >= GameMode.rx_std else 'score'
+
+        board = Leaderboard()
+        clans = {c.id: c for c in glob.clans}
+
+        async for row in glob.db.iterall(
+            f'SELECT s.id, s.{scoring} AS value, s.score, s.pp, s.acc, '
+            's.max_combo, s.n50, s.n100, s.n300, '
+            's.nmiss, s.nkatu, s.ngeki, s.perfect, s.mods, '
+            'UNIX_TIMESTAMP(s.play_time) time, u.id userid, '
+            'u.name, u.clan_id, u.country, u.priv & 1 AS unrestricted '
+            f'FROM {mode.sql_table} s '
+            'INNER JOIN users u ON u.id = s.userid '
+            'WHERE s.map_md5 = %s AND s.status = 2 '
+            'AND s.mode = %s',
+            [map_md5, mode.as_vanilla]
+        ):
+            restricted = not row.pop('unrestricted')
+            row['clan'] = clans.get(row.pop('clan_id'))
+            s = LeaderboardScore(**row)
+
+            if s.userid in board.scores or s.userid in board.hidden:
+                continue # only one best score per player
+
+            # scores are fetched in no particular order,
+            # so we'll append & sort the keys afterwards.
+            if restricted:
+                board.hidden[s.userid] = s
+            else:
+                board.scores[s.userid] = s
+                board.keys.append((-s.value, s.id, s))
+
+        board.keys.sort()
+
+        if key in self.stale:
+            # changed while loading; serve it this once.
+            self.stale.remove(key)
+            return board
+
+        self.boards[key] = board
+        self.size += board.size
+        self._evict()
+
+        return board
+
+    def _evict(self) -> None:
+        # always keep the most recently used leaderboard.
+        while self.size > self.max_scores and len(self.boards) > 1:
+            _, board = self.boards.popitem(last=False)
+            self.size -= board.size
+
+    def _mark_stale(self, map_md5: Optional[str] = None,
+                    mode: Optional[GameMode] = None) -> None:
+        """Mark leaderboards being loaded as stale, optionally by md5/mode."""
+        for key in self.loads.calls:
+            if (
+                key not in self.boards and
+                map_md5 in (None, key[0]) and
+                mode in (None, key[1])
+            ):
+                self.stale.add(key)
+
+    def submit(self, s: 'Score') -> None:
+        """Set `s` as its player's best score, on its leaderboard."""
+        self._mark_stale(s.bmap.md5, s.mode)
+
+        if not (board := self.boards.get((s.bmap.md5, s.mode))):
+            return
+
+        self.size -= board.size
+        board.add(LeaderboardScore(
+            id = s.id,
+            value = s.pp if s.mode >= GameMode.rx_std else s.score,
+            score = s.score, pp = s.pp, acc = s.acc,
+            max_combo = s.max_combo, n50 = s.n50, n100 = s.n100,
+            n300 = s.n300, nmiss = s.nmiss, nkatu = s.nkatu,
+            ngeki = s.ngeki, perfect = int(s.perfect), mods = int(s.mods),
+            time = int(s.play_time.timestamp()), userid = s.player.id,
+            name = s.player.name, clan = s.player.clan,
+            country = s.player.country[1]
+        ), s.player.restricted)
+        self.size += board.size
+
+        self._evict()
+
+    def set_restricted(self, user_id: int, restricted: bool) -> None:
+        """Show or hide `user_id`'s scores, after their restriction changes."""
+        self._mark_stale()
+
+        for board in self.boards.values():
+            self.size -= board.size
+            board.set_restricted(user_id, restricted)
+            self.size += board.size
+
+    def set_clan(self, user_id: int, clan: Optional['Clan']) -> None:
+        """Update `user_id`'s clan (& so, name), after it changes."""
+        self._mark_stale()
+
+        for board in self.boards.values():
+            if s := board.best_of(user_id):
+                s.clan = clan # (their name in listings)
+                self.size -= board.size
+                board.clear_responses()
+                self.size += board.size
+
+    def forget(self, map_md5: str) -> None:
+        """Drop all leaderboards of `map_md5` (in all gamemodes)."""
+        self._mark_stale(map_md5)
+
+        for key in [key for key in self.boards if key[0] == map_md5]:
+            self.size -= self.boards.pop(key).size
+
+    def clear(self) -> None:
+        """Drop all leaderboards."""
+        self._mark_stale()
+
+        self.boards.clear()
+        self.size = 0
+
+    def cache_response(self, map_md5: str, mode: GameMode, filters: Hashable,
+                       num_scores: int, listing: bytes) -> None:
+        """Cache an encoded listing of a leaderboard, by its filters."""
+        # an empty listing means the filters (e.g. mods)
+        # match no scores; don't let clients fill the cache.
+        if not num_scores:
+            return
+
+        if not (board := self.boards.get((map_md5, mode))):
+            return # evicted, or never cached (stale)
+
+        self.size -= board.size
+        board.cache_response(filters, num_scores, listing)
+        self.size += board.size
+
+        self._evict()
+
+    @property
+    def hit_rate(self) -> float:
+        """The hit rate of the leaderboard cache."""
+        if not (total := self.hits + self.misses):
+            return 0.0
+
+        return self.hits / total
+
+    @property
+    def response_hit_rate(self) -> float:
+        """The hit rate of the leaderboards' cached score listings."""
+        if not (total := self.response_hits + self.response_misses):
+            return 0.0
+
+        return self.response_hits / total
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+import itertools
 import random
 import time
 import uuid
@@ -30,6 +32,7 @@ from objects.match import Match
 from objects.match import MatchTeams
 from objects.match import MatchTeamTypes
 from objects.match import SlotStatus
+from objects.rankings import TopScores
 from utils.misc import escape_enum
 from utils.misc import pymysql_encode
 
@@ -74,8 +77,21 @@ class Action(IntEnum):
     Multiplaying = 12
     OsuDirect    = 13
 
+# any change to a player's stats or status gives it a new
+# (globally unique) version, used to invalidate the cached
+# userStats & userPresence packets of the player.
+_state_versions = itertools.count()
+
+class _Versioned:
+    """Mixin which bumps `self.version` on any attribute change."""
+    version: int
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, 'version', next(_state_versions))
+
 @dataclass
-class ModeData:
+class ModeData(_Versioned):
     """A player's stats in a single gamemode."""
     tscore: int
     rscore: int
@@ -87,7 +103,7 @@ class ModeData:
     rank: int # global
 
 @dataclass
-class Status:
+class Status(_Versioned):
     """The current status of a player."""
     action: Action = Action.Idle
     info_text: str = ''
@@ -116,8 +132,10 @@ class Player:
     silence_end: `int`
         The UNIX timestamp the player's silence will end at.
 
-    pres_filter: `PresenceFilter`
+    pres_filter: `Optional[PresenceFilter]`
         The scope of users the client can currently see.
+        XXX: None until the client sends it; until then, it
+        receives updates from everyone.
 
     menu_options: `dict[int, dict[str, Any]]`
         The current osu! chat menu options available to the player.
@@ -129,25 +147,38 @@ class Player:
     tourney_client: `bool`
         Whether this is a management/spectator tourney client.
 
-    _queue: `bytearray`
-        Bytes enqueued to the player which will be transmitted
+    _queue: `list[bytes]`
+        Packets enqueued to the player which will be transmitted
         at the tail end of their next connection to the server.
         XXX: cls.enqueue() will add data to this queue, and
              cls.dequeue() will return the data, and remove it.
+        XXX: packets are often shared between many players, so
+             references are held & only joined upon dequeue.
+
+    _queue_size: `int`
+        The total size of the packets in the player's queue; if
+        this exceeds `glob.config.max_queue_size`, the queue will
+        be dropped, and the player reconnected on their next request.
+
+    _stats_packet & _presence_packet: `Optional[tuple[tuple, bytes]]`
+        The player's most recently built userStats & userPresence
+        packets, along with the state they were built from.
+        XXX: these are managed by packets.userStats/userPresence.
     """
     __slots__ = (
         'token', 'id', 'name', 'safe_name', 'pw_bcrypt',
         'priv', 'stats', 'status', 'friends', 'channels',
         'spectators', 'spectating', 'match', 'stealth',
         'clan', 'clan_priv', 'achievements',
-        'recent_scores', 'last_np', 'country', 'location',
+        'recent_scores', 'top_scores', 'last_np', 'country', 'location',
         'utc_offset', 'pm_private',
         'away_msg', 'silence_end', 'in_lobby', 'osu_ver',
         'pres_filter', 'login_time', 'last_recv_time',
         'menu_options',
 
         'bot_client', 'tourney_client',
-        'api_key', '_queue',
+        'api_key', '_queue', '_queue_size', '_queue_overflowed',
+        '_stats_packet', '_presence_packet',
         '__dict__'
     )
 
@@ -198,7 +229,7 @@ class Player:
         self.silence_end = extras.get('silence_end', 0)
         self.in_lobby = False
         self.osu_ver: Optional[datetime] = extras.get('osu_ver', None)
-        self.pres_filter = PresenceFilter.Nil
+        self.pres_filter: Optional[PresenceFilter] = None
 
         login_time = extras.get('login_time', 0.0)
         self.login_time = login_time
@@ -209,6 +240,9 @@ class Player:
         # store most recent score for each gamemode.
         self.recent_scores: dict[GameMode, Score] = {}
 
+        # top 100 scores for each gamemode, loaded when first needed.
+        self.top_scores: dict[GameMode, TopScores] = {}
+
         # store the last beatmap /np'ed by the user.
         self.last_np = {
             'bmap': None,
@@ -231,7 +265,13 @@ class Player:
         self.api_key = extras.get('api_key', None)
 
         # packet queue
-        self._queue = bytearray()
+        self._queue: list[bytes] = []
+        self._queue_size = 0
+        self._queue_overflowed = False
+
+        # cached userStats & userPresence packets
+        self._stats_packet: Optional[tuple[tuple, bytes]] = None
+        self._presence_packet: Optional[tuple[tuple, bytes]] = None
 
     def __repr__(self) -> str:
         return f'<{self.name} ({self.id})>'
@@ -308,6 +348,18 @@ class Player:
         """Return whether the player is restricted."""
         return not self.priv & Privileges.Normal
 
+    def wants_updates_from(self, p: 'Player') -> bool:
+        """Whether `p` is within the player's presence filter."""
+        if self.pres_filter is None:
+            # no filter sent yet, send everything.
+            return True
+        elif self.pres_filter == PresenceFilter.All:
+            return True
+        elif self.pres_filter == PresenceFilter.Friends:
+            return p.id in self.friends
+        else: # PresenceFilter.Nil
+            return False
+
     @property
     def gm_stats(self) -> ModeData:
         """The player's stats in their currently selected mode."""
@@ -342,12 +394,6 @@ class Player:
 
     def logout(self) -> None:
         """Log `self` out of the server."""
-        # invalidate the user's token.
-        self.token = ''
-
-        if 'online' in self.__dict__:
-            del self.online # wipe cached_property
-
         # leave multiplayer.
         if self.match:
             self.leave_match()
@@ -364,6 +410,13 @@ class Player:
         # enqueue logout to all users.
         glob.players.remove(self)
 
+        # invalidate the user's token; this must be done
+        # after removal, as the playerlist indexes by token.
+        self.token = ''
+
+        if 'online' in self.__dict__:
+            del self.online # wipe cached_property
+
         if not self.restricted:
             if glob.datadog:
                 glob.datadog.decrement('gulag.online_players')
@@ -384,6 +437,14 @@ class Player:
         if 'bancho_priv' in self.__dict__:
             del self.bancho_priv # wipe cached_property
 
+        # keep the global rankings & leaderboards in sync.
+        if self.priv & Privileges.Normal:
+            await glob.rankings.update_from_sql(self.id)
+        else:
+            glob.rankings.remove(self.id)
+
+        glob.leaderboards.set_restricted(self.id, not self.priv & Privileges.Normal)
+
     async def add_privs(self, bits: Privileges) -> None:
         """Update `self`'s privileges, adding `bits`."""
         self.priv |= bits
@@ -398,6 +459,11 @@ class Player:
         if 'bancho_priv' in self.__dict__:
             del self.bancho_priv # wipe cached_property
 
+        if bits & Privileges.Normal:
+            # unrestricted; add them back to the global rankings.
+            await glob.rankings.update_from_sql(self.id)
+            glob.leaderboards.set_restricted(self.id, False)
+
     async def remove_privs(self, bits: Privileges) -> None:
         """Update `self`'s privileges, removing `bits`."""
         self.priv &= ~bits
@@ -412,6 +478,11 @@ class Player:
         if 'bancho_priv' in self.__dict__:
             del self.bancho_priv # wipe cached_property
 
+        if bits & Privileges.Normal:
+            # restricted; remove them from the global rankings.
+            glob.rankings.remove(self.id)
+            glob.leaderboards.set_restricted(self.id, True)
+
     async def restrict(self, admin: 'Player', reason: str) -> None:
         """Restrict `self` for `reason`, and log to sql."""
         await self.remove_privs(Privileges.Normal)
@@ -794,40 +865,81 @@ class Player:
 
         self.achievements[a.mode].add(a)
 
-    async def update_stats(self, mode: GameMode = GameMode.vn_std) -> None:
-        """Update a player's stats in-game and in sql."""
-        table = mode.sql_table
-
+    async def top_scores_from_sql(self, mode: GameMode) -> TopScores:
+        """Retrieve `self`'s top 100 `mode` scores from sql."""
         res = await glob.db.fetchall(
-            f'SELECT s.pp, s.acc FROM {table} s '
+            f'SELECT s.id, s.map_md5, s.pp, s.acc FROM {mode.sql_table} s '
             'INNER JOIN maps m ON s.map_md5 = m.md5 '
             'WHERE s.userid = %s AND s.mode = %s '
             'AND s.status = 2 AND m.status IN (1, 2) '
-            'ORDER BY s.pp DESC LIMIT 100',
+            f'ORDER BY s.pp DESC LIMIT {TopScores.max_size}',
             [self.id, mode.as_vanilla]
         )
 
-        if not res:
-            breakpoint()
-            return # ?
+        top_scores = TopScores()
+
+        for row in res:
+            top_scores.add(row['id'], row['map_md5'], row['pp'], row['acc'])
+
+        # if we got a full 100, there may be more.
+        top_scores.complete = len(res) < TopScores.max_size
+        return top_scores
+
+    async def get_top_scores(self, mode: GameMode) -> TopScores:
+        """Get `self`'s top 100 `mode` scores, loading them if needed."""
+        if mode not in self.top_scores:
+            self.top_scores[mode] = await self.top_scores_from_sql(mode)
+
+        return self.top_scores[mode]
+
+    async def check_top_scores(self, mode: GameMode) -> bool:
+        """Check `self`'s top 100 `mode` scores against sql, fixing them if wrong."""
+        if (top_scores := self.top_scores.get(mode)) is None:
+            return True # not loaded
+
+        keys = top_scores.keys.copy()
+        sql_top_scores = await self.top_scores_from_sql(mode)
+
+        if (
+            self.top_scores.get(mode) is not top_scores or
+            top_scores.keys != keys
+        ):
+            # a score was submitted while we were checking.
+            return True
+
+        if (
+            {key[1] for key in keys} != {key[1] for key in sql_top_scores.keys} or
+            top_scores.weighted()[0] != sql_top_scores.weighted()[0]
+        ):
+            log(f"{self}'s {mode!r} top scores were out of sync "
+                f'({top_scores.weighted()[0]}pp vs. '
+                f'{sql_top_scores.weighted()[0]}pp in sql).', Ansi.LYELLOW)
+
+            if glob.datadog:
+                glob.datadog.increment('gulag.top_scores_mismatches')
+
+            self.top_scores[mode] = sql_top_scores
+            return False
+
+        return True
+
+    async def update_stats(self, mode: GameMode = GameMode.vn_std,
+                           best: Optional['Score'] = None) -> None:
+        """Update a player's stats in-game and in sql, with an optional new best score."""
+        top_scores = await self.get_top_scores(mode)
+
+        if best and not top_scores.add(best.id, best.bmap.md5, best.pp, best.acc):
+            # our old best on the map was in our top 100, but the new
+            # best isn't; we don't know what our 100th score is now.
+            top_scores = self.top_scores[mode] = await self.top_scores_from_sql(mode)
 
         stats = self.stats[mode]
 
         # increment playcount
         stats.plays += 1
 
-        # calculate avg acc based on top 100 scores
-        tot = div = 0
-        for i, row in enumerate(res):
-            add = int((0.95 ** i) * 100)
-            tot += row['acc'] * add
-            div += add
-
-        stats.acc = tot / div
-
-        # calculate weighted pp based on top 100 scores
-        stats.pp = round(sum([row['pp'] * 0.95 ** i
-                              for i, row in enumerate(res)]))
+        # calculate weighted pp & acc based on top 100 scores
+        stats.pp, stats.acc = top_scores.weighted()
 
         # keep stats up to date in sql
         await glob.db.execute(
@@ -837,16 +949,11 @@ class Player:
             [stats.pp, stats.acc, self.id]
         )
 
-        # calculate rank.
-        res = await glob.db.fetch(
-            'SELECT COUNT(*) AS c FROM stats s '
-            'INNER JOIN users u USING(id) '
-            f'WHERE s.pp_{mode:sql} > %s '
-            'AND u.priv & 1',
-            [stats.pp]
-        )
+        # update the global rankings & calculate rank.
+        if not self.restricted:
+            glob.rankings[mode].update(self.id, stats.pp)
 
-        stats.rank = res['c'] + 1
+        stats.rank = glob.rankings[mode].get_rank(stats.pp)
         self.enqueue(packets.userStats(self))
 
     async def friends_from_sql(self) -> None:
@@ -860,53 +967,54 @@ class Player:
 
     async def achievements_from_sql(self) -> None:
         """Retrieve `self`'s achievements from sql."""
-        for mode in range(4):
-            # get all users achievements for this mode
-            res = await glob.db.fetchall(
-                'SELECT ua.achid id FROM user_achievements ua '
-                'INNER JOIN achievements a ON a.id = ua.achid '
-                'WHERE ua.userid = %s AND a.mode = %s',
-                [self.id, mode]
-            )
+        res = await glob.db.fetchall(
+            'SELECT achid FROM user_achievements '
+            'WHERE userid = %s',
+            [self.id]
+        )
 
-            if not res:
-                # user has no achievements for this mode.
-                continue
+        if not res:
+            # user has no achievements.
+            return
 
-            # get cached achievements for this mode
-            achs = glob.achievements[mode]
+        # map the cached achievements by id.
+        achs = {a.id: a for mode_achs in glob.achievements.values()
+                        for a in mode_achs}
 
-            for row in res:
-                for ach in achs:
-                    if row['id'] == ach.id:
-                        self.achievements[mode].add(ach)
+        for row in res:
+            if ach := achs.get(row['achid']):
+                self.achievements[ach.mode].add(ach)
 
     async def stats_from_sql_full(self) -> None:
         """Retrieve `self`'s stats (all modes) from sql."""
-        for mode in GameMode:
-            # grab static stats from SQL.
-            res = await glob.db.fetch(
-                'SELECT tscore_{0:sql} tscore, rscore_{0:sql} rscore, '
-                'pp_{0:sql} pp, plays_{0:sql} plays, acc_{0:sql} acc, '
-                'playtime_{0:sql} playtime, maxcombo_{0:sql} max_combo '
-                'FROM stats WHERE id = %s'.format(mode),
-                [self.id]
-            )
-
-            if not res:
-                log(f"Failed to fetch {self}'s {mode!r} stats.", Ansi.LRED)
-                return
+        # grab static stats for all modes from SQL.
+        res = await glob.db.fetch(
+            'SELECT {} FROM stats WHERE id = %s'.format(', '.join([
+                'tscore_{0:sql}, rscore_{0:sql}, pp_{0:sql}, plays_{0:sql}, '
+                'acc_{0:sql}, playtime_{0:sql}, maxcombo_{0:sql}'.format(mode)
+                for mode in GameMode
+            ])),
+            [self.id]
+        )
 
-            # calculate rank.
-            res['rank'] = (await glob.db.fetch(
-                'SELECT COUNT(*) AS c FROM stats '
-                'INNER JOIN users USING(id) '
-                f'WHERE pp_{mode:sql} > %s '
-                'AND priv & 1', [res['pp']]
-            ))['c'] + 1
+        if not res:
+            log(f"Failed to fetch {self}'s stats.", Ansi.LRED)
+            return
 
+        for mode in GameMode:
             # update stats
-            self.stats[mode] = ModeData(**res)
+            pp = res[f'pp_{mode:sql}']
+
+            self.stats[mode] = ModeData(
+                tscore = res[f'tscore_{mode:sql}'],
+                rscore = res[f'rscore_{mode:sql}'],
+                pp = pp,
+                acc = res[f'acc_{mode:sql}'],
+                plays = res[f'plays_{mode:sql}'],
+                playtime = res[f'playtime_{mode:sql}'],
+                max_combo = res[f'maxcombo_{mode:sql}'],
+                rank = glob.rankings[mode].get_rank(pp)
+            )
 
     async def stats_from_sql(self, mode: GameMode) -> None:
         """Retrieve `self`'s `mode` stats from sql."""
@@ -923,16 +1031,18 @@ class Player:
             return
 
         # calculate rank.
-        res['rank'] = await glob.db.fetch(
-            'SELECT COUNT(*) AS c FROM stats '
-            'INNER JOIN users USING(id) '
-            f'WHERE pp_{mode:sql} > %s '
-            'AND priv & 1',
-            [res['pp']]
-        )['c']
+        res['rank'] = glob.rankings[mode].get_rank(res['pp'])
 
         self.stats[mode] = ModeData(**res)
 
+    async def state_from_sql(self) -> None:
+        """Retrieve `self`'s stats, achievements & friends from sql."""
+        await asyncio.gather(
+            self.stats_from_sql_full(),
+            self.achievements_from_sql(),
+            self.friends_from_sql()
+        )
+
     async def add_to_menu(
         self, coroutine: Coroutine,
         timeout: int = -1,
@@ -964,17 +1074,64 @@ class Player:
             [self.id]
         )
 
+    @property
+    def queue_size(self) -> int:
+        """The total size of the data in the player's queue."""
+        return self._queue_size
+
     def enqueue(self, b: bytes) -> None:
         """Add data to be sent to the client."""
-        self._queue += b
+        if self._queue_overflowed:
+            # the player will be reconnected, no
+            # use in storing anything more for them.
+            return
+
+        if b.__class__ is not bytes:
+            # we only hold references to the data,
+            # so we must ensure it cannot change.
+            b = bytes(b)
+
+        if self._queue_size + len(b) > glob.config.max_queue_size:
+            # the client isn't keeping up with (or has stopped
+            # reading) their data; drop their queue entirely &
+            # have them reconnect on their next request to
+            # resync their state, rather than buffering forever.
+            log(f"{self}'s packet queue overflowed.", Ansi.LYELLOW)
+            self.clear_queue()
+            self._queue_overflowed = True
+
+            if glob.datadog:
+                glob.datadog.increment('gulag.queue_overflows')
+
+            return
+
+        self._queue.append(b)
+        self._queue_size += len(b)
 
     def dequeue(self) -> Optional[bytes]:
         """Get data from the queue to send to the client."""
+        if self._queue_overflowed:
+            # their queue overflowed since their last request,
+            # log them out & tell their client to reconnect.
+            self._queue_overflowed = False
+            self.logout()
+
+            return (packets.notification('Reconnecting..') +
+                    packets.restartServer(0))
+
         if self._queue:
-            data = bytes(self._queue)
-            self._queue.clear()
+            if glob.datadog:
+                glob.datadog.histogram('gulag.queue_size', self._queue_size)
+
+            data = b''.join(self._queue)
+            self.clear_queue()
             return data
 
+    def clear_queue(self) -> None:
+        """Discard all data in the queue."""
+        self._queue.clear()
+        self._queue_size = 0
+
     def send(self, msg: str, sender: 'Player',
              chan: Optional[Channel] = None) -> None:
         """Enqueue `sender`'s `msg` to `self`. Sent in `chan`, or dm."""
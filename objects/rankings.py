@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+from typing import Sequence
+
+from constants.gamemodes import GameMode
+from objects import glob
+from utils.sortedlist import SortedList
+
+__all__ = (
+    'RankIndex',
+    'Rankings',
+    'TopScores',
+    'weighted_stats'
+)
+
+def weighted_stats(scores: Sequence[tuple[float, float]]) -> tuple[int, float]:
+    """Return the weighted (pp, acc) of a player's top 100 (pp, acc) scores."""
+    if not scores:
+        return (0, 0.0)
+
+    # pp is weighted by 0.95^n, while acc
+    # is weighted by int(0.95^n * 100).
+    pp = round(sum([pp * 0.95 ** i for i, (pp, _) in enumerate(scores)]))
+
+    tot = div = 0
+    for i, (_, acc) in enumerate(scores):
+        add = int((0.95 ** i) * 100)
+        tot += acc * add
+        div += add
+
+    return (pp, tot / div)
+
+class TopScores:
+    """\
+    A player's top 100 scores by pp in a single gamemode, used for
+    calculating their weighted pp & acc without querying sql.
+
+    Scores are stored as (-pp, id, acc, map_md5) in a sorted list, with
+    at most one score per map (their best); `complete` is whether the
+    player has no other scores which could take the place of one which
+    is replaced in the list.
+    """
+    __slots__ = ('keys', 'by_map', 'complete')
+    max_size = 100
+
+    def __init__(self) -> None:
+        self.keys: list[tuple[float, int, float, str]] = []
+        self.by_map: dict[str, tuple[float, int, float, str]] = {} # {md5: key}
+        self.complete = True
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, score_id: int, map_md5: str, pp: float, acc: float) -> bool:
+        """Set a score as the player's best on its map; False if a reload is needed."""
+        key = (-pp, score_id, acc, map_md5)
+
+        # NOTE: if the list isn't complete, it's full, and
+        # all other scores are lower than the lowest in it.
+        lowest = self.keys[-1] if self.keys else None
+
+        if old := self.by_map.pop(map_md5, None):
+            del self.keys[bisect.bisect_left(self.keys, old)]
+
+        if self.complete or key < lowest:
+            bisect.insort(self.keys, key)
+            self.by_map[map_md5] = key
+
+            if len(self.keys) > self.max_size:
+                # pushed out the lowest score.
+                del self.by_map[self.keys.pop()[3]]
+                self.complete = False
+        elif old:
+            # the new score isn't in the top 100, but we removed
+            # the old one; the player's 100th score is unknown.
+            return False
+
+        return True
+
+    def weighted(self) -> tuple[int, float]:
+        """Return the weighted (pp, acc) of the scores."""
+        return weighted_stats([(-pp, acc) for pp, _, acc, _ in self.keys])
+
+class RankIndex:
+    """\
+    An in-memory index of the global pp rankings for a single gamemode.
+
+    Players are stored as (-pp, id) in a (blocked) sorted list, so rank
+    & top-n lookups, as well as updates, are all O(log n), rather than
+    a scan of the stats table.
+
+    Players with 0pp don't affect anyone's rank, so they're left out.
+    """
+    __slots__ = ('pp', 'keys')
+
+    def __init__(self) -> None:
+        self.pp: dict[int, int] = {} # {id: pp}
+        self.keys = SortedList() # [(-pp, id), ...]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.pp
+
+    def update(self, user_id: int, pp: int) -> None:
+        """Set the pp of `user_id` in the index."""
+        if self.pp.get(user_id) == pp:
+            return
+
+        self.remove(user_id)
+
+        if pp > 0:
+            self.pp[user_id] = pp
+            self.keys.add((-pp, user_id))
+
+    def remove(self, user_id: int) -> None:
+        """Remove `user_id` from the index, if present."""
+        if (pp := self.pp.pop(user_id, None)) is not None:
+            self.keys.remove((-pp, user_id))
+
+    def get_rank(self, pp: int) -> int:
+        """Return the rank a player with `pp` would hold."""
+        # ids are always positive, so (-pp, 0) will be
+        # placed after anyone with more pp, but before
+        # anyone else with the same amount of pp.
+        return self.keys.bisect_left((-pp, 0)) + 1
+
+    def top(self, n: int, offset: int = 0) -> list[tuple[int, int]]:
+        """Return the top `n` (id, pp) pairs, starting from `offset`."""
+        return [(user_id, -pp) for pp, user_id
+                in self.keys[offset:offset + n]]
+
+class Rankings(dict):
+    """The global pp rankings of unrestricted players, per gamemode."""
+
+    def __getitem__(self, mode: GameMode) -> RankIndex:
+        return super().__getitem__(mode)
+
+    def remove(self, user_id: int) -> None:
+        """Remove `user_id` from the rankings of all modes."""
+        for index in self.values():
+            index.remove(user_id)
+
+    async def update_from_sql(self, user_id: int) -> None:
+        """Update the rankings of all modes for `user_id` from sql."""
+        res = await glob.db.fetch(
+            'SELECT {} FROM stats WHERE id = %s'.format(
+                ', '.join([f'pp_{mode:sql}' for mode in GameMode])
+            ), [user_id]
+        )
+
+        if not res:
+            return
+
+        for mode, index in self.items():
+            index.update(user_id, res[f'pp_{mode:sql}'])
+
+    @classmethod
+    async def prepare(cls) -> 'Rankings':
+        """Fetch data from sql & return; preparing to run the server."""
+        rankings = cls({mode: RankIndex() for mode in GameMode})
+        keys = {mode: [] for mode in GameMode}
+
+        async for row in glob.db.iterall(
+            'SELECT {} FROM stats '
+            'INNER JOIN users USING(id) '
+            'WHERE priv & 1'.format(', '.join(
+                ['id'] + [f'pp_{mode:sql}' for mode in GameMode]
+            ))
+        ):
+            for mode, index in rankings.items():
+                if (pp := row[f'pp_{mode:sql}']) > 0:
+                    # pp is fetched in no particular order, so we'll
+                    # sort each index's keys all at once afterwards.
+                    index.pp[row['id']] = pp
+                    keys[mode].append((-pp, row['id']))
+
+        for mode, index in rankings.items():
+            index.keys = SortedList(keys[mode])
+
+        return rankings
@@ -22,6 +22,7 @@ from utils.misc import escape_enum
 from utils.misc import pymysql_encode
 
 if TYPE_CHECKING:
+    from objects.leaderboards import LeaderboardScore
     from objects.player import Player
 
 __all__ = (
@@ -242,6 +243,36 @@ class Score:
 
         return s
 
+    @classmethod
+    async def from_leaderboard(cls, ls: 'LeaderboardScore', bmap: Beatmap,
+                               player: 'Player', mode: GameMode) -> 'Score':
+        """Create a score object from a score on `bmap`'s leaderboard."""
+        # NOTE: this has only the fields leaderboards need,
+        # (no grade, client flags or elapsed time) but it
+        # saves us fetching the full score from sql.
+        s = cls()
+
+        s.id = ls.id
+        s.bmap = bmap
+        s.player = player
+        s.mode = mode
+        (s.pp, s.score, s.max_combo, s.acc, s.n300,
+         s.n100, s.n50, s.nmiss, s.ngeki, s.nkatu) = (
+            ls.pp, ls.score, ls.max_combo, ls.acc, ls.n300,
+            ls.n100, ls.n50, ls.nmiss, ls.ngeki, ls.nkatu
+        )
+
+        # fix some types
+        s.passed = True
+        s.status = SubmissionStatus.BEST
+        s.perfect = ls.perfect == 1
+        s.mods = Mods(ls.mods)
+        s.play_time = datetime.fromtimestamp(ls.time)
+
+        s.rank = await s.calc_lb_placement()
+
+        return s
+
     @classmethod
     async def from_submission(cls, data_b64: str, iv_b64: str,
                               osu_ver: str, pw_md5: str) -> Optional['Score']:
@@ -318,25 +349,13 @@ class Score:
         return s
 
     async def calc_lb_placement(self) -> int:
-        table = self.mode.sql_table
-
         if self.mode >= GameMode.rx_std:
-            scoring = 'pp'
             score = self.pp
         else:
-            scoring = 'score'
             score = self.score
 
-        res = await glob.db.fetch(
-            f'SELECT COUNT(*) AS c FROM {table} s '
-            'INNER JOIN users u ON u.id = s.userid '
-            'WHERE s.map_md5 = %s AND s.mode = %s '
-            'AND s.status = 2 AND u.priv & 1 '
-            f'AND s.{scoring} > %s',
-            [self.bmap.md5, self.mode.as_vanilla, score]
-        )
-
-        return res['c'] + 1 if res else 1
+        leaderboard = await glob.leaderboards.get(self.bmap.md5, self.mode)
+        return leaderboard.get_rank(score)
 
     # could be staticmethod?
     # we'll see after some usage of gulag
@@ -382,26 +401,21 @@ class Score:
             self.status = SubmissionStatus.FAILED
             return
 
-        table = self.mode.sql_table
-
-        # find any other `status = 2` scores we have
-        # on the map. If there are any, store
-        res = await glob.db.fetch(
-            f'SELECT id, pp FROM {table} '
-            'WHERE userid = %s AND map_md5 = %s '
-            'AND mode = %s AND status = 2',
-            [self.player.id, self.bmap.md5, self.mode.as_vanilla]
-        )
+        # find any other `status = 2` scores we have on the map;
+        # the map's leaderboard holds each player's best score.
+        leaderboard = await glob.leaderboards.get(self.bmap.md5, self.mode)
 
-        if res:
+        if best := leaderboard.best_of(self.player.id):
             # we have a score on the map.
             # save it as our previous best score.
-            self.prev_best = await Score.from_sql(res['id'], table)
+            self.prev_best = await Score.from_leaderboard(
+                best, self.bmap, self.player, self.mode
+            )
 
             # if our new score is better, update
             # both of our score's submission statuses.
             # NOTE: this will be updated in sql later on in submission
-            if self.pp > res['pp']:
+            if self.pp > best.pp:
                 self.status = SubmissionStatus.BEST
                 self.prev_best.status = SubmissionStatus.SUBMITTED
             else:
@@ -158,11 +158,33 @@ class Packets(IntEnum):
     def __repr__(self) -> str:
         return f'<{self.name} ({self.value})>'
 
+# precompiled layouts for osu!'s fixed-size datatypes.
+_fixed_types = {
+    osuTypes.i8: 'b', osuTypes.u8: 'B',
+    osuTypes.i16: 'h', osuTypes.u16: 'H',
+    osuTypes.i32: 'i', osuTypes.u32: 'I', osuTypes.f32: 'f',
+    osuTypes.i64: 'q', osuTypes.u64: 'Q', osuTypes.f64: 'd'
+}
+
+_header = struct.Struct('<HxI')
+_i8 = struct.Struct('<b')
+_u8 = struct.Struct('<B')
+_i16 = struct.Struct('<h')
+_u16 = struct.Struct('<H')
+_i32 = struct.Struct('<i')
+_u32 = struct.Struct('<I')
+_i64 = struct.Struct('<q')
+_u64 = struct.Struct('<Q')
+_f32 = struct.Struct('<f')
+_f64 = struct.Struct('<d')
+_scoreframe = struct.Struct('<iBHHHHHHiHH?BB?')
+
 class BanchoPacket:
     """Abstract base class for bancho packets."""
     type: Optional[Packets] = None
     args: Optional[tuple[osuTypes]] = None
     length: Optional[int] = None
+    decoder: tuple[tuple[tuple[str, ...], Any], ...] = ()
 
     def __init_subclass__(cls, type: Packets) -> None:
         super().__init_subclass__()
@@ -170,10 +192,45 @@ class BanchoPacket:
         cls.type = type
         cls.args = cls.__annotations__
 
-        for x in ('type', 'args', 'length'):
+        for x in ('type', 'args', 'length', 'decoder'):
             if x in cls.args:
                 del cls.args[x]
 
+        cls.decoder = cls.compile_decoder(cls.args)
+
+    @staticmethod
+    def compile_decoder(args: dict[str, osuTypes]) -> tuple:
+        """Compile `args` into a sequence of steps for the reader.
+
+           Each step is a tuple of (arg names, reader); runs of
+           fixed-size args are merged into a single struct, while
+           other types use the respective reader method."""
+        steps = []
+        fmt = ''
+        names = []
+
+        for arg_name, arg_type in args.items():
+            if arg_type in _fixed_types:
+                fmt += _fixed_types[arg_type]
+                names.append(arg_name)
+                continue
+
+            if fmt: # flush the current run of fixed args
+                steps.append((tuple(names), struct.Struct(f'<{fmt}')))
+                fmt = ''
+                names = []
+
+            if arg_type not in _type_readers:
+                # should never happen?
+                raise ValueError(f'Unsupported packet arg type {arg_type!r}.')
+
+            steps.append(((arg_name,), _type_readers[arg_type]))
+
+        if fmt:
+            steps.append((tuple(names), struct.Struct(f'<{fmt}')))
+
+        return tuple(steps)
+
     async def handle(self, p: 'Player') -> None: ...
 
 Message = namedtuple('Message', ['sender', 'msg', 'recipient', 'sender_id'])
@@ -185,9 +242,12 @@ class BanchoPacketReader:
 
     Attributes
     -----------
-    view: `memoryview`
+    body: `memoryview`
         A low-level view to the underlying buffer passed in.
 
+    offset: `int`
+        The current position of the reader in `body`.
+
     packet_map: `dict[Packets (packet id), BanchoPacket (handler)]`
         The map of packets the packet reader will handle.
 
@@ -202,9 +262,10 @@ class BanchoPacketReader:
           await packet.handle()
     ```
     """
-    __slots__ = ('view', 'packet_map', '_current')
+    __slots__ = ('body', 'offset', 'packet_map', '_current')
     def __init__(self, data: bytes, packet_map: dict) -> None:
-        self.view = memoryview(data)
+        self.body = memoryview(data)
+        self.offset = 0
         self.packet_map = packet_map
 
         self._current: Optional[BanchoPacket] = None
@@ -219,10 +280,9 @@ class BanchoPacketReader:
             p_type, p_len = self.read_header()
 
             if p_type not in self.packet_map:
-                # packet type not handled, remove
-                # from internal buffer and continue.
-                if p_len != 0:
-                    self.view = self.view[p_len:]
+                # packet type not handled, skip
+                # over it's data and continue.
+                self.offset += p_len
             else:
                 # we can handle this one.
                 break
@@ -231,136 +291,97 @@ class BanchoPacketReader:
         self._current = self.packet_map[p_type]()
         self._current.length = p_len
 
-        if self._current.args:
+        end = self.offset + p_len
+
+        if self._current.decoder:
             self.read_arguments()
 
+        # always continue from the end of the packet,
+        # regardless of how much the handler had read.
+        self.offset = end
+
         return self._current
 
     def read_arguments(self) -> None:
         """Read all arguments from the internal buffer."""
-        for arg_name, arg_type in self._current.args.items():
-            # read value from buffer
-            val: Any = None
-
-            # non-osu! datatypes
-            if arg_type == osuTypes.i8:
-                val = self.read_i8()
-            elif arg_type == osuTypes.i16:
-                val = self.read_i16()
-            elif arg_type == osuTypes.i32:
-                val = self.read_i32()
-            elif arg_type == osuTypes.i64:
-                val = self.read_i64()
-            elif arg_type == osuTypes.u8:
-                val = self.read_i8()
-            elif arg_type == osuTypes.u16:
-                val = self.read_u16()
-            elif arg_type == osuTypes.u32:
-                val = self.read_u32()
-            elif arg_type == osuTypes.u64:
-                val = self.read_u64()
-
-            # osu!-specific data types
-            elif arg_type == osuTypes.string:
-                val = self.read_string()
-            elif arg_type == osuTypes.i32_list:
-                val = self.read_i32_list_i16l()
-            elif arg_type == osuTypes.i32_list4l:
-                val = self.read_i32_list_i32l()
-            elif arg_type == osuTypes.message:
-                val = self.read_message()
-            elif arg_type == osuTypes.channel:
-                val = self.read_channel()
-            elif arg_type == osuTypes.match:
-                val = self.read_match()
-            elif arg_type == osuTypes.scoreframe:
-                val = self.read_scoreframe()
-
-            elif arg_type == osuTypes.raw:
-                # return all packet data raw.
-                val = self.view[:self._current.length]
-                self.view = self.view[self._current.length:]
-            else:
-                # should never happen?
-                raise ValueError
+        packet = self._current
+
+        for names, reader in packet.decoder:
+            if reader.__class__ is struct.Struct:
+                # run of fixed-size args, read them all at once.
+                vals = reader.unpack_from(self.body, self.offset)
+                self.offset += reader.size
 
-            # add to our packet object
-            setattr(self._current, arg_name, val)
+                for name, val in zip(names, vals):
+                    setattr(packet, name, val)
+            else:
+                setattr(packet, names[0], reader(self))
 
     def read_header(self) -> tuple[int, int]:
         """Read the header of an osu! packet (id & length)."""
-        if len(self.view) < 7:
+        if len(self.body) - self.offset < 7:
             # not even minimal data
             # remaining in buffer.
             raise StopIteration
 
         # read type & length from the body
-        data = struct.unpack('<HxI', self.view[:7])
-        self.view = self.view[7:]
-        return Packets(data[0]), data[1]
-
-    def ignore_packet(self) -> None:
-        """Skip the current packet in the buffer."""
-        self.view = self.view[self._current.length:]
-        self._current = None
+        data = _header.unpack_from(self.body, self.offset)
+        self.offset += 7
+        return data
 
     """ type readers (functions to read different types from buf) """
 
-    """ basic integral types (signed & unsigned) """
-    def _read_integral(self, size: int, signed: bool) -> int:
-        val = int.from_bytes(self.view[:size], 'little', signed=signed)
-        self.view = self.view[size:]
+    def _read_fixed(self, layout: struct.Struct) -> Any:
+        val, = layout.unpack_from(self.body, self.offset)
+        self.offset += layout.size
         return val
 
-    read_i8 = partialmethod(_read_integral, size=1, signed=True)
-    read_u8 = partialmethod(_read_integral, size=1, signed=False)
-    read_i16 = partialmethod(_read_integral, size=2, signed=True)
-    read_u16 = partialmethod(_read_integral, size=2, signed=False)
-    read_i32 = partialmethod(_read_integral, size=4, signed=True)
-    read_u32 = partialmethod(_read_integral, size=4, signed=False)
-    read_i64 = partialmethod(_read_integral, size=8, signed=True)
-    read_u64 = partialmethod(_read_integral, size=8, signed=False)
+    """ basic integral types (signed & unsigned) """
+    read_i8 = partialmethod(_read_fixed, _i8)
+    read_u8 = partialmethod(_read_fixed, _u8)
+    read_i16 = partialmethod(_read_fixed, _i16)
+    read_u16 = partialmethod(_read_fixed, _u16)
+    read_i32 = partialmethod(_read_fixed, _i32)
+    read_u32 = partialmethod(_read_fixed, _u32)
+    read_i64 = partialmethod(_read_fixed, _i64)
+    read_u64 = partialmethod(_read_fixed, _u64)
 
     """ floating point types """
-    def read_f32(self) -> float:
-        val, = struct.unpack_from('<f', self.view[:4])
-        self.view = self.view[4:]
-        return val
-
-    def read_f64(self) -> float:
-        val, = struct.unpack_from('<d', self.view[:8])
-        self.view = self.view[8:]
-        return val
+    read_f32 = partialmethod(_read_fixed, _f32)
+    read_f64 = partialmethod(_read_fixed, _f64)
 
     """ integral list types """
     # XXX: some osu! packets use i16 for
     # array length, while others use i32
-    def _read_i32_list(self, len_size: int) -> tuple[int]:
-        length = int.from_bytes(self.view[:len_size], 'little')
-        self.view = self.view[len_size:]
+    def _read_i32_list(self, len_layout: struct.Struct) -> tuple[int]:
+        length = self._read_fixed(len_layout)
 
-        val = struct.unpack(f'<{"I" * length}', self.view[:length * 4])
-        self.view = self.view[length * 4:]
+        val = struct.unpack_from(f'<{length}I', self.body, self.offset)
+        self.offset += length * 4
         return val
 
-    read_i32_list_i16l = partialmethod(_read_i32_list, len_size=2)
-    read_i32_list_i32l = partialmethod(_read_i32_list, len_size=4)
+    read_i32_list_i16l = partialmethod(_read_i32_list, _u16)
+    read_i32_list_i32l = partialmethod(_read_i32_list, _u32)
 
     """ string type (variable length encoding w/ uleb128) """
     def read_string(self) -> str:
-        exists = self.view[0] == 0x0b
-        self.view = self.view[1:]
+        body = self.body
+        offset = self.offset
+
+        exists = body[offset] == 0x0b
+        offset += 1
 
         if not exists:
             # no string sent.
+            self.offset = offset
             return ''
 
         # non-empty string, decode str length (uleb128)
         length = shift = 0
 
         while True:
-            b = self.view[0]
-            self.view = self.view[1:]
+            b = body[offset]
+            offset += 1
 
             length |= (b & 0b01111111) << shift
             if (b & 0b10000000) == 0:
@@ -368,8 +389,15 @@ class BanchoPacketReader:
 
             shift += 7
 
-        val = self.view[:length].tobytes().decode() # copy
-        self.view = self.view[length:]
+        val = str(body[offset:offset + length], 'utf-8')
+        self.offset = offset + length
+        return val
+
+    """ raw data (the remainder of the packet) """
+    def read_raw(self) -> memoryview:
+        # NOTE: this is a view to the request body, no copy is made.
+        val = self.body[self.offset:self.offset + self._current.length]
+        self.offset += self._current.length
         return val
 
     """ custom osu! types """
@@ -396,7 +424,7 @@ class BanchoPacketReader:
         m = Match()
 
         # ignore match id (i16) and inprogress (i8).
-        self.view = self.view[3:]
+        self.offset += 3
 
         #m.type = MatchTypes(self.read_i8())
         if self.read_i8() == 1:
@@ -420,7 +448,7 @@ class BanchoPacketReader:
         for slot in m.slots:
             if slot.status & SlotStatus.has_player:
                 # we don't need this, ignore it.
-                self.view = self.view[4:]
+                self.offset += 4
 
         host_id = self.read_i32()
         m.host = glob.players.get(id=host_id)
@@ -442,9 +470,8 @@ class BanchoPacketReader:
         return m
 
     def read_scoreframe(self) -> ScoreFrame:
-        fmt = '<iBHHHHHHiHH?BB?'
-        sf = ScoreFrame(*struct.unpack_from(fmt, self.view[:29]))
-        self.view = self.view[29:]
+        sf = ScoreFrame(*_scoreframe.unpack_from(self.body, self.offset))
+        self.offset += _scoreframe.size
 
         if sf.score_v2:
             sf.combo_portion = self.read_f32()
@@ -452,6 +479,18 @@ class BanchoPacketReader:
 
         return sf
 
+# readers for the variable-size (or custom) osu! datatypes.
+_type_readers = {
+    osuTypes.string: BanchoPacketReader.read_string,
+    osuTypes.i32_list: BanchoPacketReader.read_i32_list_i16l,
+    osuTypes.i32_list4l: BanchoPacketReader.read_i32_list_i32l,
+    osuTypes.message: BanchoPacketReader.read_message,
+    osuTypes.channel: BanchoPacketReader.read_channel,
+    osuTypes.match: BanchoPacketReader.read_match,
+    osuTypes.scoreframe: BanchoPacketReader.read_scoreframe,
+    osuTypes.raw: BanchoPacketReader.read_raw
+}
+
 def write_uleb128(num: int) -> bytearray:
     """ Write `num` into an unsigned LEB128. """
     if num == 0:
@@ -469,26 +508,22 @@ def write_uleb128(num: int) -> bytearray:
 
     return ret
 
-def write_string(s: str) -> bytearray:
+def write_string(s: str) -> bytes:
     """ Write `s` into bytes (ULEB128 & string). """
-    if s:
-        encoded = s.encode()
-        ret = bytearray(b'\x0b')
-        ret += write_uleb128(len(encoded))
-        ret += encoded
-    else:
-        ret = bytearray(b'\x00')
+    if not s:
+        return b'\x00'
 
-    return ret
+    encoded = s.encode()
 
-def write_i32_list(l: tuple[int, ...]) -> bytearray:
-    """ Write `l` into bytes (int32 list). """
-    ret = bytearray(len(l).to_bytes(2, 'little'))
+    if (length := len(encoded)) < 0x80:
+        # fast path, the length fits in a single byte.
+        return b'\x0b' + length.to_bytes(1, 'little') + encoded
 
-    for i in l:
-        ret += i.to_bytes(4, 'little')
+    return b'\x0b' + write_uleb128(length) + encoded
 
-    return ret
+def write_i32_list(l: tuple[int, ...]) -> bytes:
+    """ Write `l` into bytes (int32 list). """
+    return struct.pack(f'<H{len(l)}I', len(l), *l)
 
 def write_message(sender: str, msg: str, recipient: str,
                   sender_id: int) -> bytearray:
@@ -567,7 +602,8 @@ def write_scoreframe(s: ScoreFrame) -> bytearray:
 
 def write(packid: int, *args: tuple[Any, ...]) -> bytes:
     """ Write `args` into bytes. """
-    ret = bytearray(struct.pack('<Hx', packid))
+    # the length is written into the header once we're done.
+    ret = bytearray(_header.pack(packid, 0))
 
     for p_args, p_type in args:
         if p_type == osuTypes.raw:
@@ -590,10 +626,17 @@ def write(packid: int, *args: tuple[Any, ...]) -> bytes:
             # not a custom type, use struct to pack the data.
             ret += struct.pack(_specifiers[p_type], p_args)
 
-    # add size
-    ret[3:3] = struct.pack('<I', len(ret) - 3)
+    # write size in place
+    _u32.pack_into(ret, 3, len(ret) - 7)
     return bytes(ret)
 
+# precompiled layouts for the fixed parts of
+# the packets which are sent most frequently.
+_user_stats_head = struct.Struct('<HxIiB') # id, action
+_user_stats_tail = struct.Struct('<iBiqfiqih') # mods -> pp
+_user_presence_head = struct.Struct('<HxIi') # id
+_user_presence_tail = struct.Struct('<BBBffi') # utc_offset -> rank
+
 #
 # packets
 #
@@ -619,10 +662,17 @@ def userID(id: int) -> bytes:
 # packet id: 7
 def sendMessage(sender: str, msg: str, recipient: str,
                 sender_id: int) -> bytes:
-    return write(
-        Packets.CHO_SEND_MESSAGE,
-        ((sender, msg, recipient, sender_id), osuTypes.message)
-    )
+    sender = write_string(sender)
+    msg = write_string(msg)
+    recipient = write_string(recipient)
+
+    length = len(sender) + len(msg) + len(recipient) + 4
+
+    return b''.join((
+        _header.pack(Packets.CHO_SEND_MESSAGE, length),
+        sender, msg, recipient,
+        _i32.pack(sender_id)
+    ))
 
 # packet id: 8
 @cache
@@ -678,7 +728,14 @@ def userStats(p: 'Player') -> bytes:
     if p is glob.bot:
         return botStats()
 
+    status = p.status
     gm_stats = p.gm_stats
+
+    # reuse the last packet built if nothing has changed.
+    state = (status.version, gm_stats.version)
+    if p._stats_packet and p._stats_packet[0] == state:
+        return p._stats_packet[1]
+
     if gm_stats.pp > 0x7fff:
         # over osu! pp cap, we'll have to
         # show their pp as ranked score.
@@ -688,22 +745,34 @@ def userStats(p: 'Player') -> bytes:
         rscore = gm_stats.rscore
         pp = gm_stats.pp
 
-    return write(
-        Packets.CHO_USER_STATS,
-        (p.id, osuTypes.i32),
-        (p.status.action, osuTypes.u8),
-        (p.status.info_text, osuTypes.string),
-        (p.status.map_md5, osuTypes.string),
-        (p.status.mods, osuTypes.i32),
-        (p.status.mode.as_vanilla, osuTypes.u8),
-        (p.status.map_id, osuTypes.i32),
-        (rscore, osuTypes.i64),
-        (gm_stats.acc / 100.0, osuTypes.f32),
-        (gm_stats.plays, osuTypes.i32),
-        (gm_stats.tscore, osuTypes.i64),
-        (gm_stats.rank, osuTypes.i32),
-        (pp, osuTypes.i16) # why not u16 peppy :(
-    )
+    info_text = write_string(status.info_text)
+    map_md5 = write_string(status.map_md5)
+
+    length = (5 + len(info_text) + len(map_md5) +
+              _user_stats_tail.size)
+
+    data = b''.join((
+        _user_stats_head.pack(
+            Packets.CHO_USER_STATS, length,
+            p.id, status.action
+        ),
+        info_text,
+        map_md5,
+        _user_stats_tail.pack(
+            status.mods,
+            status.mode.as_vanilla,
+            status.map_id,
+            rscore,
+            gm_stats.acc / 100.0,
+            gm_stats.plays,
+            gm_stats.tscore,
+            gm_stats.rank,
+            pp # why not u16 peppy :(
+        )
+    ))
+
+    p._stats_packet = (state, data)
+    return data
 
 # packet id: 12
 @cache
@@ -731,14 +800,8 @@ def spectatorLeft(id: int) -> bytes:
     )
 
 # packet id: 15
-# TODO: perhaps optimize this and match
-# frames to be a bit more efficient, since
-# they're literally spammed between clients.
 def spectateFrames(data: bytes) -> bytes:
-    return write(
-        Packets.CHO_SPECTATE_FRAMES,
-        (data, osuTypes.raw)
-    )
+    return _header.pack(Packets.CHO_SPECTATE_FRAMES, len(data)) + data
 
 # packet id: 19
 @cache
@@ -983,17 +1046,33 @@ def userPresence(p: 'Player') -> bytes:
     if p is glob.bot:
         return botPresence()
 
-    return write(
-        Packets.CHO_USER_PRESENCE,
-        (p.id, osuTypes.i32),
-        (p.name, osuTypes.string),
-        (p.utc_offset + 24, osuTypes.u8),
-        (p.country[0], osuTypes.u8),
-        (p.bancho_priv | (p.status.mode.as_vanilla << 5), osuTypes.u8),
-        (p.location[1], osuTypes.f32), # long
-        (p.location[0], osuTypes.f32), # lat
-        (p.gm_stats.rank, osuTypes.i32)
-    )
+    # reuse the last packet built if nothing has changed.
+    state = (p.name, p.status.mode, p.gm_stats.version,
+             p.priv, p.country, p.location, p.utc_offset)
+    if p._presence_packet and p._presence_packet[0] == state:
+        return p._presence_packet[1]
+
+    name = write_string(p.name)
+    length = 4 + len(name) + _user_presence_tail.size
+
+    data = b''.join((
+        _user_presence_head.pack(
+            Packets.CHO_USER_PRESENCE,
+            length, p.id
+        ),
+        name,
+        _user_presence_tail.pack(
+            p.utc_offset + 24,
+            p.country[0],
+            p.bancho_priv | (p.status.mode.as_vanilla << 5),
+            p.location[1], # long
+            p.location[0], # lat
+            p.gm_stats.rank
+        )
+    ))
+
+    p._presence_packet = (state, data)
+    return data
 
 # packet id: 86
 @cache
@@ -1039,7 +1118,7 @@ def userSilenced(pid: int) -> bytes:
         (pid, osuTypes.i32)
     )
 
-""" not sure why 95 & 96 exist? unused in gulag """
+""" not sure why 95 exists? unused in gulag """
 
 # packet id: 95
 @cache
@@ -1051,10 +1130,14 @@ def userPresenceSingle(pid: int) -> bytes:
 
 # packet id: 96
 def userPresenceBundle(pid_list: list[int]) -> bytes:
-    return write(
-        Packets.CHO_USER_PRESENCE_BUNDLE,
-        (pid_list, osuTypes.i32_list)
-    )
+    # the list's length is sent as a u16, so
+    # large lists are split over many packets.
+    return b''.join([
+        write(
+            Packets.CHO_USER_PRESENCE_BUNDLE,
+            (pid_list[i:i + 0xffff], osuTypes.i32_list)
+        ) for i in range(0, max(len(pid_list), 1), 0xffff)
+    ])
 
 # packet id: 100
 def userDMBlocked(target: str) -> bytes:
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# recalculate the pp of all scores on the server, and rebuild every
+# player's stats from them; this is the same as `!recalc all` in-game,
+# but can be run while the server is offline. if the recalc is stopped
+# partway through, running this again will resume where it left off.
+
+import os
+import sys
+
+# set cwd to /gulag.
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+
+import argparse
+import asyncio
+
+import aiohttp
+import cmyui
+import orjson
+from cmyui import Ansi
+from cmyui import log
+
+from objects import glob
+from utils.beatmap_files import BeatmapFileStore
+from utils.oppai import LIBOPPAI_PATH
+from utils.recalculator import ScoreRecalculator
+
+async def main(args: argparse.Namespace) -> None:
+    glob.http = aiohttp.ClientSession(json_serialize=orjson.dumps)
+    glob.db = cmyui.AsyncSQLPool()
+    await glob.db.connect(glob.config.mysql)
+
+    # missing .osu files will be downloaded as needed.
+    glob.beatmap_files = BeatmapFileStore(
+        max_downloads = glob.config.max_concurrent_map_downloads,
+        max_cached_bytes = 0 # only read by the workers
+    )
+
+    try:
+        recalculator = ScoreRecalculator(args.workers, args.batch_size)
+        counts = await recalculator.run(resume=not args.restart)
+    finally:
+        await glob.db.close()
+        await glob.http.close()
+
+    recap = ' | '.join([f'{count} {table}' for table, count in counts.items()])
+    log(f'Recalculated {sum(counts.values())} ({recap}) scores.', Ansi.LGREEN)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Recalculate the pp of all scores on the server.'
+    )
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='amount of worker processes (default: all cores)')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000,
+                        help='amount of scores updated per query')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore any saved progress, and start over')
+    args = parser.parse_args()
+
+    if not LIBOPPAI_PATH.exists():
+        sys.exit('liboppai must be built to recalculate (see README).')
+
+    glob.datadog = None
+    asyncio.run(main(args))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# compare the throughput of the in-process oppai-ng engine (liboppai)
+# against spawning the oppai binary for each score, on maps in
+# .data/osu, checking that both give the same pp & star rating.
+# both oppai-ng's binary & library must be built (see README).
+
+import os
+import sys
+
+# set cwd to /gulag.
+os.chdir(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import argparse
+import asyncio
+import math
+import random
+import time
+from pathlib import Path
+
+from constants.mods import Mods
+from objects import glob
+from utils.oppai import LIBOPPAI_PATH
+from utils.oppai import OppaiEngine
+from utils.recalculator import PPCalculator
+
+# a mix of the mods scores are usually submitted with.
+MODS = (Mods.NOMOD, Mods.HIDDEN, Mods.HARDROCK, Mods.DOUBLETIME,
+        Mods.HIDDEN | Mods.DOUBLETIME, Mods.HIDDEN | Mods.HARDROCK,
+        Mods.FLASHLIGHT, Mods.EASY, Mods.NOFAIL)
+
+def make_queries(num: int) -> list[dict]:
+    queries = []
+
+    for _ in range(num):
+        query = {
+            'mods': random.choice(MODS),
+            'nmiss': random.choice((0, 0, random.randint(1, 20))),
+            'acc': round(random.uniform(85.0, 100.0), 2)
+        }
+
+        if random.random() < 0.5:
+            query['combo'] = random.randint(1, 500) # otherwise fc
+
+        queries.append(query)
+
+    return queries
+
+async def time_calls(map_id: int, mode_vn: int,
+                     queries: list[dict]) -> tuple[float, list]:
+    """Calculate `queries` one by one, as score submission does."""
+    results = []
+    started_at = time.perf_counter()
+
+    for query in queries:
+        ppcalc = PPCalculator(map_id, mode_vn=mode_vn, **query)
+        results.append(await ppcalc.perform())
+
+    return time.perf_counter() - started_at, results
+
+async def time_batch(map_id: int, mode_vn: int,
+                     queries: list[dict]) -> tuple[float, list]:
+    """Calculate `queries` in a single call, as the recalculator does."""
+    started_at = time.perf_counter()
+
+    ppcalc = PPCalculator(map_id, mode_vn=mode_vn)
+    results = await ppcalc.perform_many(queries)
+
+    return time.perf_counter() - started_at, results
+
+def compare(expected: list, results: list) -> int:
+    """Return the amount of results which differ from `expected`."""
+    return len([
+        None for (pp, sr), (exp_pp, exp_sr) in zip(results, expected)
+        if not (math.isclose(pp, exp_pp, rel_tol=1e-4, abs_tol=1e-2) and
+                math.isclose(sr, exp_sr, rel_tol=1e-4, abs_tol=1e-3))
+    ])
+
+async def main(args: argparse.Namespace) -> None:
+    if not (engine := OppaiEngine.load(glob.config.oppai_cached_maps,
+                                       glob.config.oppai_cached_attrs)):
+        sys.exit('Failed to load liboppai.')
+
+    print(f'{"map":>9} {"mode":>4} | {"subprocess":>13} | '
+          f'{"engine":>13} | {"engine (batch)":>14} | mismatches')
+
+    for map_id in args.map_ids:
+        for mode_vn in (0, 1):
+            queries = make_queries(args.scores)
+
+            glob.oppai = None # spawn the binary for each score
+            sub_time, expected = await time_calls(map_id, mode_vn, queries)
+
+            glob.oppai = engine
+            call_time, calls = await time_calls(map_id, mode_vn, queries)
+            batch_time, batch = await time_batch(map_id, mode_vn, queries)
+
+            print(f'{map_id:>9} {mode_vn:>4} | '
+                  f'{len(queries) / sub_time:>8.0f} pp/s | '
+                  f'{len(queries) / call_time:>8.0f} pp/s | '
+                  f'{len(queries) / batch_time:>9.0f} pp/s | '
+                  f'{compare(expected, calls)} / {compare(expected, batch)}')
+
+    engine.shutdown()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the oppai-ng engine against its binary.'
+    )
+    parser.add_argument('map_ids', type=int, nargs='+',
+                        help='ids of maps in .data/osu to calculate on')
+    parser.add_argument('-n', '--scores', type=int, default=200,
+                        help='amount of scores to calculate per map & mode')
+    args = parser.parse_args()
+
+    if not LIBOPPAI_PATH.exists() or not Path('oppai-ng/oppai').exists():
+        sys.exit('oppai-ng & liboppai must both be built (see README).')
+
+    for map_id in args.map_ids:
+        if not Path(f'.data/osu/{map_id}.osu').exists():
+            sys.exit(f'.data/osu/{map_id}.osu not found.')
+
+    glob.datadog = None
+    random.seed(0)
+    asyncio.run(main(args))
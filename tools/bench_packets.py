@@ -0,0 +1,295 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# time the decoding of typical osu! request bodies (status updates,
+# chat, spectator frames & score frames), checking that the decoded
+# arguments match what was sent; then time the hottest packet builders,
+# checking their output against the generic packets.write(). pass
+# --baseline <git revision> to also time packets.py as of that revision.
+
+import os
+import sys
+
+# set cwd to /gulag.
+os.chdir(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import argparse
+import random
+import struct
+import subprocess
+import timeit
+import types
+from typing import Optional
+
+from constants.gamemodes import GameMode
+from constants.types import osuTypes
+from objects import glob
+from objects.player import ModeData
+from objects.player import Player
+
+NUM_RUNS = 20000
+
+def load_packets(rev: Optional[str]) -> types.ModuleType:
+    """Import packets.py, either from the tree or a git revision."""
+    if rev is None:
+        import packets
+        return packets
+
+    source = subprocess.run(
+        ['git', 'show', f'{rev}:packets.py'],
+        capture_output=True, check=True
+    ).stdout
+
+    module = types.ModuleType(f'packets@{rev}')
+    exec(compile(source, f'packets.py@{rev}', 'exec'), module.__dict__)
+    return module
+
+def packet_map(packets: types.ModuleType) -> dict:
+    """Declare the packets used in the bodies, as domains/cho.py does."""
+    BanchoPacket = packets.BanchoPacket
+    Packets = packets.Packets
+
+    class Ping(BanchoPacket, type=Packets.OSU_PING):
+        pass
+
+    class ChangeAction(BanchoPacket, type=Packets.OSU_CHANGE_ACTION):
+        action: osuTypes.u8
+        info_text: osuTypes.string
+        map_md5: osuTypes.string
+        mods: osuTypes.u32
+        mode: osuTypes.u8
+        map_id: osuTypes.i32
+
+    class SendMessage(BanchoPacket, type=Packets.OSU_SEND_PUBLIC_MESSAGE):
+        msg: osuTypes.message
+
+    class StatsRequest(BanchoPacket, type=Packets.OSU_USER_STATS_REQUEST):
+        user_ids: osuTypes.i32_list
+
+    class SpectateFrames(BanchoPacket, type=Packets.OSU_SPECTATE_FRAMES):
+        play_data: osuTypes.raw
+
+    class MatchScoreUpdate(BanchoPacket, type=Packets.OSU_MATCH_SCORE_UPDATE):
+        play_data: osuTypes.raw
+
+    return {cls.type: cls for cls in (
+        Ping, ChangeAction, SendMessage, StatsRequest,
+        SpectateFrames, MatchScoreUpdate
+    )}
+
+def scoreframe() -> bytes:
+    return struct.pack(
+        '<iBHHHHHHiHH?BB?', 123456, 3, 412, 21, 2, 80, 12, 4,
+        4_213_370, 312, 318, False, 200, 0, False
+    )
+
+def request_bodies(packets: types.ModuleType) -> dict[str, tuple[bytes, list]]:
+    """Build the request bodies, with the arguments expected of each packet."""
+    write = packets.write
+    Packets = packets.Packets
+
+    status = (2, 'Camellia - Exit This Earth\'s Atomosphere [Evolution]',
+              '1cf5b2c2edfafd055536d2cefcb89c0e', 72, 0, 1234567)
+    message = ('cmyui', 'hello world! ' * 4, '#osu', 3)
+    user_ids = tuple(random.sample(range(1, 100000), 64))
+
+    # a bundle of replay frames; the amount the client sends at once.
+    frames = b''.join([
+        struct.pack('<BBffi', 1, 0, random.random() * 512,
+                    random.random() * 384, i * 16)
+        for i in range(20)
+    ])
+    spectate_data = (struct.pack('<iH', 0, 20) + frames +
+                     b'\x00' + scoreframe() + struct.pack('<H', 1))
+
+    return {
+        'status update': (
+            write(Packets.OSU_PING) +
+            write(Packets.OSU_CHANGE_ACTION,
+                  *zip(status, (osuTypes.u8, osuTypes.string,
+                                osuTypes.string, osuTypes.u32,
+                                osuTypes.u8, osuTypes.i32))) +
+            write(Packets.OSU_USER_STATS_REQUEST,
+                  (user_ids, osuTypes.i32_list)),
+            [(), status, (user_ids,)]
+        ),
+        'chat': (
+            write(Packets.OSU_SEND_PUBLIC_MESSAGE,
+                  (message, osuTypes.message)),
+            [(message,)]
+        ),
+        'spectator frames': (
+            write(Packets.OSU_SPECTATE_FRAMES,
+                  (spectate_data, osuTypes.raw)),
+            [(spectate_data,)]
+        ),
+        'score frames': (
+            b''.join([write(Packets.OSU_MATCH_SCORE_UPDATE,
+                            (scoreframe(), osuTypes.raw))
+                      for _ in range(4)]),
+            [(scoreframe(),)] * 4
+        )
+    }
+
+def check(packets: types.ModuleType, pmap: dict, body: bytes,
+          expected: list) -> None:
+    """Check that `body` decodes to the `expected` arguments."""
+    decoded = []
+
+    for packet in packets.BanchoPacketReader(body, pmap):
+        args = tuple([getattr(packet, name) for name in packet.args])
+        decoded.append(tuple([bytes(arg) if isinstance(arg, memoryview)
+                              else arg for arg in args]))
+
+    # (messages & channels are namedtuples, so compare as tuples)
+    assert decoded == expected, f'{decoded!r} != {expected!r}'
+
+def bench_decode(packets: types.ModuleType) -> dict[str, float]:
+    """Return the time taken to decode each body, in µs."""
+    pmap = packet_map(packets)
+    reader = packets.BanchoPacketReader
+    times = {}
+
+    for name, (body, expected) in request_bodies(packets).items():
+        check(packets, pmap, body, expected)
+
+        def decode() -> None:
+            for _ in reader(body, pmap):
+                pass
+
+        elapsed = min(timeit.repeat(decode, number=NUM_RUNS, repeat=3))
+        times[name] = elapsed / NUM_RUNS * 1e6
+
+    return times
+
+def make_player() -> Player:
+    p = Player(id=3, name='cmyui', priv=1, token='token', utc_offset=-5)
+    p.country = (38, 'ca')
+    p.location = (43.65, -79.38)
+    p.status.info_text = 'Camellia - Exit This Earth\'s Atomosphere [Evolution]'
+    p.status.map_md5 = '1cf5b2c2edfafd055536d2cefcb89c0e'
+    p.status.map_id = 1234567
+    p.stats[GameMode.vn_std] = ModeData(
+        tscore=12_345_678_901, rscore=1_234_567_890, pp=4321,
+        acc=98.76, plays=12345, playtime=123456, max_combo=2345, rank=42
+    )
+    return p
+
+def write_generic(packets: types.ModuleType, p: Player) -> dict[str, bytes]:
+    """Build the packets with the generic `write()`, as a reference."""
+    write = packets.write
+    Packets = packets.Packets
+    status = p.status
+    gm_stats = p.gm_stats
+
+    return {
+        'userStats': write(
+            Packets.CHO_USER_STATS,
+            (p.id, osuTypes.i32), (status.action, osuTypes.u8),
+            (status.info_text, osuTypes.string),
+            (status.map_md5, osuTypes.string),
+            (status.mods, osuTypes.i32),
+            (status.mode.as_vanilla, osuTypes.u8),
+            (status.map_id, osuTypes.i32),
+            (gm_stats.rscore, osuTypes.i64),
+            (gm_stats.acc / 100.0, osuTypes.f32),
+            (gm_stats.plays, osuTypes.i32),
+            (gm_stats.tscore, osuTypes.i64),
+            (gm_stats.rank, osuTypes.i32),
+            (gm_stats.pp, osuTypes.i16)
+        ),
+        'userPresence': write(
+            Packets.CHO_USER_PRESENCE,
+            (p.id, osuTypes.i32), (p.name, osuTypes.string),
+            (p.utc_offset + 24, osuTypes.u8),
+            (p.country[0], osuTypes.u8),
+            (p.bancho_priv | (status.mode.as_vanilla << 5), osuTypes.u8),
+            (p.location[1], osuTypes.f32),
+            (p.location[0], osuTypes.f32),
+            (gm_stats.rank, osuTypes.i32)
+        ),
+        'sendMessage': write(
+            Packets.CHO_SEND_MESSAGE,
+            ((p.name, 'hello world! ' * 4, '#osu', p.id), osuTypes.message)
+        ),
+        'spectateFrames': write(
+            Packets.CHO_SPECTATE_FRAMES,
+            (scoreframe() * 8, osuTypes.raw)
+        )
+    }
+
+def bench_encode(packets: types.ModuleType) -> dict[str, float]:
+    """Return the time taken to build each packet, in µs."""
+    p = make_player()
+    expected = write_generic(packets, p)
+    frames = scoreframe() * 8
+
+    def userStats() -> bytes:
+        p._stats_packet = None # don't reuse the last one built
+        return packets.userStats(p)
+
+    def userPresence() -> bytes:
+        p._presence_packet = None
+        return packets.userPresence(p)
+
+    def sendMessage() -> bytes:
+        return packets.sendMessage(p.name, 'hello world! ' * 4, '#osu', p.id)
+
+    def spectateFrames() -> bytes:
+        return packets.spectateFrames(frames)
+
+    def generic(name: str):
+        return lambda: write_generic(packets, p)[name]
+
+    times = {}
+
+    for build in (userStats, userPresence, sendMessage, spectateFrames):
+        name = build.__name__
+        assert build() == expected[name], f'{name} differs from write()'
+
+        elapsed = min(timeit.repeat(build, number=NUM_RUNS, repeat=3))
+        times[name] = elapsed / NUM_RUNS * 1e6
+
+    # the generic path builds all four at once.
+    elapsed = min(timeit.repeat(lambda: write_generic(packets, p),
+                                number=NUM_RUNS, repeat=3))
+    times['(all four, generic write())'] = elapsed / NUM_RUNS * 1e6
+
+    return times
+
+def report(title: str, current: dict[str, float],
+           baseline: Optional[dict[str, float]], rev: str) -> None:
+    print(title)
+
+    for name, elapsed in current.items():
+        line = f'  {name:<28} | {elapsed:7.2f}µs'
+
+        if baseline:
+            line += (f' | {rev}: {baseline[name]:7.2f}µs '
+                     f'({baseline[name] / elapsed:.1f}x)')
+
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time the decoding & encoding of osu! packets.'
+    )
+    parser.add_argument('--baseline', default=None,
+                        help='git revision of packets.py to compare against')
+    args = parser.parse_args()
+
+    glob.bot = None # (not a real player)
+
+    current = load_packets(None)
+    baseline = args.baseline and load_packets(args.baseline)
+
+    for title, bench in (('decoding (per request body)', bench_decode),
+                         ('encoding (per packet)', bench_encode)):
+        random.seed(0)
+        current_times = bench(current)
+
+        random.seed(0)
+        baseline_times = baseline and bench(baseline)
+
+        report(title, current_times, baseline_times, args.baseline)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# time the player list's lookups by token, id & name at various amounts
+# of online players, against a linear scan of the list (as get() used
+# to do); the indexed lookups should take the same time at any size.
+
+import os
+import sys
+import timeit
+import types
+
+# set cwd to /gulag.
+os.chdir(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+from objects import glob
+from objects.collections import PlayerList
+from objects.player import Player
+from utils.misc import make_safe_name
+
+SIZES = (100, 1_000, 10_000, 50_000)
+NUM_LOOKUPS = 10_000
+
+def scan(players: PlayerList, attr: str, val) -> Player:
+    """Find a player by a linear scan of the list."""
+    for p in players:
+        if getattr(p, attr) == val:
+            return p
+
+def bench(size: int) -> None:
+    players = PlayerList([
+        Player(id=i, name=f'player {i}', priv=1, token=f'token-{i}')
+        for i in range(1, size + 1)
+    ])
+
+    # the worst case for a scan; the last player in the list.
+    p = players[-1]
+
+    for attr, val, kwargs in (
+        ('token', p.token, {'token': p.token}),
+        ('id', p.id, {'id': p.id}),
+        ('safe_name', p.safe_name, {'name': p.name})
+    ):
+        assert players.get(**kwargs) is p is scan(players, attr, val)
+
+        indexed = min(timeit.repeat(lambda: players.get(**kwargs),
+                                    number=NUM_LOOKUPS, repeat=3))
+        scanned = min(timeit.repeat(lambda: scan(players, attr, val),
+                                    number=max(1, NUM_LOOKUPS // size),
+                                    repeat=3))
+        scanned *= NUM_LOOKUPS / max(1, NUM_LOOKUPS // size)
+
+        print(f'{size:>6} players | by {attr:<9} | '
+              f'indexed {indexed / NUM_LOOKUPS * 1e6:6.2f}µs | '
+              f'scan {scanned / NUM_LOOKUPS * 1e6:9.2f}µs')
+
+def check_sessions() -> None:
+    """Check that tourney clients never shadow a player's main session."""
+    players = PlayerList()
+    main = Player(id=3, name='cmyui', priv=1, token='main')
+    tourney = [Player(id=3, name='cmyui', priv=1, token=f'tourney-{i}',
+                      tourney_client=True) for i in range(2)]
+
+    players.extend(tourney[:1])
+    players.append(main)
+    players.append(tourney[1])
+    assert players.get(id=3) is main and players.get(name='cmyui') is main
+
+    players.remove(tourney[0])
+    assert players.get(id=3) is main and players.get(token='tourney-0') is None
+
+    players.remove(main)
+    assert players.get(id=3) is tourney[1]
+    assert make_safe_name('cmyui') in players._names
+
+    players.remove(tourney[1])
+    assert players.get(id=3) is None and 'cmyui' not in players
+
+if __name__ == '__main__':
+    glob.app = types.SimpleNamespace(debug=False)
+
+    check_sessions()
+
+    for size in SIZES:
+        bench(size)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# time the rank index's updates & rank lookups against a flat sorted
+# list, at various amounts of ranked players.
+
+import bisect
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.sortedlist import SortedList
+
+SIZES = (10_000, 100_000, 1_000_000)
+NUM_OPS = 10_000
+
+def bench(size: int) -> None:
+    keys = [(-random.randint(1, 20000), user_id)
+            for user_id in range(1, size + 1)]
+    flat = sorted(keys)
+    blocked = SortedList(keys)
+
+    # remove & reinsert random players, as a score submission does
+    # (with the same pp, so that each run starts from the same list).
+    moves = [keys[random.randrange(size)] for _ in range(NUM_OPS)]
+
+    def update_flat() -> None:
+        for key in moves:
+            del flat[bisect.bisect_left(flat, key)]
+            bisect.insort(flat, key)
+
+    def update_blocked() -> None:
+        for key in moves:
+            blocked.remove(key)
+            blocked.add(key)
+
+    def rank_flat() -> None:
+        for pp, _ in moves:
+            bisect.bisect_left(flat, (pp, 0))
+
+    def rank_blocked() -> None:
+        for pp, _ in moves:
+            blocked.bisect_left((pp, 0))
+
+    for name, func in (
+        ('update (list)', update_flat),
+        ('update (SortedList)', update_blocked),
+        ('rank (list)', rank_flat),
+        ('rank (SortedList)', rank_blocked)
+    ):
+        elapsed = min(timeit.repeat(func, number=1, repeat=3))
+        print(f'{size:>9} players | {name:<20} | '
+              f'{elapsed / NUM_OPS * 1e6:7.2f}µs/op')
+
+if __name__ == '__main__':
+    random.seed(0)
+
+    for size in SIZES:
+        bench(size)
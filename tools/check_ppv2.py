@@ -0,0 +1,282 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# check the ports of oppai-ng's std performance formula (utils/ppv2.py);
+# the vectorized std_pp_grid is always checked element-wise against
+# std_pp, on synthetic difficulty attributes taking every branch of the
+# formula. given map ids (files in .data/osu) & with liboppai built,
+# std_pp is also checked against oppai itself, the engine's pp grids
+# against calculating each score on its own (std & taiko), and grids
+# of growing size are timed against per-score calculation.
+
+import os
+import sys
+
+# set cwd to /gulag.
+os.chdir(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import argparse
+import functools
+import itertools
+import math
+import operator
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+from constants.mods import Mods
+from objects import glob
+from utils.oppai import LIBOPPAI_PATH
+from utils.oppai import OppaiEngine
+from utils.oppai import difficulty_mods
+from utils.ppv2 import DifficultyAttrs
+from utils.ppv2 import std_pp
+from utils.ppv2 import std_pp_grid
+
+# every combination of the mods which branch in the formula.
+BRANCH_MOD_COMBOS = [
+    functools.reduce(operator.or_, combo, Mods.NOMOD)
+    for n in range(5) for combo in itertools.combinations(
+        (Mods.HIDDEN, Mods.FLASHLIGHT, Mods.NOFAIL, Mods.SPUNOUT), n
+    )
+]
+
+# mods for the checks against oppai; RX takes oppai's own path.
+ENGINE_MODS = (Mods.NOMOD, Mods.HIDDEN, Mods.HARDROCK, Mods.DOUBLETIME,
+               Mods.HIDDEN | Mods.DOUBLETIME | Mods.FLASHLIGHT,
+               Mods.EASY | Mods.NOFAIL, Mods.HALFTIME | Mods.SPUNOUT,
+               Mods.RELAX)
+
+# the axes of the grids checked against per-score calculation; small
+# enough that unported mods & taiko stay under GRID_MAX_FALLBACK.
+GRID_ACCS = [80.0, 95.5, 99.12, 100.0]
+GRID_NMISSES = [0, 1, 12]
+GRID_COMBOS = [-1, 250]
+
+GRID_SIZES = (10, 100, 1_000, 10_000)
+
+def synthetic_attrs() -> list[DifficultyAttrs]:
+    """Difficulty attributes covering the formula's (non-mod) branches."""
+    attrs = []
+
+    # ar > 10.33, ar < 8 & neither; nobjects around the fl & length
+    # bonus thresholds (200, 500 & 2000), and one with no circles.
+    for ar, nobjects in itertools.product((5.5, 9.0, 10.8),
+                                          (3, 150, 400, 1200, 2500)):
+        nsliders = nobjects // 3
+        nspinners = min(2, nobjects - nsliders)
+        ncircles = nobjects - nsliders - nspinners
+
+        attrs.append(DifficultyAttrs(
+            stars=random.uniform(1.0, 8.0), aim=random.uniform(0.5, 4.0),
+            speed=random.uniform(0.5, 4.0), ar=ar,
+            od=random.uniform(2.0, 10.5), max_combo=nobjects + nsliders * 2,
+            nobjects=nobjects, ncircles=ncircles, nsliders=nsliders
+        ))
+
+    attrs.append(attrs[-1]._replace(ncircles=0, nsliders=attrs[-1].nobjects))
+    return attrs
+
+def check_grid() -> None:
+    """Check std_pp_grid against std_pp for every score of the grids."""
+    mismatches = 0
+    max_rel_err = 0.0
+    num_scores = 0
+    grid_time = scalar_time = 0.0
+
+    for attrs in synthetic_attrs():
+        # full combos, combos over/under the max, no misses, more
+        # misses than objects & accuracy out of range (both ends).
+        accs = np.array([0.0, 12.5, 33.3, 70.0, 91.23, 99.99, 100.0, 101.0])
+        nmisses = np.array([0, 1, 2, 30, attrs.nobjects, attrs.nobjects + 5])
+        combos = np.array([-1, 0, 1, attrs.max_combo // 2, attrs.max_combo])
+
+        acc_grid, nmiss_grid, combo_grid = np.meshgrid(
+            accs, nmisses, combos, indexing='ij'
+        )
+
+        for mods in BRANCH_MOD_COMBOS:
+            started_at = time.perf_counter()
+            pp_grid = std_pp_grid(attrs, mods, combo_grid, nmiss_grid, acc_grid)
+            grid_time += time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            expected = [std_pp(attrs, mods, int(combo), int(nmiss), float(acc))
+                        for acc, nmiss, combo in zip(acc_grid.flat,
+                                                     nmiss_grid.flat,
+                                                     combo_grid.flat)]
+            scalar_time += time.perf_counter() - started_at
+
+            for pp, exp_pp in zip(pp_grid.flat, expected):
+                num_scores += 1
+
+                if exp_pp:
+                    max_rel_err = max(max_rel_err, abs(pp - exp_pp) / exp_pp)
+
+                if not math.isclose(pp, exp_pp, rel_tol=1e-9, abs_tol=1e-9):
+                    mismatches += 1
+
+    print(f'std_pp_grid vs std_pp: {num_scores} scores, '
+          f'{mismatches} mismatches (max rel. error {max_rel_err:.1e}); '
+          f'grid {num_scores / grid_time:.0f} pp/s, '
+          f'std_pp {num_scores / scalar_time:.0f} pp/s')
+
+    if mismatches:
+        sys.exit(1)
+
+def isclose(pp: float, exp_pp: float) -> bool:
+    # the engine's tolerance; oppai calculates with 32-bit floats.
+    return math.isclose(pp, exp_pp, rel_tol=1e-3, abs_tol=1e-2)
+
+def check_formula(engine: OppaiEngine, path: bytes, num_scores: int) -> int:
+    """Check std_pp against oppai's pp; return the number of mismatches."""
+    mtime = os.stat(path).st_mtime_ns
+    mismatches = 0
+
+    for mods in ENGINE_MODS:
+        if mods & Mods.RELAX:
+            continue # not ported
+
+        queries = [{
+            'mods': mods,
+            'nmiss': random.choice((0, 0, random.randint(1, 30))),
+            'combo': random.choice((-1, random.randint(1, 1000))),
+            'acc': round(random.uniform(80.0, 100.0), 2)
+        } for _ in range(num_scores)]
+
+        expected = engine.calculate_sync(path, 0, queries)
+
+        # the handle is left with these mods' difficulty calculated.
+        key = (path, 0, difficulty_mods(mods))
+        attrs = engine._set_attrs(key, mtime, engine.handles[path])
+
+        mismatches += len([
+            None for query, (exp_pp, _) in zip(queries, expected)
+            if not isclose(std_pp(attrs, mods, query['combo'],
+                                  query['nmiss'], query['acc']), exp_pp)
+        ])
+
+    return mismatches
+
+def check_engine_grid(engine: OppaiEngine, use_formula: bool,
+                      path: bytes, mode_vn: int) -> int:
+    """Check the engine's grids against calculating each score with oppai."""
+    mods_list = [mods for mods in ENGINE_MODS if not mods & Mods.RELAX]
+
+    if mode_vn == 0:
+        mods_list.append(Mods.RELAX) # through oppai, as taiko is
+
+    engine.use_formula = use_formula
+    results = engine.calculate_grid_sync(path, mode_vn, mods_list, GRID_ACCS,
+                                         GRID_NMISSES, GRID_COMBOS)
+
+    engine.use_formula = False
+    mismatches = 0
+
+    for mods, (pp_grid, sr) in zip(mods_list, results):
+        expected = engine.calculate_sync(path, mode_vn, [
+            {'mods': mods, 'acc': acc, 'nmiss': nmiss, 'combo': combo}
+            for acc, nmiss, combo in itertools.product(
+                GRID_ACCS, GRID_NMISSES, GRID_COMBOS
+            )
+        ])
+
+        mismatches += len([
+            None for pp, (exp_pp, exp_sr) in zip(pp_grid.flat, expected)
+            if not (isclose(pp, exp_pp) and math.isclose(sr, exp_sr,
+                                                         rel_tol=1e-3))
+        ])
+
+    engine.use_formula = use_formula
+    return mismatches
+
+def time_grids(engine: OppaiEngine, path: bytes) -> None:
+    """Time std grids against calculating each of their scores on its own."""
+    for size in GRID_SIZES:
+        # (roughly) cube-shaped grids of `size` scores.
+        side = round(size ** (1 / 3))
+        accs = list(np.linspace(80.0, 100.0, side))
+        nmisses = list(range(side))
+        combos = [-1] + list(range(1, side))
+        num_scores = side ** 3
+
+        started_at = time.perf_counter()
+        engine.calculate_grid_sync(path, 0, [Mods.HIDDEN], accs,
+                                   nmisses, combos)
+        grid_time = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        engine.calculate_sync(path, 0, [
+            {'mods': Mods.HIDDEN, 'acc': acc, 'nmiss': nmiss, 'combo': combo}
+            for acc, nmiss, combo in itertools.product(accs, nmisses, combos)
+        ])
+        score_time = time.perf_counter() - started_at
+
+        print(f'  {num_scores:>6} scores | grid {grid_time * 1e3:8.2f}ms | '
+              f'per score {score_time * 1e3:8.2f}ms '
+              f'({score_time / grid_time:.1f}x)')
+
+def check_maps(map_ids: list[int], num_scores: int) -> None:
+    if not (engine := OppaiEngine.load(glob.config.oppai_cached_maps,
+                                       glob.config.oppai_cached_attrs)):
+        sys.exit('Failed to load liboppai.')
+
+    if not (use_formula := engine.use_formula):
+        print('the formula is disabled for this version of oppai-ng; '
+              'only checking grids against per-score calculation.')
+
+    mismatches = 0
+
+    for map_id in map_ids:
+        path = f'.data/osu/{map_id}.osu'.encode()
+
+        if use_formula:
+            engine.use_formula = False # calculate with oppai
+            num = check_formula(engine, path, num_scores)
+            engine.use_formula = True
+
+            print(f'{map_id}: std_pp vs oppai: {num} mismatches')
+            mismatches += num
+
+        for mode_vn in (0, 1):
+            num = check_engine_grid(engine, use_formula, path, mode_vn)
+            print(f'{map_id}: mode {mode_vn} grid vs per score: '
+                  f'{num} mismatches')
+            mismatches += num
+
+        if use_formula:
+            print(f'{map_id}: std grid timings')
+            time_grids(engine, path)
+
+    engine.shutdown()
+
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check the ports of the std performance formula.'
+    )
+    parser.add_argument('map_ids', type=int, nargs='*',
+                        help='ids of maps in .data/osu to check against oppai')
+    parser.add_argument('-n', '--scores', type=int, default=200,
+                        help='amount of scores to check per map & mods')
+    args = parser.parse_args()
+
+    glob.datadog = None
+    random.seed(0)
+
+    check_grid()
+
+    if args.map_ids:
+        if not LIBOPPAI_PATH.exists():
+            sys.exit('liboppai must be built to check against oppai (see README).')
+
+        for map_id in args.map_ids:
+            if not Path(f'.data/osu/{map_id}.osu').exists():
+                sys.exit(f'.data/osu/{map_id}.osu not found.')
+
+        check_maps(args.map_ids, args.scores)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3.9
+# -*- coding: utf-8 -*-
+
+# check that concurrent beatmap fetches are coalesced into a single
+# osu!api request; many clients request a new map's leaderboard at
+# once, so Beatmap.from_md5 & Beatmap.cache_set are called concurrently
+# against a local stub of the osu!api (with some latency), and the
+# requests it receives are counted. also checks that cancelled callers
+# don't cancel the fetch for anyone else, and that the unsubmitted map
+# cache stops repeat requests until it expires. sql is kept in memory.
+
+import os
+import sys
+
+# set cwd to /gulag.
+os.chdir(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import argparse
+import asyncio
+import time
+import types
+from collections import Counter
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import aiohttp
+import orjson
+
+from objects import glob
+from objects.beatmap import Beatmap
+from objects.collections import BeatmapCache
+from objects.collections import ExpiringSet
+
+UNSUBMITTED_TIMEOUT = 1
+
+def api_map(map_id: int, set_id: int) -> dict:
+    """A map, as returned by the osu!api's get_beatmaps."""
+    return {
+        'beatmap_id': str(map_id), 'beatmapset_id': str(set_id),
+        'file_md5': f'{map_id:032x}', 'artist': 'Camellia',
+        'title': 'Exit This Earth\'s Atomosphere', 'version': f'diff {map_id}',
+        'creator': 'Sotarks', 'last_update': '2020-01-01 00:00:00',
+        'total_length': '180', 'max_combo': '1234', 'approved': '1',
+        'mode': '0', 'bpm': '200', 'diff_size': '4', 'diff_overall': '9',
+        'diff_approach': '9.5', 'diff_drain': '6', 'difficultyrating': '6.5'
+    }
+
+class OsuAPIStub:
+    """A local http server answering get_beatmaps, counting requests."""
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.requests: Counter[tuple[str, str]] = Counter()
+        self.server = None
+
+        # map ids 1-4 are on the osu!api, in set 1.
+        self.sets = {'1': [api_map(map_id, 1) for map_id in range(1, 5)]}
+        self.maps = {m['file_md5']: m for m in self.sets['1']}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        request_line = await reader.readline()
+        while await reader.readline() not in (b'\r\n', b''):
+            pass # headers
+
+        args = parse_qs(urlsplit(request_line.split()[1].decode()).query)
+
+        if 'h' in args:
+            self.requests['h', args['h'][0]] += 1
+            body = [self.maps[md5]] if (md5 := args['h'][0]) in self.maps else []
+        else:
+            self.requests['s', args['s'][0]] += 1
+            body = self.sets.get(args['s'][0], [])
+
+        await asyncio.sleep(self.latency)
+
+        body = orjson.dumps(body)
+        writer.write(b'HTTP/1.1 200 OK\r\n'
+                     b'Content-Type: application/json\r\n'
+                     b'Content-Length: %d\r\n'
+                     b'Connection: close\r\n\r\n' % len(body) + body)
+        await writer.drain()
+        writer.close()
+
+class LocalSession:
+    """Send the osu!api's requests to the stub, rather than old.ppy.sh."""
+    def __init__(self, session: aiohttp.ClientSession, url: str) -> None:
+        self.session = session
+        self.url = url
+
+    def get(self, url: str, **kwargs):
+        return self.session.get(self.url + urlsplit(url).path, **kwargs)
+
+class MemoryDB:
+    """Just enough of cmyui's AsyncSQLPool for the beatmap queries, in memory."""
+    def __init__(self) -> None:
+        self.rows_written = 0
+        self.pool = self
+
+    async def fetch(self, query: str, params=None, _dict: bool = True):
+        return None # no maps in sql
+
+    async def fetchall(self, query: str, params=None, _dict: bool = True):
+        return []
+
+    # pool.acquire() -> conn, conn.cursor() -> cursor, as in aiomysql.
+    def acquire(self):
+        return self
+
+    def cursor(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def begin(self) -> None:
+        pass
+
+    async def commit(self) -> None:
+        pass
+
+    async def rollback(self) -> None:
+        pass
+
+    async def executemany(self, query: str, params) -> None:
+        self.rows_written += len(params)
+
+async def gather_timed(coros: list) -> tuple[float, list]:
+    started_at = time.perf_counter()
+    results = await asyncio.gather(*coros)
+    return time.perf_counter() - started_at, results
+
+async def check_md5(api: OsuAPIStub, num: int) -> None:
+    """Check concurrent fetches by md5, against uncoalesced fetches."""
+    md5 = f'{1:032x}'
+    elapsed, maps = await gather_timed([Beatmap.from_md5(md5) for _ in range(num)])
+
+    assert all(m is maps[0] and m.id == 1 for m in maps)
+    assert api.requests['h', md5] == 1, api.requests
+    assert glob.db.rows_written == 1
+
+    print(f'{num} concurrent from_md5: {api.requests["h", md5]} request(s), '
+          f'{glob.db.rows_written} map(s) saved, {elapsed * 1e3:.0f}ms')
+
+    # now cached; no more requests.
+    await asyncio.gather(*[Beatmap.from_md5(md5) for _ in range(num)])
+    assert api.requests['h', md5] == 1
+
+    # what each of them did before; one request each.
+    md5 = f'{2:032x}'
+    elapsed, _ = await gather_timed([Beatmap._from_md5_osuapi(md5)
+                                     for _ in range(num)])
+    assert api.requests['h', md5] == num
+
+    print(f'{num} concurrent uncoalesced fetches: {api.requests["h", md5]} '
+          f'request(s), {elapsed * 1e3:.0f}ms')
+
+async def check_cancel(api: OsuAPIStub, num: int) -> None:
+    """Check that cancelled callers don't cancel the fetch for the others."""
+    md5 = f'{3:032x}'
+    tasks = [asyncio.create_task(Beatmap.from_md5(md5)) for _ in range(num)]
+
+    await asyncio.sleep(api.latency / 2)
+    for task in tasks[:num // 2]:
+        task.cancel()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert all(isinstance(r, asyncio.CancelledError) for r in results[:num // 2])
+    assert all(isinstance(r, Beatmap) and r.id == 3 for r in results[num // 2:])
+    assert api.requests['h', md5] == 1
+
+    print(f'{num // 2} of {num} callers cancelled mid-fetch: '
+          f'{api.requests["h", md5]} request(s), the rest got the map')
+
+async def check_unsubmitted(api: OsuAPIStub, num: int) -> None:
+    """Check the unsubmitted cache stops requests for a map until it expires."""
+    md5 = 'f' * 32
+
+    maps = await asyncio.gather(*[Beatmap.from_md5(md5) for _ in range(num)])
+    assert maps == [None] * num and api.requests['h', md5] == 1
+
+    # as getScores does, once the map is confirmed to be unsubmitted.
+    glob.cache['unsubmitted'].add(md5)
+
+    await asyncio.gather(*[Beatmap.from_md5(md5) for _ in range(num)])
+    assert api.requests['h', md5] == 1
+
+    await asyncio.sleep(UNSUBMITTED_TIMEOUT)
+
+    await asyncio.gather(*[Beatmap.from_md5(md5) for _ in range(num)])
+    assert api.requests['h', md5] == 2
+
+    print(f'unsubmitted map, {num} callers x3 (cached in between): '
+          f'{api.requests["h", md5]} request(s)')
+
+    # bounded; the oldest md5s are evicted first.
+    unsubmitted = ExpiringSet(max_size=2, timeout=UNSUBMITTED_TIMEOUT)
+    for md5 in ('a', 'b', 'c'):
+        unsubmitted.add(md5)
+
+    assert 'a' not in unsubmitted and 'b' in unsubmitted and 'c' in unsubmitted
+
+    await asyncio.sleep(UNSUBMITTED_TIMEOUT)
+    assert unsubmitted.sweep() == 2 and not unsubmitted
+
+async def check_set(api: OsuAPIStub, num: int) -> None:
+    """Check concurrent fetches of a whole set."""
+    rows_written = glob.db.rows_written
+    await asyncio.gather(*[Beatmap.cache_set(1) for _ in range(num)])
+
+    assert api.requests['s', '1'] == 1
+    assert Beatmap.from_md5_cache(f'{4:032x}').set_id == 1
+
+    print(f'{num} concurrent cache_set: {api.requests["s", "1"]} request(s), '
+          f'{glob.db.rows_written - rows_written} map(s) saved')
+
+async def main(args: argparse.Namespace) -> None:
+    api = OsuAPIStub(args.latency / 1000)
+    await api.start()
+
+    async with aiohttp.ClientSession(json_serialize=orjson.dumps) as session:
+        glob.http = LocalSession(session, api.url)
+
+        await check_md5(api, args.callers)
+        await check_cancel(api, args.callers)
+        await check_unsubmitted(api, args.callers)
+        await check_set(api, args.callers)
+
+    api.server.close()
+    await api.server.wait_closed()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check the coalescing of concurrent osu!api fetches.'
+    )
+    parser.add_argument('-n', '--callers', type=int, default=100,
+                        help='amount of concurrent callers')
+    parser.add_argument('--latency', type=float, default=100,
+                        help='latency of the stub osu!api, in ms')
+    args = parser.parse_args()
+
+    glob.app = types.SimpleNamespace(debug=False)
+    glob.config.osu_api_key = 'key'
+    glob.datadog = None
+    glob.db = MemoryDB()
+    glob.cache['beatmap'] = BeatmapCache(max_size=128, timeout=3600)
+    glob.cache['unsubmitted'] = ExpiringSet(max_size=128,
+                                            timeout=UNSUBMITTED_TIMEOUT)
+
+    asyncio.run(main(args))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from typing import Hashable
+
+from objects import glob
+
+__all__ = ('AdmissionQueue',)
+
+class AdmissionQueue:
+    """\
+    Admit tasks keyed by some identity (such as a username).
+
+    Tasks with the same key are run one at a time, in the order
+    they arrived, while at most `max_concurrent` tasks may run
+    overall; anything beyond that will wait in the queue.
+
+    Metrics are sent to datadog under `gulag.{name}_*`.
+    """
+    __slots__ = ('name', 'sema', 'locks', 'waiting')
+
+    def __init__(self, name: str, max_concurrent: int) -> None:
+        self.name = name
+        self.sema = asyncio.Semaphore(max_concurrent)
+
+        # {key: [lock, refcount]}; locks are removed
+        # once nothing is using or waiting on them.
+        self.locks: dict[Hashable, list] = {}
+
+        # the amount of tasks waiting to be admitted.
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def admit(self, key: Hashable) -> AsyncIterator[None]:
+        """Wait for, and hold, both `key` & a slot in the queue."""
+        if key not in self.locks:
+            self.locks[key] = [asyncio.Lock(), 0]
+
+        lock_info = self.locks[key]
+        lock_info[1] += 1
+
+        self.waiting += 1
+        enqueued_at = time.time()
+
+        if glob.datadog:
+            glob.datadog.gauge(f'gulag.{self.name}_waiting', self.waiting)
+
+        admitted = False
+
+        try:
+            # NOTE: the key's lock is acquired before the slot, so that
+            # repeated requests for a single key cannot use up the slots.
+            async with lock_info[0]:
+                async with self.sema:
+                    admitted = True
+                    self.waiting -= 1
+
+                    if glob.datadog:
+                        wait_time = time.time() - enqueued_at
+                        glob.datadog.histogram(f'gulag.{self.name}_wait_time', wait_time)
+                        glob.datadog.increment(f'gulag.{self.name}_admitted')
+
+                    yield
+        finally:
+            if not admitted:
+                # cancelled while waiting.
+                self.waiting -= 1
+
+            lock_info[1] -= 1
+            if lock_info[1] == 0:
+                del self.locks[key]
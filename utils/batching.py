@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Optional
+from typing import Sequence
+
+from objects import glob
+from utils.misc import executemany
+
+__all__ = ('WriteBatcher',)
+
+class WriteBatcher:
+    """\
+    Batch writes of a single query which arrive close together.
+
+    Each write waits up to `max_delay` seconds for others to join it
+    (or until `max_size` have), and the whole batch is then written by
+    a single `executemany`; for INSERT/REPLACE queries, this is sent
+    as one multi-row statement. `write()` returns once its batch has
+    been committed, and raises if the batch failed.
+
+    Metrics are sent to datadog under `gulag.{name}_*`.
+    """
+    __slots__ = ('name', 'query', 'max_delay', 'max_size',
+                 'pending', 'flush_handle')
+
+    def __init__(self, name: str, query: str,
+                 max_delay: float, max_size: int) -> None:
+        self.name = name
+        self.query = query
+        self.max_delay = max_delay
+        self.max_size = max_size
+
+        # [(params, future), ...] of the batch being built.
+        self.pending: list[tuple[Sequence, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def write(self, params: Sequence) -> None:
+        """Write `params` with the next batch, waiting until it's committed."""
+        loop = asyncio.get_running_loop()
+
+        fut = loop.create_future()
+        self.pending.append((params, fut))
+
+        if len(self.pending) >= self.max_size:
+            self._flush()
+        elif not self.flush_handle:
+            self.flush_handle = loop.call_later(self.max_delay, self._flush)
+
+        # NOTE: shielded, the write will still happen
+        # even if the caller is cancelled while waiting.
+        await asyncio.shield(fut)
+
+    def _flush(self) -> None:
+        """Start writing the current batch."""
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, []
+        asyncio.create_task(self._write_batch(batch))
+
+    async def _write_batch(self, batch: list[tuple[Sequence, asyncio.Future]]) -> None:
+        if glob.datadog:
+            glob.datadog.histogram(f'gulag.{self.name}_batch_size', len(batch))
+
+        try:
+            await executemany(self.query, [params for params, _ in batch])
+        except Exception as exc:
+            for _, fut in batch:
+                fut.set_exception(exc)
+        else:
+            for _, fut in batch:
+                fut.set_result(None)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+from cmyui import Ansi
+from cmyui import log
+
+from objects import glob
+from utils.singleflight import SingleFlight
+
+__all__ = ('BeatmapFileStore',)
+
+BEATMAPS_PATH = Path.cwd() / '.data/osu'
+
+def _write_atomic(path: Path, content: bytes) -> None:
+    """Write `content` to `path`, without ever leaving a partial file."""
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp',
+                                    dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class BeatmapFileStore:
+    """\
+    The .osu files of beatmaps, stored on disk by id (.data/osu/{id}.osu).
+
+    Missing files are downloaded from osu! using the shared http session,
+    with at most `max_downloads` running at once; concurrent requests for
+    the same map share a single download. Files are checked against the
+    requested md5 (when known) once fetched, and written to disk
+    atomically, off of the event loop.
+
+    The most recently used files are also kept in memory, up to a total
+    of `max_cached_bytes`, so that popular maps are served without disk io.
+    """
+    __slots__ = ('files', 'cached_bytes', 'max_cached_bytes',
+                 'sema', 'fetches')
+
+    def __init__(self, max_downloads: int, max_cached_bytes: int) -> None:
+        # {map_id: (md5, content)}, in order of least to most recently used.
+        self.files: 'OrderedDict[int, tuple[str, bytes]]' = OrderedDict()
+        self.cached_bytes = 0
+        self.max_cached_bytes = max_cached_bytes
+
+        self.sema = asyncio.Semaphore(max_downloads)
+        self.fetches = SingleFlight('map_file_fetches')
+
+    @staticmethod
+    def path_of(map_id: int) -> Path:
+        """The path of the map's file on disk."""
+        return BEATMAPS_PATH / f'{map_id}.osu'
+
+    async def get(self, map_id: int, md5: Optional[str] = None) -> Optional[bytes]:
+        """Get the contents of the map's file, downloading it if needed."""
+        if (
+            (cached := self.files.get(map_id)) and
+            (md5 is None or cached[0] == md5)
+        ):
+            self.files.move_to_end(map_id)
+
+            if glob.datadog:
+                glob.datadog.increment('gulag.map_file_cache_hits')
+
+            return cached[1]
+
+        if glob.datadog:
+            glob.datadog.increment('gulag.map_file_cache_misses')
+
+        fetched = await self.fetches.run(map_id, self._load, map_id, md5)
+
+        if fetched and not fetched[2] and md5 not in (None, fetched[0]):
+            # we shared a fetch which served an out of date
+            # file from disk (it had no md5, or a different
+            # one to check against); download it ourselves.
+            fetched = await self.fetches.run(map_id, self._load, map_id, md5)
+
+        if not fetched:
+            return
+
+        file_md5, content, _ = fetched
+
+        if md5 is not None and file_md5 != md5:
+            log(f'Map {map_id} does not match its md5 '
+                f'({file_md5} vs. {md5}).', Ansi.LRED)
+            return
+
+        return content
+
+    async def get_path(self, map_id: int,
+                       md5: Optional[str] = None) -> Optional[Path]:
+        """Get the path of the map's file, downloading it if needed."""
+        path = self.path_of(map_id)
+
+        if md5 is None and path.exists():
+            # nothing to check it against,
+            # no need to read the file.
+            return path
+
+        if await self.get(map_id, md5):
+            return path
+
+    def invalidate(self, map_id: int) -> None:
+        """Remove a map's file from memory & disk, after it's been updated."""
+        if cached := self.files.pop(map_id, None):
+            self.cached_bytes -= len(cached[1])
+
+        self.path_of(map_id).unlink(missing_ok=True)
+
+    async def _load(self, map_id: int, md5: Optional[str]
+                    ) -> Optional[tuple[str, bytes, bool]]:
+        """Read the map's file from disk, or download it from osu!.
+
+        Returns the file's md5, its content, & whether it was downloaded.
+        """
+        loop = asyncio.get_running_loop()
+        path = self.path_of(map_id)
+
+        if path.exists():
+            content = await loop.run_in_executor(None, path.read_bytes)
+            file_md5 = hashlib.md5(content).hexdigest()
+
+            if md5 is None or file_md5 == md5:
+                self._cache(map_id, file_md5, content)
+                return file_md5, content, False
+
+            # the file on disk is out of date.
+
+        if not (content := await self._download(map_id)):
+            return
+
+        # this is the latest version of the map, so it's kept
+        # even if it doesn't match the md5; callers check it.
+        file_md5 = hashlib.md5(content).hexdigest()
+
+        await loop.run_in_executor(None, _write_atomic, path, content)
+        self._cache(map_id, file_md5, content)
+
+        return file_md5, content, True
+
+    async def _download(self, map_id: int) -> Optional[bytes]:
+        """Download the map's file from osu!."""
+        url = f'https://old.ppy.sh/osu/{map_id}'
+
+        async with self.sema:
+            try:
+                async with glob.http.get(url) as resp:
+                    if not resp or resp.status != 200:
+                        log(f'Could not find map by id {map_id}!', Ansi.LRED)
+                        return
+
+                    content = await resp.read()
+            except aiohttp.ClientError as exc:
+                log(f'Failed to download map {map_id}: {exc}', Ansi.LRED)
+                return
+
+        if not content:
+            # osu! sends an empty response
+            # for maps which don't exist.
+            log(f'Could not find map by id {map_id}!', Ansi.LRED)
+            return
+
+        if glob.datadog:
+            glob.datadog.increment('gulag.map_file_downloads')
+
+        return content
+
+    def _cache(self, map_id: int, md5: str, content: bytes) -> None:
+        """Keep the map's file in memory, evicting lru files if full."""
+        if len(content) > self.max_cached_bytes:
+            return
+
+        if old := self.files.pop(map_id, None):
+            self.cached_bytes -= len(old[1])
+
+        self.files[map_id] = (md5, content)
+        self.cached_bytes += len(content)
+
+        while self.cached_bytes > self.max_cached_bytes:
+            _, (_, evicted) = self.files.popitem(last=False)
+            self.cached_bytes -= len(evicted)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from typing import Awaitable
+from typing import Callable
+
+from cmyui import Ansi
+from cmyui import log
+
+from objects import glob
+
+__all__ = ('DeferredQueue',)
+
+class DeferredQueue:
+    """\
+    A bounded queue of work to be done after a response has been sent.
+
+    Work is run in the order it was deferred by `num_workers` background
+    workers; a failure is logged, and doesn't affect any other work. If
+    the queue is full, the work is run immediately by the caller instead,
+    so that the queue can't grow without bound under load.
+
+    Metrics are sent to datadog under `gulag.{name}_*`.
+    """
+    __slots__ = ('name', 'queue', 'num_workers', 'workers')
+
+    def __init__(self, name: str, max_size: int, num_workers: int) -> None:
+        self.name = name
+        self.queue: 'asyncio.Queue[tuple[Callable[..., Awaitable[None]], tuple, float]]' = (
+            asyncio.Queue(max_size)
+        )
+
+        self.num_workers = num_workers
+        self.workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the background workers."""
+        self.workers = [asyncio.create_task(self._worker())
+                        for _ in range(self.num_workers)]
+
+    async def defer(self, func: Callable[..., Awaitable[None]], *args) -> None:
+        """Run `func(*args)` in the background, or now if the queue is full."""
+        try:
+            self.queue.put_nowait((func, args, time.time()))
+        except asyncio.QueueFull:
+            if glob.datadog:
+                glob.datadog.increment(f'gulag.{self.name}_overflows')
+
+            await self._run(func, args)
+        else:
+            if glob.datadog:
+                glob.datadog.gauge(f'gulag.{self.name}_size', self.queue.qsize())
+
+    async def _run(self, func: Callable[..., Awaitable[None]], args: tuple) -> None:
+        """Run `func(*args)`, logging any exceptions & recording metrics."""
+        started_at = time.time()
+
+        try:
+            await func(*args)
+        except Exception as exc:
+            log(f'Deferred {func.__name__} failed: {exc!r}', Ansi.LRED)
+
+            if glob.datadog:
+                glob.datadog.increment(f'gulag.{self.name}_failures')
+
+        if glob.datadog:
+            glob.datadog.histogram(f'gulag.{self.name}_time', time.time() - started_at)
+
+    async def _worker(self) -> None:
+        while True:
+            func, args, enqueued_at = await self.queue.get()
+
+            if glob.datadog:
+                glob.datadog.histogram(f'gulag.{self.name}_wait_time',
+                                       time.time() - enqueued_at)
+
+            try:
+                await self._run(func, args)
+            finally:
+                self.queue.task_done()
+
+    async def shutdown(self, timeout: float) -> None:
+        """Wait up to `timeout` seconds for queued work, then stop the workers."""
+        if self.workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                log(f'Dropped {self.queue.qsize()} deferred tasks '
+                    'on shutdown.', Ansi.LYELLOW)
+
+        for task in self.workers:
+            task.cancel()
+
+        self.workers.clear()
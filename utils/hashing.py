@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+
+import bcrypt
+
+from objects import glob
+
+__all__ = ('HashingService',)
+
+class HashingService:
+    """\
+    A bounded pool of threads for running bcrypt off of the event loop.
+
+    bcrypt is designed to be slow (~200ms per hash), and releases the
+    gil while it works; running it in threads lets the server carry on
+    handling other requests, while the semaphore ensures a flood of
+    logins queues up here rather than saturating every core we have.
+    """
+    __slots__ = ('executor', 'sema', 'pending')
+
+    def __init__(self, max_workers: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers = max_workers,
+            thread_name_prefix = 'bcrypt'
+        )
+        self.sema = asyncio.Semaphore(max_workers)
+
+        # the amount of hashes either queued or running.
+        self.pending = 0
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """Run `func(*args)` in the pool, recording metrics."""
+        self.pending += 1
+        enqueued_at = time.time()
+
+        if glob.datadog:
+            glob.datadog.gauge('gulag.bcrypt_queue', self.pending)
+
+        try:
+            async with self.sema:
+                started_at = time.time()
+
+                loop = asyncio.get_running_loop()
+                ret = await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+        if glob.datadog:
+            glob.datadog.histogram('gulag.bcrypt_wait_time', started_at - enqueued_at)
+            glob.datadog.histogram('gulag.bcrypt_time', time.time() - started_at)
+
+        return ret
+
+    async def checkpw(self, pw_md5: bytes, pw_bcrypt: bytes) -> bool:
+        """Check whether `pw_md5` matches `pw_bcrypt`."""
+        return await self._run(bcrypt.checkpw, pw_md5, pw_bcrypt)
+
+    async def hashpw(self, pw_md5: bytes) -> bytes:
+        """Hash `pw_md5` with a newly generated salt."""
+        return await self._run(bcrypt.hashpw, pw_md5, bcrypt.gensalt())
+
+    def shutdown(self) -> None:
+        """Stop accepting new hashes & shutdown the threads."""
+        self.executor.shutdown(wait=False)
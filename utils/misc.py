@@ -12,6 +12,8 @@ from cmyui.logging import printc
 from cmyui.osu.replay import Keys
 from cmyui.osu.replay import ReplayFrame
 
+from objects import glob
+
 __all__ = (
     'point_of_interest',
     'get_press_times',
@@ -20,7 +22,8 @@ __all__ = (
     'pymysql_encode',
     'escape_enum',
 
-    'download_achievement_pngs'
+    'download_achievement_pngs',
+    'executemany'
 )
 
 def point_of_interest():
@@ -142,3 +145,18 @@ def seconds_readable(seconds: int) -> str:
 
     r.append(f'{seconds % 60:02d}')
     return ':'.join(r)
+
+async def executemany(query: str, params: Sequence[Sequence]) -> None:
+    """Execute `query` for each of `params` in a single transaction."""
+    # cmyui's pool doesn't expose this; use the underlying aiomysql pool.
+    async with glob.db.pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await conn.begin()
+
+            try:
+                await cursor.executemany(query, params)
+            except:
+                await conn.rollback()
+                raise
+
+            await conn.commit()
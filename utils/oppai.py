@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import ctypes
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from typing import Optional
+
+import numpy as np
+from cmyui import Ansi
+from cmyui import log
+
+from constants.mods import DIFFICULTY_MODS
+from constants.mods import Mods
+from objects import glob
+from utils.ppv2 import DifficultyAttrs
+from utils.ppv2 import std_pp
+from utils.ppv2 import std_pp_grid
+
+__all__ = ('OppaiEngine',)
+
+# the shared library built by running `./libbuild` in oppai-ng.
+LIBOPPAI_PATH = Path('oppai-ng/liboppai.so')
+
+# mods which our port of the performance formula doesn't
+# handle; scores with these will always go through oppai.
+UNPORTED_MODS = Mods.RELAX | Mods.AUTOPILOT | Mods.SCOREV2
+
+# the major version of oppai-ng whose std performance formula our port
+# (utils/ppv2.py) matches; 4.0.0 moved to the 2021 formula, so with any
+# other version, the port is disabled & all scores go through oppai.
+FORMULA_OPPAI_MAJOR = 3
+
+# the max amount of scores in a grid request which can't be served by
+# the formula (& so go through oppai, one at a time); all other pp
+# calculations share oppai's thread, so these must be kept small.
+GRID_MAX_FALLBACK = 256
+
+# mods which take separate branches of the performance formula.
+BRANCH_MODS = Mods.HIDDEN | Mods.FLASHLIGHT | Mods.NOFAIL | Mods.SPUNOUT
+
+def formula_branch(attrs: DifficultyAttrs, mods: int,
+                   combo: int, nmiss: int) -> tuple:
+    """Return which branches of the performance formula a score takes."""
+    return (
+        mods & BRANCH_MODS, nmiss > 0, combo >= 0,
+        attrs.ar > 10.33, attrs.ar < 8, attrs.nobjects > 2000
+    )
+
+def difficulty_mods(mods: int) -> int:
+    """Return only the mods of `mods` which change difficulty."""
+    mods &= DIFFICULTY_MODS
+
+    if mods & Mods.NIGHTCORE:
+        # nc is only dt for difficulty
+        mods = (mods & ~Mods.NIGHTCORE) | Mods.DOUBLETIME
+
+    return mods
+
+class _Handle:
+    """A single `ezpp` handle, holding the parsed state of one map."""
+    __slots__ = ('ez', 'path', 'mtime', 'mode')
+
+    def __init__(self, ez: int, path: bytes, mtime: int) -> None:
+        self.ez = ez
+        self.path = path # must outlive the handle; oppai keeps a pointer.
+        self.mtime = mtime
+
+        # the mode currently set on the handle (ezpp's default);
+        # the other params are modified by oppai itself, so they
+        # can't be tracked, and are set again for each score.
+        self.mode = 0
+
+class OppaiEngine:
+    """\
+    A persistent, in-process wrapper of oppai-ng's `ezpp` api.
+
+    Handles are kept for the most recently used maps, with autocalc
+    enabled; oppai will only parse a map when it's first loaded, and
+    setting any param afterwards just recalculates from the parsed
+    map, so many (mods, combo, nmiss, acc) queries for the same map
+    are very cheap. Changing mods still recalculates difficulty.
+
+    For std, the difficulty attributes are also kept in an lru keyed
+    by (map, mode, difficulty mods), so that on a hit, only the (cheap)
+    performance formula needs to run, without touching the map at all.
+    The formula is only used for branches (mods, misses, etc.) which
+    have been checked against oppai's own result at least once, and
+    only with the version of oppai-ng it was ported from.
+
+    oppai's handles aren't thread-safe, so all calls are made from
+    a single thread; ctypes releases the gil during the call.
+    """
+    __slots__ = ('lib', 'executor', 'handles', 'max_maps',
+                 'attrs', 'max_attrs', 'use_formula', 'checked_branches',
+                 'hits', 'misses')
+
+    def __init__(self, lib_path: Path, max_maps: int, max_attrs: int) -> None:
+        self.lib = ctypes.CDLL(str(lib_path))
+        self._declare_api()
+
+        self.executor = ThreadPoolExecutor(
+            max_workers = 1,
+            thread_name_prefix = 'oppai'
+        )
+
+        # {path: handle}, in order of least to most recently used.
+        self.handles: 'OrderedDict[bytes, _Handle]' = OrderedDict()
+        self.max_maps = max_maps
+
+        # {(path, mode_vn, diff_mods): (mtime, attrs)}, also lru.
+        self.attrs: 'OrderedDict[tuple[bytes, int, int], tuple[int, DifficultyAttrs]]' = OrderedDict()
+        self.max_attrs = max_attrs
+
+        # disabled if the formula ever disagrees with oppai.
+        self.use_formula = self._check_version()
+
+        # branches of the formula which have matched oppai.
+        self.checked_branches: set[tuple] = set()
+
+        # difficulty attr cache stats.
+        self.hits = 0
+        self.misses = 0
+
+    def _declare_api(self) -> None:
+        """Declare the signatures of the parts of ezpp we use."""
+        lib = self.lib
+
+        lib.ezpp_new.argtypes = []
+        lib.ezpp_new.restype = ctypes.c_void_p
+        lib.ezpp_free.argtypes = [ctypes.c_void_p]
+        lib.ezpp_free.restype = None
+        lib.ezpp.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+        lib.ezpp.restype = ctypes.c_int
+
+        if hasattr(lib, 'oppai_version'):
+            lib.oppai_version.argtypes = [ctypes.POINTER(ctypes.c_int)] * 3
+            lib.oppai_version.restype = None
+
+        for setter, c_type in (
+            ('autocalc', ctypes.c_int),
+            ('mode_override', ctypes.c_int),
+            ('mods', ctypes.c_int),
+            ('combo', ctypes.c_int),
+            ('nmiss', ctypes.c_int),
+            ('accuracy_percent', ctypes.c_float)
+        ):
+            func = getattr(lib, f'ezpp_set_{setter}')
+            func.argtypes = [ctypes.c_void_p, c_type]
+            func.restype = None
+
+        for getter, c_type in (
+            ('pp', ctypes.c_float),
+            ('stars', ctypes.c_float),
+            ('aim_stars', ctypes.c_float),
+            ('speed_stars', ctypes.c_float),
+            ('ar', ctypes.c_float),
+            ('od', ctypes.c_float),
+            ('max_combo', ctypes.c_int),
+            ('nobjects', ctypes.c_int),
+            ('ncircles', ctypes.c_int),
+            ('nsliders', ctypes.c_int)
+        ):
+            func = getattr(lib, f'ezpp_{getter}')
+            func.argtypes = [ctypes.c_void_p]
+            func.restype = c_type
+
+    def _check_version(self) -> bool:
+        """Check whether oppai-ng's version matches our formula port."""
+        major, minor, patch = (ctypes.c_int(), ctypes.c_int(), ctypes.c_int())
+
+        try:
+            self.lib.oppai_version(ctypes.byref(major), ctypes.byref(minor),
+                                   ctypes.byref(patch))
+        except AttributeError:
+            major.value = -1 # very old, or not oppai-ng at all?
+
+        if major.value != FORMULA_OPPAI_MAJOR:
+            log(f'oppai-ng v{major.value}.{minor.value}.{patch.value} '
+                "doesn't match our pp formula port (v"
+                f'{FORMULA_OPPAI_MAJOR}.x); not using it.', Ansi.LYELLOW)
+            return False
+
+        return True
+
+    @classmethod
+    def load(cls, max_maps: int, max_attrs: int) -> Optional['OppaiEngine']:
+        """Load the engine from oppai-ng's library, if it's been built."""
+        if not (lib_path := Path.cwd() / LIBOPPAI_PATH).exists():
+            return
+
+        try:
+            return cls(lib_path, max_maps, max_attrs)
+        except (OSError, AttributeError) as exc:
+            # built, but broken or missing the ezpp api.
+            log(f'Failed to load liboppai: {exc}', Ansi.LRED)
+
+    def _get_handle(self, path: bytes, mtime: int) -> Optional[_Handle]:
+        """Get the handle for `path`, parsing the map if needed."""
+        if handle := self.handles.get(path):
+            if handle.mtime == mtime:
+                self.handles.move_to_end(path)
+                return handle
+
+            # the file has been updated on disk.
+            self._free(path)
+
+        ez = self.lib.ezpp_new()
+        self.lib.ezpp_set_autocalc(ez, 1)
+
+        if (err_code := self.lib.ezpp(ez, path)) < 0:
+            log(f'oppai-ng: err code {err_code}.', Ansi.LRED)
+            self.lib.ezpp_free(ez)
+            return
+
+        handle = self.handles[path] = _Handle(ez, path, mtime)
+
+        if len(self.handles) > self.max_maps:
+            # free the least recently used map.
+            self._free(next(iter(self.handles)))
+
+        return handle
+
+    def _free(self, path: bytes) -> None:
+        self.lib.ezpp_free(self.handles.pop(path).ez)
+
+    def _get_attrs(self, key: tuple[bytes, int, int],
+                   mtime: int) -> Optional[DifficultyAttrs]:
+        """Get the cached difficulty attributes for `key`, if any."""
+        if (
+            (cached := self.attrs.get(key)) and
+            cached[0] == mtime
+        ):
+            self.attrs.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+
+    def _set_attrs(self, key: tuple[bytes, int, int], mtime: int,
+                   handle: _Handle) -> DifficultyAttrs:
+        """Cache the difficulty attributes currently held by `handle`."""
+        lib = self.lib
+
+        attrs = DifficultyAttrs(
+            lib.ezpp_stars(handle.ez), lib.ezpp_aim_stars(handle.ez),
+            lib.ezpp_speed_stars(handle.ez), lib.ezpp_ar(handle.ez),
+            lib.ezpp_od(handle.ez), lib.ezpp_max_combo(handle.ez),
+            lib.ezpp_nobjects(handle.ez), lib.ezpp_ncircles(handle.ez),
+            lib.ezpp_nsliders(handle.ez)
+        )
+
+        self.attrs[key] = (mtime, attrs)
+
+        if len(self.attrs) > self.max_attrs:
+            self.attrs.popitem(last=False)
+
+        return attrs
+
+    def calculate_sync(self, path: bytes, mode_vn: int,
+                       attrs_list: list[dict[str, Any]]
+                       ) -> list[tuple[float, float]]:
+        """Calculate (pp, sr) for each of `attrs_list` on the map at `path`."""
+        # NOTE: this blocks, and must only be called from a single
+        # thread; on the event loop, use `calculate` instead.
+        mtime = os.stat(path).st_mtime_ns
+        lib = self.lib
+        results = []
+
+        for attrs in attrs_list:
+            params = {
+                'mods': int(attrs.get('mods', 0)),
+                'combo': attrs.get('combo', -1), # -1 for fc
+                'nmiss': attrs.get('nmiss', 0),
+                'accuracy_percent': attrs.get('acc', 100.0)
+            }
+
+            if use_formula := (
+                self.use_formula and mode_vn == 0 and
+                not params['mods'] & UNPORTED_MODS
+            ):
+                key = (path, mode_vn, difficulty_mods(params['mods']))
+
+                if (
+                    (diff_attrs := self._get_attrs(key, mtime)) and
+                    formula_branch(diff_attrs, params['mods'], params['combo'],
+                                   params['nmiss']) in self.checked_branches
+                ):
+                    pp = std_pp(diff_attrs, params['mods'], params['combo'],
+                                params['nmiss'], params['accuracy_percent'])
+                    results.append((pp, diff_attrs.stars))
+                    continue
+
+            if not (handle := self._get_handle(path, mtime)):
+                results.append((0.0, 0.0))
+                continue
+
+            # mode must be set first, since it changes
+            # the objects which the others are based on.
+            if handle.mode != mode_vn:
+                lib.ezpp_set_mode_override(handle.ez, mode_vn)
+                handle.mode = mode_vn
+
+            # oppai changes some params itself; setting nmiss resets
+            # the accuracy, and calculating overwrites the combo (if
+            # < 0) & accuracy, so all are set again, nmiss before acc.
+            lib.ezpp_set_mods(handle.ez, params['mods'])
+            lib.ezpp_set_combo(handle.ez, params['combo'])
+            lib.ezpp_set_nmiss(handle.ez, params['nmiss'])
+            lib.ezpp_set_accuracy_percent(handle.ez, params['accuracy_percent'])
+
+            pp = lib.ezpp_pp(handle.ez)
+
+            if math.isinf(pp):
+                log(f'oppai-ng: broken map: {path.decode()} (inf pp).', Ansi.LYELLOW)
+                results.append((0.0, 0.0))
+                continue
+
+            if use_formula:
+                diff_attrs = self._set_attrs(key, mtime, handle)
+
+                formula_pp = std_pp(diff_attrs, params['mods'], params['combo'],
+                                    params['nmiss'], params['accuracy_percent'])
+
+                # oppai calculates with 32-bit floats.
+                if math.isclose(pp, formula_pp, rel_tol=1e-3, abs_tol=1e-2):
+                    self.checked_branches.add(formula_branch(
+                        diff_attrs, params['mods'],
+                        params['combo'], params['nmiss']
+                    ))
+                else:
+                    log('pp formula disagrees with oppai-ng ({:.2f}pp vs {:.2f}pp); '
+                        'disabling the difficulty attribute cache.'.format(
+                            formula_pp, pp), Ansi.LRED)
+                    self.use_formula = False
+                    self.attrs.clear()
+
+            results.append((pp, lib.ezpp_stars(handle.ez)))
+
+        return results
+
+    def formula_covers(self, mode_vn: int, mods: int) -> bool:
+        """Return whether the formula can serve scores of `mode_vn` & `mods`."""
+        return self.use_formula and mode_vn == 0 and not mods & UNPORTED_MODS
+
+    def calculate_grid_sync(self, path: bytes, mode_vn: int,
+                            mods_list: list[int], accs: list[float],
+                            nmisses: list[int], combos: list[int]
+                            ) -> list[tuple[np.ndarray, float]]:
+        """Calculate a pp grid ([acc][nmiss][combo]) & sr for each of `mods_list`.
+
+        Raises `ValueError` if more than `GRID_MAX_FALLBACK` scores
+        would have to go through oppai, rather than the formula.
+        """
+        # NOTE: this blocks, see `calculate_sync`.
+        acc_grid, nmiss_grid, combo_grid = np.meshgrid(
+            np.asarray(accs, dtype=np.float64),
+            np.asarray(nmisses, dtype=np.int64),
+            np.asarray(combos, dtype=np.int64),
+            indexing = 'ij'
+        )
+
+        results = []
+        num_fallback = 0
+
+        # a single (nmiss, combo) through each branch of the
+        # formula that the grid takes (other than for mods).
+        samples = list({(nmiss > 0, combo >= 0): (nmiss, combo)
+                        for nmiss in nmisses for combo in combos}.values())
+
+        for mods in mods_list:
+            if self.formula_covers(mode_vn, mods):
+                key = (path, mode_vn, difficulty_mods(mods))
+
+                # calculate the samples to parse the map, populate the
+                # attrs for these mods, & check any unchecked branches.
+                self.calculate_sync(path, mode_vn, [
+                    {'mods': mods, 'nmiss': nmiss, 'combo': combo}
+                    for nmiss, combo in samples
+                ])
+
+                if (
+                    self.use_formula and
+                    (cached := self.attrs.get(key)) and
+                    all(formula_branch(cached[1], mods, combo, nmiss)
+                        in self.checked_branches
+                        for nmiss, combo in samples)
+                ):
+                    diff_attrs = cached[1]
+                    # the whole grid in one pass of the formula.
+                    pp_grid = std_pp_grid(diff_attrs, mods, combo_grid,
+                                          nmiss_grid, acc_grid)
+                    results.append((pp_grid, diff_attrs.stars))
+                    continue
+
+            # no formula for this mode/mods (or the map is broken);
+            # fall back to oppai for each score, reusing the handle.
+            num_fallback += acc_grid.size
+
+            if num_fallback > GRID_MAX_FALLBACK:
+                raise ValueError('too many scores for oppai')
+
+            scores = self.calculate_sync(path, mode_vn, [
+                {'mods': mods, 'acc': float(acc),
+                 'nmiss': int(nmiss), 'combo': int(combo)}
+                for acc, nmiss, combo in zip(acc_grid.flat,
+                                             nmiss_grid.flat,
+                                             combo_grid.flat)
+            ])
+
+            pp_grid = np.array([pp for pp, _ in scores]).reshape(acc_grid.shape)
+            results.append((pp_grid, scores[0][1] if scores else 0.0))
+
+        return results
+
+    async def calculate_grid(self, path: Path, mode_vn: int,
+                             mods_list: list[int], accs: list[float],
+                             nmisses: list[int], combos: list[int]
+                             ) -> list[tuple[np.ndarray, float]]:
+        """Calculate a pp grid ([acc][nmiss][combo]) & sr for each of `mods_list`."""
+        started_at = time.time()
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            self.executor, self.calculate_grid_sync,
+            str(path).encode(), mode_vn, mods_list, accs, nmisses, combos
+        )
+
+        if glob.datadog:
+            glob.datadog.histogram('gulag.oppai_grid_time', time.time() - started_at)
+
+        return results
+
+    async def calculate(self, path: Path, mode_vn: int,
+                        attrs_list: list[dict[str, Any]]
+                        ) -> list[tuple[float, float]]:
+        """Calculate (pp, sr) for each of `attrs_list` on the map at `path`."""
+        started_at = time.time()
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            self.executor, self.calculate_sync,
+            str(path).encode(), mode_vn, attrs_list
+        )
+
+        if glob.datadog:
+            glob.datadog.histogram('gulag.oppai_time', time.time() - started_at)
+            glob.datadog.gauge('gulag.oppai_cached_maps', len(self.handles))
+            glob.datadog.gauge('gulag.oppai_cached_attrs', len(self.attrs))
+            glob.datadog.gauge('gulag.oppai_attrs_hit_rate', self.hit_rate)
+
+        return results
+
+    @property
+    def hit_rate(self) -> float:
+        """The hit rate of the difficulty attribute cache."""
+        if not (total := self.hits + self.misses):
+            return 0.0
+
+        return self.hits / total
+
+    @property
+    def attrs_size(self) -> int:
+        """The approximate memory used by the difficulty attribute cache."""
+        if not self.attrs:
+            return 0
+
+        # all entries are the same shape, so measure one.
+        key, (mtime, attrs) = next(iter(self.attrs.items()))
+        entry_size = sum(map(sys.getsizeof, (key, mtime, attrs, *attrs)))
+
+        return len(self.attrs) * entry_size
+
+    def _free_all(self) -> None:
+        for path in list(self.handles):
+            self._free(path)
+
+    def shutdown(self) -> None:
+        """Free all handles & shutdown the thread."""
+        # queued behind any calculations still running.
+        self.executor.submit(self._free_all)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# the pp calculation done within worker processes; these are used
+# for mania (maniera is pure python, and would otherwise block the
+# event loop), and by the score recalculator (for all modes).
+
+import os
+from collections import OrderedDict
+from typing import Any
+from typing import Optional
+
+from maniera.calculator import Maniera
+
+from constants.mods import Mods
+from utils.oppai import OppaiEngine
+
+__all__ = ('init', 'calculate')
+
+# maniera's star rating only depends on the speed changing mods,
+# the rest are only applied to the (cheap) performance formula.
+MANIERA_DIFFICULTY_MODS = Mods.DOUBLETIME | Mods.HALFTIME
+
+# the state of this worker process.
+_max_maps = 0
+_max_attrs = 0
+_oppai: Optional[OppaiEngine] = None
+
+# {(path, mtime, diff_mods): calc}, in order of least to most recently used.
+_maniera_calcs: 'OrderedDict[tuple[str, int, int], Maniera]' = OrderedDict()
+
+def init(max_maps: int, max_attrs: int) -> None:
+    """Initialize the worker process."""
+    global _max_maps, _max_attrs
+    _max_maps = max_maps
+    _max_attrs = max_attrs
+
+def _calculate_mania(path: str, attrs_list: list[dict[str, Any]]
+                     ) -> list[tuple[float, float]]:
+    mtime = os.stat(path).st_mtime_ns
+    results = []
+
+    for attrs in attrs_list:
+        mods = int(attrs.get('mods', 0))
+        key = (path, mtime, mods & MANIERA_DIFFICULTY_MODS)
+
+        if calc := _maniera_calcs.get(key):
+            # already parsed & star rating calculated,
+            # only the performance formula needs to run.
+            _maniera_calcs.move_to_end(key)
+            calc.mods = mods
+            calc.score = attrs['score']
+            calc.pp = calc._calculatePP()
+        else:
+            calc = Maniera(path, mods, attrs['score'])
+            calc.calculate()
+
+            _maniera_calcs[key] = calc
+
+            if len(_maniera_calcs) > _max_maps:
+                _maniera_calcs.popitem(last=False)
+
+        results.append((calc.pp, calc.sr))
+
+    return results
+
+def calculate(path: str, mode_vn: int, attrs_list: list[dict[str, Any]]
+              ) -> list[tuple[float, float]]:
+    """Calculate (pp, sr) for each of `attrs_list` on the map at `path`."""
+    global _oppai
+
+    if mode_vn in (0, 1):
+        if not _oppai:
+            # only loaded once it's actually needed.
+            if not (_oppai := OppaiEngine.load(_max_maps, _max_attrs)):
+                return [(0.0, 0.0)] * len(attrs_list)
+
+        return _oppai.calculate_sync(path.encode(), mode_vn, attrs_list)
+    elif mode_vn == 3:
+        return _calculate_mania(path, attrs_list)
+    else: # TODO: ctb support
+        return [(0.0, 0.0)] * len(attrs_list)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from constants.mods import Mods
+
+__all__ = ('DifficultyAttrs', 'acc_round', 'std_pp', 'std_pp_grid')
+
+# a python port of oppai-ng's osu!std ppv2 performance formula; given
+# a map's difficulty attributes (which only depend on the map & its
+# difficulty changing mods), this is very cheap to calculate compared
+# to parsing the map & calculating its difficulty again.
+
+# NOTE: this is the formula of oppai-ng 3.x, from before the 2021 pp
+# changes (oppai-ng 4.0.0+); utils/oppai.py won't use it with other
+# versions (see FORMULA_OPPAI_MAJOR), & checks each branch against oppai.
+
+class DifficultyAttrs(NamedTuple):
+    """A map's difficulty attributes (for some mode & mods)."""
+    stars: float
+    aim: float
+    speed: float
+    ar: float # with mods applied
+    od: float # with mods applied
+    max_combo: int
+    nobjects: int
+    ncircles: int
+    nsliders: int
+
+def _acc_calc(n300: int, n100: int, n50: int, nmiss: int) -> float:
+    if (total_hits := n300 + n100 + n50 + nmiss) <= 0:
+        return 0.0
+
+    return (n50 * 50 + n100 * 100 + n300 * 300) / (total_hits * 300)
+
+def acc_round(acc: float, nobjects: int,
+              nmiss: int) -> tuple[int, int, int]:
+    """Return (n300, n100, n50) closest to `acc` percent."""
+    nmiss = min(nobjects, nmiss)
+    max300 = nobjects - nmiss
+    max_acc = _acc_calc(max300, 0, 0, nmiss) * 100
+    acc = max(0.0, min(max_acc, acc))
+
+    n50 = 0
+    n100 = math.floor(-3 * ((acc * 0.01 - 1) * nobjects + nmiss) * 0.5 + 0.5)
+
+    if n100 > nobjects - nmiss:
+        # acc lower than all 100s, use 50s.
+        n100 = 0
+        n50 = math.floor(-6 * ((acc * 0.01 - 1) * nobjects + nmiss) * 0.2 + 0.5)
+        n50 = min(max300, n50)
+    else:
+        n100 = min(max300, n100)
+
+    n300 = nobjects - n100 - n50 - nmiss
+    return n300, n100, n50
+
+def _base_pp(stars: float) -> float:
+    return (5 * max(1, stars / 0.0675) - 4) ** 3 / 100000
+
+def std_pp(attrs: DifficultyAttrs, mods: int, combo: int,
+           nmiss: int, acc: float) -> float:
+    """Calculate osu!std pp for a score on a map with `attrs`."""
+    nobjects = attrs.nobjects
+    nspinners = nobjects - attrs.nsliders - attrs.ncircles
+
+    max_combo = max(1, attrs.max_combo)
+    if combo < 0:
+        combo = max_combo
+
+    n300, n100, n50 = acc_round(acc, nobjects, nmiss)
+
+    accuracy = _acc_calc(n300, n100, n50, nmiss)
+    # scorev1 ignores sliders & spinners.
+    real_acc = _acc_calc(max(0, n300 - attrs.nsliders - nspinners),
+                         n100, n50, nmiss)
+
+    nobjects_over_2k = nobjects / 2000
+    length_bonus = 0.95 + 0.4 * min(1, nobjects_over_2k)
+    if nobjects > 2000:
+        length_bonus += math.log10(nobjects_over_2k) * 0.5
+
+    miss_penalty = 0.97 ** nmiss
+    combo_break = combo ** 0.8 / max_combo ** 0.8
+
+    ar_bonus = 1.0
+    if attrs.ar > 10.33:
+        ar_bonus += 0.3 * (attrs.ar - 10.33)
+    elif attrs.ar < 8:
+        ar_bonus += 0.01 * (8 - attrs.ar)
+
+    hd_bonus = 1.0
+    if mods & Mods.HIDDEN:
+        hd_bonus += 0.04 * (12 - attrs.ar)
+
+    # aim
+    aim = (_base_pp(attrs.aim) * length_bonus * miss_penalty *
+           combo_break * ar_bonus * hd_bonus)
+
+    if mods & Mods.FLASHLIGHT:
+        fl_bonus = 1 + 0.35 * min(1, nobjects / 200)
+        if nobjects > 200:
+            fl_bonus += 0.3 * min(1, (nobjects - 200) / 300)
+        if nobjects > 500:
+            fl_bonus += (nobjects - 500) / 1200
+        aim *= fl_bonus
+
+    od_squared = attrs.od ** 2
+    aim *= (0.5 + accuracy / 2) * (0.98 + od_squared / 2500)
+
+    # speed
+    speed = (_base_pp(attrs.speed) * length_bonus *
+             miss_penalty * combo_break * hd_bonus)
+
+    if attrs.ar > 10.33:
+        speed *= ar_bonus
+
+    speed *= (0.02 + accuracy) * (0.96 + od_squared / 1600)
+
+    # acc
+    acc_pp = 1.52163 ** attrs.od * real_acc ** 24 * 2.83
+    acc_pp *= min(1.15, (attrs.ncircles / 1000) ** 0.3)
+
+    if mods & Mods.HIDDEN:
+        acc_pp *= 1.08
+    if mods & Mods.FLASHLIGHT:
+        acc_pp *= 1.02
+
+    final_multiplier = 1.12
+    if mods & Mods.NOFAIL:
+        final_multiplier *= 0.9
+    if mods & Mods.SPUNOUT:
+        final_multiplier *= 0.95
+
+    return (
+        aim ** 1.1 + speed ** 1.1 + acc_pp ** 1.1
+    ) ** (1 / 1.1) * final_multiplier
+
+def _acc_calc_grid(n300: np.ndarray, n100: np.ndarray,
+                   n50: np.ndarray, nmiss: np.ndarray) -> np.ndarray:
+    total_hits = n300 + n100 + n50 + nmiss
+    return np.where(
+        total_hits > 0,
+        (n50 * 50 + n100 * 100 + n300 * 300) / (np.maximum(total_hits, 1) * 300),
+        0.0
+    )
+
+def std_pp_grid(attrs: DifficultyAttrs, mods: int, combo: np.ndarray,
+                nmiss: np.ndarray, acc: np.ndarray) -> np.ndarray:
+    """Calculate osu!std pp for many scores on a map with `attrs` at once.
+
+    `combo`, `nmiss` & `acc` are broadcast together; this is the same
+    formula as `std_pp`, working over arrays rather than a single score.
+    """
+    nobjects = attrs.nobjects
+    nspinners = nobjects - attrs.nsliders - attrs.ncircles
+
+    max_combo = max(1, attrs.max_combo)
+    combo, nmiss, acc = np.broadcast_arrays(combo, nmiss, acc)
+    combo = np.where(combo < 0, max_combo, combo)
+
+    # acc_round
+    round_nmiss = np.minimum(nobjects, nmiss)
+    max300 = nobjects - round_nmiss
+    max_acc = _acc_calc_grid(max300, 0, 0, round_nmiss) * 100
+    acc = np.maximum(0.0, np.minimum(max_acc, acc))
+
+    n100 = np.floor(-3 * ((acc * 0.01 - 1) * nobjects + round_nmiss) * 0.5 + 0.5)
+    n50 = np.floor(-6 * ((acc * 0.01 - 1) * nobjects + round_nmiss) * 0.2 + 0.5)
+
+    # acc lower than all 100s, use 50s.
+    use_50s = n100 > max300
+    n50 = np.where(use_50s, np.minimum(max300, n50), 0)
+    n100 = np.where(use_50s, 0, np.minimum(max300, n100))
+    n300 = nobjects - n100 - n50 - round_nmiss
+
+    accuracy = _acc_calc_grid(n300, n100, n50, nmiss)
+    # scorev1 ignores sliders & spinners.
+    real_acc = _acc_calc_grid(np.maximum(0, n300 - attrs.nsliders - nspinners),
+                              n100, n50, nmiss)
+
+    # everything from here which doesn't depend
+    # on the score is just calculated once.
+    nobjects_over_2k = nobjects / 2000
+    length_bonus = 0.95 + 0.4 * min(1, nobjects_over_2k)
+    if nobjects > 2000:
+        length_bonus += math.log10(nobjects_over_2k) * 0.5
+
+    miss_penalty = 0.97 ** nmiss
+    combo_break = combo ** 0.8 / max_combo ** 0.8
+
+    ar_bonus = 1.0
+    if attrs.ar > 10.33:
+        ar_bonus += 0.3 * (attrs.ar - 10.33)
+    elif attrs.ar < 8:
+        ar_bonus += 0.01 * (8 - attrs.ar)
+
+    hd_bonus = 1.0
+    if mods & Mods.HIDDEN:
+        hd_bonus += 0.04 * (12 - attrs.ar)
+
+    # aim
+    aim_scale = _base_pp(attrs.aim) * length_bonus * ar_bonus * hd_bonus
+
+    if mods & Mods.FLASHLIGHT:
+        fl_bonus = 1 + 0.35 * min(1, nobjects / 200)
+        if nobjects > 200:
+            fl_bonus += 0.3 * min(1, (nobjects - 200) / 300)
+        if nobjects > 500:
+            fl_bonus += (nobjects - 500) / 1200
+        aim_scale *= fl_bonus
+
+    od_squared = attrs.od ** 2
+    aim = (aim_scale * miss_penalty * combo_break *
+           (0.5 + accuracy / 2) * (0.98 + od_squared / 2500))
+
+    # speed
+    speed_scale = _base_pp(attrs.speed) * length_bonus * hd_bonus
+
+    if attrs.ar > 10.33:
+        speed_scale *= ar_bonus
+
+    speed = (speed_scale * miss_penalty * combo_break *
+             (0.02 + accuracy) * (0.96 + od_squared / 1600))
+
+    # acc
+    acc_scale = 1.52163 ** attrs.od * 2.83
+    acc_scale *= min(1.15, (attrs.ncircles / 1000) ** 0.3)
+
+    if mods & Mods.HIDDEN:
+        acc_scale *= 1.08
+    if mods & Mods.FLASHLIGHT:
+        acc_scale *= 1.02
+
+    acc_pp = acc_scale * real_acc ** 24
+
+    final_multiplier = 1.12
+    if mods & Mods.NOFAIL:
+        final_multiplier *= 0.9
+    if mods & Mods.SPUNOUT:
+        final_multiplier *= 0.95
+
+    return (
+        aim ** 1.1 + speed ** 1.1 + acc_pp ** 1.1
+    ) ** (1 / 1.1) * final_multiplier
@@ -2,17 +2,27 @@
 
 import asyncio
 import math
+import multiprocessing
+import os
 import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any
+from typing import AsyncIterator
+from typing import Optional
 
-import aiohttp
+import orjson
 from cmyui import Ansi
 from cmyui import log
-from maniera.calculator import Maniera
 
-__all__ = ('PPCalculator',)
+from constants.gamemodes import GameMode
+from objects import glob
+from objects.rankings import weighted_stats
+from utils import pp_worker
+from utils.misc import executemany
 
-BEATMAPS_PATH = Path.cwd() / '.data/osu'
+__all__ = ('PPCalculator', 'ScoreRecalculator')
 
 class PPCalculator:
     """Asynchronously wraps the process of calculating difficulty in osu!."""
@@ -31,33 +41,16 @@ class PPCalculator:
         self.pp_attrs = pp_attrs
 
     @staticmethod
-    async def get_from_osuapi(map_id: int, dest_path: Path) -> bool:
-        url = f'https://old.ppy.sh/osu/{map_id}'
+    async def get_file(map_id: int) -> Optional[Path]:
+        """Get the path of the map's file, downloading it if needed."""
+        return await glob.beatmap_files.get_path(map_id)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as r:
-                if not r or r.status != 200:
-                    log(f'Could not find map by id {map_id}!', Ansi.LRED)
-                    return False
-
-                content = await r.read()
-
-        dest_path.write_bytes(content)
-        return True
-
-    @classmethod
-    async def get_file(cls, map_id: int) -> None:
-        path = BEATMAPS_PATH / f'{map_id}.osu'
-
-        # check if file exists on disk already
-        if not path.exists():
-            # not found on disk, try osu!api
-            if not await cls.get_from_osuapi(map_id, path):
-                # failed to find the map
-                return
-
-        # map is now on disk, return filepath.
-        return path
+    @staticmethod
+    def invalidate(map_id: int) -> None:
+        """Remove a map's file from disk, after it's been updated."""
+        # the pp engine's cached data is tied to the file's mtime,
+        # so it will be invalidated once the new file is fetched.
+        glob.beatmap_files.invalidate(map_id)
 
     @classmethod
     async def from_id(cls, map_id: int, **pp_attrs):
@@ -70,11 +63,16 @@ class PPCalculator:
     async def perform(self) -> tuple[float, float]:
         """Calculate pp & sr using the current state of the recalculator."""
         if self.mode_vn in (0, 1): # oppai-ng for std & taiko
-            # TODO: PLEASE rewrite this with c/py bindings,
-            # add ways to get specific stuff like aim pp
+            if glob.oppai:
+                # use the in-process engine.
+                results = await glob.oppai.calculate(
+                    self.file, self.mode_vn, [self.pp_attrs]
+                )
+                return results[0]
 
-            # for now, we'll generate a bash command and
-            # use subprocess to do the calculations (yikes).
+            # liboppai isn't built, fall back to generating
+            # a bash command & use subprocess to do the
+            # calculations (yikes).
             cmd = ['oppai-ng/oppai', self.file]
 
             if 'mods' in self.pp_attrs:
@@ -127,11 +125,320 @@ class PPCalculator:
                 log('Err: pp calculator needs score for mania.', Ansi.LRED)
                 return (0.0, 0.0)
 
-            if 'mods' in self.pp_attrs:
-                mods = int(self.pp_attrs['mods'])
-            else:
-                mods = 0
+            results = await self._calculate_mania([self.pp_attrs])
+            return results[0]
+
+    async def _calculate_mania(self, attrs_list: list[dict[str, Any]]
+                               ) -> list[tuple[float, float]]:
+        # maniera is pure python, and parses the whole
+        # map; run it in a worker process, which will
+        # also keep the parsed map for further calls.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            glob.mania_pool, pp_worker.calculate,
+            self.file, self.mode_vn, attrs_list
+        )
+
+    async def perform_many(self, attrs_list: list[dict[str, Any]]
+                           ) -> list[tuple[float, float]]:
+        """Calculate pp & sr for each of `attrs_list` on the map."""
+        attrs_list = [self.pp_attrs | attrs for attrs in attrs_list]
+
+        if self.mode_vn in (0, 1) and glob.oppai:
+            # the engine can do them all in a single call.
+            return await glob.oppai.calculate(
+                self.file, self.mode_vn, attrs_list
+            )
+
+        if self.mode_vn == 3 and all(['score' in attrs for attrs in attrs_list]):
+            # likewise with the worker processes.
+            return await self._calculate_mania(attrs_list)
+
+        results = []
+
+        for attrs in attrs_list:
+            self.pp_attrs = attrs
+            results.append(await self.perform())
+
+        return results
+
+# the vanilla modes which scores can be recalculated for.
+RECALC_MODES = (0, 1, 3)
+
+SCORE_TABLES = ('scores_vn', 'scores_rx', 'scores_ap')
+
+# where the progress of a full recalc is saved.
+CHECKPOINT_PATH = Path.cwd() / '.data/recalc.json'
+
+# the amount of maps (or players) whose scores are read from sql at once;
+# queries are paged by id, so that results are never buffered in full.
+PAGE_SIZE = 1000
+
+async def _iter_pages(table: str, after_id: int
+                      ) -> AsyncIterator[tuple[int, int]]:
+    """Yield (after, last) ranges of ids in `table`, `PAGE_SIZE` at a time."""
+    while True:
+        last_id = (await glob.db.fetch(
+            'SELECT MAX(id) FROM ('
+            f'SELECT id FROM {table} WHERE id > %s '
+            'ORDER BY id LIMIT %s'
+            ') page',
+            [after_id, PAGE_SIZE], _dict=False
+        ))[0]
+
+        if last_id is None:
+            break
+
+        yield after_id, last_id
+        after_id = last_id
+
+def _recalc_scores(path: str, scores: list[tuple]) -> list[tuple[float, int]]:
+    """Recalculate the pp of `scores` on a map (in a worker process)."""
+    results = []
+
+    for mode_vn in RECALC_MODES:
+        # scores are sorted by (mode, mods), so that the
+        # map's difficulty is calculated once per mods.
+        mode_scores = [score for score in scores if score[0] == mode_vn]
+
+        if not mode_scores:
+            continue
+
+        calculated = pp_worker.calculate(path, mode_vn, [
+            {'mods': mods, 'combo': combo, 'nmiss': nmiss,
+             'acc': acc, 'score': score}
+            for _, _, mods, combo, nmiss, acc, score in mode_scores
+        ])
+
+        results.extend([(pp, score[1]) for (pp, _), score
+                        in zip(calculated, mode_scores)])
+
+    return results
+
+class ScoreRecalculator:
+    """\
+    Recalculate the pp of every score on the server, then rebuild
+    each player's pp & acc from their (new) top 100 scores.
+
+    Scores are read map by map, and each map is sent off to a pool of
+    worker processes, each with their own pp engines (so liboppai
+    must be built); a map is only parsed once, and only has its
+    difficulty calculated once per mods. Results are written in
+    batches, and progress is saved to disk as they are, so that an
+    interrupted recalc may be resumed; progress stops at the first map
+    which failed, so that a resumed recalc will retry it.
+    """
+    __slots__ = ('workers', 'batch_size', 'checkpoint', 'counts', 'failed')
+
+    def __init__(self, workers: Optional[int] = None,
+                 batch_size: int = 1000) -> None:
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+
+        # {table: id of the last map completed}
+        self.checkpoint: dict[str, int] = {}
+
+        # {table: scores recalculated}
+        self.counts = dict.fromkeys(SCORE_TABLES, 0)
+
+        # {table: maps which failed to recalculate}
+        self.failed = dict.fromkeys(SCORE_TABLES, 0)
+
+    def _save_checkpoint(self) -> None:
+        CHECKPOINT_PATH.write_bytes(orjson.dumps(self.checkpoint))
+
+    async def run(self, resume: bool = True) -> dict[str, int]:
+        """Recalculate all scores, returning the amount per table."""
+        if resume and CHECKPOINT_PATH.exists():
+            self.checkpoint = orjson.loads(CHECKPOINT_PATH.read_bytes())
+            log(f'Resuming recalc from {self.checkpoint}.', Ansi.LMAGENTA)
+
+        with ProcessPoolExecutor(
+            max_workers = self.workers,
+            # the server may have other threads running,
+            # which don't mix well with forking.
+            mp_context = multiprocessing.get_context('spawn'),
+            initializer = pp_worker.init,
+            initargs = (glob.config.oppai_cached_maps,
+                        glob.config.oppai_cached_attrs)
+        ) as executor:
+            for table in SCORE_TABLES:
+                await self._recalc_table(executor, table)
+
+        await self.rebuild_stats()
+
+        if any(self.failed.values()):
+            log(f'Failed to recalc some maps ({self.failed}); '
+                'run again to resume from the first.', Ansi.LRED)
+        else:
+            # the recalc is complete, nothing to resume.
+            CHECKPOINT_PATH.unlink(missing_ok=True)
+
+        return self.counts
+
+    async def _iter_maps(self, table: str, after_id: int
+                         ) -> AsyncIterator[tuple[int, list[tuple]]]:
+        """Yield (map_id, scores) for each map in `table` after `after_id`."""
+        query = (
+            'SELECT m.id, s.mode, s.id, s.mods, '
+            's.max_combo, s.nmiss, s.acc, s.score '
+            f'FROM {table} s INNER JOIN maps m ON m.md5 = s.map_md5 '
+            'WHERE s.status = 2 AND s.mode IN %s '
+            'AND m.id > %s AND m.id <= %s '
+            'AND (s.mode != 3 OR m.mode = 3) ' # maniera has no convert support
+            'ORDER BY m.id, s.mode, s.mods'
+        )
+
+        async for first_id, last_id in _iter_pages('maps', after_id):
+            map_id = None
+            scores = []
+
+            for row in await glob.db.fetchall(
+                query, [RECALC_MODES, first_id, last_id], _dict=False
+            ):
+                if row[0] != map_id:
+                    if scores:
+                        yield map_id, scores
+
+                    map_id = row[0]
+                    scores = []
+
+                scores.append(row[1:])
+
+            if scores:
+                yield map_id, scores
+
+    async def _recalc_table(self, executor: ProcessPoolExecutor,
+                            table: str) -> None:
+        """Recalculate all scores in `table`."""
+        loop = asyncio.get_running_loop()
+
+        in_flight: dict[asyncio.Future, int] = {} # {future: map_id}
+        submitted: deque[int] = deque() # map ids, in order
+        completed: set[int] = set()
+        updates: list[tuple[float, int]] = []
+
+        async def collect(wait_all: bool) -> None:
+            if in_flight:
+                done, _ = await asyncio.wait(
+                    in_flight, return_when = (
+                        asyncio.ALL_COMPLETED if wait_all else
+                        asyncio.FIRST_COMPLETED
+                    )
+                )
+
+                for fut in done:
+                    map_id = in_flight.pop(fut)
+
+                    try:
+                        updates.extend(fut.result())
+                    except Exception as exc:
+                        # never completed, so the checkpoint
+                        # can't move past it for this run.
+                        log(f'Failed to recalc map {map_id}: {exc}', Ansi.LRED)
+                        self.failed[table] += 1
+                    else:
+                        completed.add(map_id)
+
+            if not wait_all and len(updates) < self.batch_size:
+                return
+
+            if updates:
+                await executemany(
+                    f'UPDATE {table} SET pp = %s WHERE id = %s',
+                    updates
+                )
+                self.counts[table] += len(updates)
+                updates.clear()
+
+            # everything from the completed maps is now in sql; the
+            # checkpoint can move up to the first incomplete map.
+            while submitted and submitted[0] in completed:
+                completed.remove(map_id := submitted.popleft())
+                self.checkpoint[table] = map_id
+
+            self._save_checkpoint()
+
+        async for map_id, scores in self._iter_maps(
+            table, self.checkpoint.get(table, 0)
+        ):
+            if not (path := await PPCalculator.get_file(map_id)):
+                continue
+
+            fut = loop.run_in_executor(executor, _recalc_scores,
+                                       str(path), scores)
+            in_flight[fut] = map_id
+            submitted.append(map_id)
+
+            if len(in_flight) >= self.workers * 2:
+                await collect(wait_all=False)
+
+        await collect(wait_all=True)
+
+        log(f'Recalculated {self.counts[table]} scores in {table}.', Ansi.LMAGENTA)
+
+    async def rebuild_stats(self) -> None:
+        """Rebuild every player's pp & acc from their top 100 scores."""
+        for mode in GameMode:
+            if mode.as_vanilla not in RECALC_MODES:
+                continue
+
+            query = (
+                'SELECT s.userid, s.pp, s.acc '
+                f'FROM {mode.sql_table} s '
+                'INNER JOIN maps m ON s.map_md5 = m.md5 '
+                'WHERE s.mode = %s AND s.status = 2 '
+                'AND m.status IN (1, 2) '
+                'AND s.userid > %s AND s.userid <= %s '
+                'ORDER BY s.userid, s.pp DESC'
+            )
+
+            num_updated = 0
+
+            async for first_id, last_id in _iter_pages('users', 0):
+                user_id = None
+                top_scores = []
+                updates = []
+
+                for row in await glob.db.fetchall(
+                    query, [mode.as_vanilla, first_id, last_id], _dict=False
+                ):
+                    if row[0] != user_id:
+                        if top_scores:
+                            updates.append((*weighted_stats(top_scores), user_id))
+
+                        user_id = row[0]
+                        top_scores = []
+
+                    if len(top_scores) < 100:
+                        top_scores.append(row[1:])
+
+                if top_scores:
+                    updates.append((*weighted_stats(top_scores), user_id))
+
+                for i in range(0, len(updates), self.batch_size):
+                    await executemany(
+                        'UPDATE stats SET pp_{0:sql} = %s, acc_{0:sql} = %s '
+                        'WHERE id = %s'.format(mode),
+                        updates[i:i + self.batch_size]
+                    )
+
+                # players in the page left with no ranked
+                # scores would otherwise keep their old stats.
+                if updates:
+                    await glob.db.execute(
+                        'UPDATE stats SET pp_{0:sql} = 0, acc_{0:sql} = 0 '
+                        'WHERE id > %s AND id <= %s '
+                        'AND id NOT IN %s'.format(mode),
+                        [first_id, last_id, tuple([u[-1] for u in updates])]
+                    )
+                else:
+                    await glob.db.execute(
+                        'UPDATE stats SET pp_{0:sql} = 0, acc_{0:sql} = 0 '
+                        'WHERE id > %s AND id <= %s'.format(mode),
+                        [first_id, last_id]
+                    )
+
+                num_updated += len(updates)
 
-            calc = Maniera(self.file, mods, self.pp_attrs['score'])
-            calc.calculate()
-            return (calc.pp, calc.sr)
+            log(f'Rebuilt {mode!r} stats for {num_updated} players.', Ansi.LMAGENTA)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+
+from objects import glob
+
+__all__ = ('SingleFlight',)
+
+class SingleFlight:
+    """\
+    Coalesce concurrent calls keyed by some identity (such as a map md5).
+
+    While a call for a key is in flight, any other callers with the same
+    key will wait on it & share its result, rather than making their own.
+
+    The call runs as its own task, so a caller being cancelled will not
+    cancel it for anyone else waiting on it.
+
+    Metrics are sent to datadog under `gulag.{name}_*`.
+    """
+    __slots__ = ('name', 'calls')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+        # {key: task}; removed once the task is done.
+        self.calls: dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable,
+                  func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run `func(*args)`, or wait on the call already in flight for `key`."""
+        if task := self.calls.get(key):
+            if glob.datadog:
+                glob.datadog.increment(f'gulag.{self.name}_coalesced')
+        else:
+            task = self.calls[key] = asyncio.create_task(func(*args))
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+
+            if glob.datadog:
+                glob.datadog.increment(f'gulag.{self.name}_calls')
+
+        return await asyncio.shield(task)
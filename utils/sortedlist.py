@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import Union
+
+__all__ = ('SortedList',)
+
+class SortedList:
+    """\
+    A sorted list, split into blocks of ~`load` values each.
+
+    Inserting or removing a value only shifts a single block, and the
+    lengths of the blocks are kept in a fenwick tree, so positional
+    lookups (bisection, indexing) are also O(log n), rather than
+    the O(n) of keeping a single sorted list.
+    """
+    __slots__ = ('blocks', 'maxes', 'tree', 'size')
+    load = 512
+
+    def __init__(self, values: Iterable[Any] = ()) -> None:
+        values = sorted(values)
+        load = self.load
+
+        self.blocks: list[list[Any]] = [values[i:i + load] for i
+                                        in range(0, len(values), load)]
+        self.maxes: list[Any] = [block[-1] for block in self.blocks]
+        self.size = len(values)
+        self._build_tree()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self.blocks:
+            yield from block
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+
+            if step != 1:
+                return list(self)[index]
+
+            return self._range(start, stop)
+
+        if index < 0:
+            index += self.size
+
+        if not 0 <= index < self.size:
+            raise IndexError('index out of range')
+
+        i, j = self._locate(index)
+        return self.blocks[i][j]
+
+    def _build_tree(self) -> None:
+        """Rebuild the fenwick tree of the blocks' lengths."""
+        tree = [0] + [len(block) for block in self.blocks]
+
+        for i in range(1, len(tree)):
+            if (parent := i + (i & -i)) < len(tree):
+                tree[parent] += tree[i]
+
+        self.tree = tree
+
+    def _tree_add(self, i: int, delta: int) -> None:
+        """Add `delta` to the length of block `i`, in the tree."""
+        tree = self.tree
+        i += 1
+
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """Return the total length of the first `i` blocks."""
+        tree = self.tree
+        total = 0
+
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+
+        return total
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        """Return the (block, position in block) of `index`."""
+        tree = self.tree
+        i = 0
+        step = 1 << (len(tree) - 1).bit_length()
+
+        while step:
+            if i + step < len(tree) and tree[i + step] <= index:
+                i += step
+                index -= tree[i]
+
+            step >>= 1
+
+        return i, index
+
+    def _range(self, start: int, stop: int) -> list[Any]:
+        """Return the values from `start` to `stop`."""
+        if start >= stop:
+            return []
+
+        i, j = self._locate(start)
+        values = []
+        remaining = stop - start
+
+        while remaining > 0:
+            block = self.blocks[i][j:j + remaining]
+            values.extend(block)
+            remaining -= len(block)
+            i, j = i + 1, 0
+
+        return values
+
+    def add(self, value: Any) -> None:
+        """Insert `value` in sorted order."""
+        self.size += 1
+
+        if not self.blocks:
+            self.blocks.append([value])
+            self.maxes.append(value)
+            self._build_tree()
+            return
+
+        if (i := bisect.bisect_left(self.maxes, value)) == len(self.maxes):
+            # larger than everything; append to the last block.
+            i -= 1
+            self.blocks[i].append(value)
+            self.maxes[i] = value
+        else:
+            bisect.insort(self.blocks[i], value)
+
+        if len(block := self.blocks[i]) > self.load * 2:
+            # split the block in half.
+            self.blocks[i:i + 1] = [block[:self.load], block[self.load:]]
+            self.maxes.insert(i, block[self.load - 1])
+            self._build_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, value: Any) -> None:
+        """Remove `value`; raises ValueError if it's not present."""
+        i = bisect.bisect_left(self.maxes, value)
+
+        if i == len(self.maxes):
+            raise ValueError(f'{value!r} not in list')
+
+        block = self.blocks[i]
+        j = bisect.bisect_left(block, value)
+
+        if block[j] != value:
+            raise ValueError(f'{value!r} not in list')
+
+        del block[j]
+        self.size -= 1
+
+        if not block:
+            del self.blocks[i]
+            del self.maxes[i]
+            self._build_tree()
+        else:
+            self.maxes[i] = block[-1]
+            self._tree_add(i, -1)
+
+    def bisect_left(self, value: Any) -> int:
+        """Return the index `value` would be inserted at (before equal values)."""
+        if (i := bisect.bisect_left(self.maxes, value)) == len(self.maxes):
+            return self.size
+
+        return self._prefix(i) + bisect.bisect_left(self.blocks[i], value)